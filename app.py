@@ -1,78 +1,121 @@
 import os
+import sys
 import json
-import zipfile
-from flask import Flask, request, jsonify, render_template, send_file
+import threading
+from flask import Flask, Response, request, jsonify, render_template
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.formparser import parse_form_data
+from syntax_registry import TemplateRegistry
+import codegen
+import symbolic_ir
+from transpile_pool import TranspilePool, render_languages
+from result_store import ResultStore, stream_zip
+from transpile_cache import TranspileCache, input_digest
+from batch import BatchError, close_uploads, collect_inputs, stream_records
 
 app = Flask(__name__, template_folder="templates")
 
 UPLOAD_DIR = "usl_web_uploads"
-OUTPUT_DIR = "usl_outputs"
-SYNTAX_FILE = "syntax_templates_fully_extended.json"
-REFERENCE_FILE = "usl_symbol_reference_i18n_extended.json"
-TRANSLATIONS_FILE = "translations_extended.json"
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SYNTAX_FILE = os.path.join(BASE_DIR, "syntax_templates_fully_extended.json")
+REFERENCE_FILE = os.path.join(BASE_DIR, "usl_symbol_reference_i18n_extended.json")
+TRANSLATIONS_FILE = os.path.join(BASE_DIR, "translations_extended.json")
+# How /process spreads languages over workers: USL_POOL is serial, thread or
+# process, and USL_POOL_SIZE the number of workers (default: one per CPU)
+POOL_BACKEND = os.environ.get("USL_POOL", "process")
+POOL_SIZE = int(os.environ.get("USL_POOL_SIZE", "0")) or None
+# Results of /process stay downloadable, in memory, for RESULT_MAX_AGE
+# seconds; beyond RESULT_LIMIT results the oldest are dropped early.
+# ZIP_LEVEL is the DEFLATE level of downloads, 0 for no compression.
+RESULT_LIMIT = int(os.environ.get("USL_RESULT_LIMIT", "100"))
+RESULT_MAX_AGE = int(os.environ.get("USL_RESULT_MAX_AGE", "3600"))
+ZIP_LEVEL = int(os.environ.get("USL_ZIP_LEVEL", "6"))
+if not 0 <= ZIP_LEVEL <= 9:
+    raise ValueError(f"USL_ZIP_LEVEL must be 0 to 9, not {ZIP_LEVEL}")
+# Rendered outputs are cached by input, language and template version: up
+# to USL_CACHE_SIZE_MB in memory, plus USL_TRANSPILE_CACHE_DIR on disk if set
+CACHE_SIZE = int(os.environ.get("USL_CACHE_SIZE_MB", "64")) * 1024 * 1024
+CACHE_DIR = os.environ.get("USL_TRANSPILE_CACHE_DIR") or None
+# Also keep results in USL_RESULT_DIR, if set, so that a download reaching
+# another worker process than its /process request still finds them
+RESULT_DIR = os.environ.get("USL_RESULT_DIR") or None
+# Request bodies over USL_MAX_UPLOAD_MB are refused with 413 before they
+# are read, and at most USL_MAX_PENDING /process requests run at once in a
+# process; more are turned away with 503 instead of queueing without bound
+MAX_UPLOAD = int(float(os.environ.get("USL_MAX_UPLOAD_MB", "2")) * 1024 * 1024)
+MAX_PENDING = int(os.environ.get("USL_MAX_PENDING", "32"))
+# A /batch request may be up to USL_MAX_BATCH_MB, each file in it up to
+# USL_MAX_UPLOAD_MB
+MAX_BATCH = int(float(os.environ.get("USL_MAX_BATCH_MB", "64")) * 1024 * 1024)
+
+def too_large_message(limit):
+    return f"Upload too large; the limit is {limit // 1024} KB."
+
+TOO_LARGE = too_large_message(MAX_UPLOAD)
+BUSY = "Server busy, try again shortly."
+NOT_UTF8 = "The uploaded file is not UTF-8 text."
+
+app.config["MAX_CONTENT_LENGTH"] = MAX_UPLOAD
+app.config["MAX_FORM_MEMORY_SIZE"] = MAX_UPLOAD  # usl_code is a form field, not a file
 
 os.makedirs(UPLOAD_DIR, exist_ok=True)
-os.makedirs(OUTPUT_DIR, exist_ok=True)
-
-def load_syntax():
-    with open(SYNTAX_FILE, "r", encoding="utf-8") as f:
-        return json.load(f)
-
-def parse_usl_lines(lines, lang):
-    matched, fallback = [], []
-    for line in lines:
-        line = line.strip()
-        if line.startswith(f"Symbolic[{lang}]"):
-            matched.append(line.split("]:", 1)[-1].strip())
-        elif line.startswith("Symbolic:"):
-            fallback.append(line.split(":", 1)[-1].strip())
-    return matched if matched else fallback
-
-def generate_safe(template, *values):
-    try:
-        needed = template.count("{}")
-        return template.format(*([*values] * needed)[:needed])
-    except:
-        return "// Invalid template"
-
-def transpile(lines, lang, syntax):
-    struct = syntax.get(lang, {}).get("structure", {})
-    comment = struct.get("comment", "# {}")
-    exts = syntax.get(lang, {}).get("file_extensions", [])
-    ext = exts[0] if exts else lang[:3]
-    filename = f"{lang}.{ext}"
-    output_path = os.path.join(OUTPUT_DIR, filename)
-    parsed = parse_usl_lines(lines, lang)
-
-    with open(output_path, "w", encoding="utf-8") as f:
-        f.write(comment.format(f"This is {lang} syntax") + "\n")
-        for symbolic in parsed:
-            try:
-                if "print(" in symbolic:
-                    value = symbolic.split("print(", 1)[1].split(")", 1)[0]
-                    f.write(generate_safe(struct.get("print", "{}"), value) + "\n")
-                elif "let " in symbolic and "=" in symbolic:
-                    assign = symbolic.split("let ", 1)[1]
-                    left, right = assign.split("=", 1)
-                    f.write(generate_safe(struct.get("assign", "{} = {}"), left.strip(), right.strip()) + "\n")
-                elif symbolic.startswith("if "):
-                    f.write(generate_safe(struct.get("if", "if {}:\n    {}"), symbolic[3:], "pass") + "\n")
-                elif symbolic.startswith("function "):
-                    head = symbolic.split("function", 1)[-1].strip()
-                    if "(" in head:
-                        name, args = head.split("(", 1)
-                        f.write(generate_safe(struct.get("function", "def {}({}):\n    {}"), name.strip(), args.rstrip(")"), "pass") + "\n")
-                    else:
-                        f.write(comment.format("Invalid function format: " + symbolic) + "\n")
-                elif symbolic.startswith("return "):
-                    f.write(generate_safe(struct.get("return", "return {}"), symbolic[7:].strip()) + "\n")
-                elif symbolic.startswith("comment "):
-                    f.write(generate_safe(struct.get("comment", "# {}"), symbolic[8:].strip().strip('"')) + "\n")
-                else:
-                    f.write(comment.format("Unrecognized: " + symbolic) + "\n")
-            except Exception as e:
-                f.write(comment.format(f"Error: {e} in line: {symbolic}") + "\n")
-    return filename
+
+# Loaded once and compiled; reloaded when the file changes on disk
+syntax_registry = TemplateRegistry(SYNTAX_FILE)
+transpile_pool = TranspilePool(SYNTAX_FILE, POOL_BACKEND, POOL_SIZE)
+result_store = ResultStore(RESULT_LIMIT, RESULT_MAX_AGE, RESULT_DIR)
+transpile_cache = TranspileCache(CACHE_SIZE, CACHE_DIR,
+                                 current_version=lambda: syntax_registry.current().version)
+process_slots = threading.BoundedSemaphore(MAX_PENDING)
+
+def build_program(lines):
+    # Input written as `Symbolic:` lines keeps its line-by-line format;
+    # anything else is USL source, transpiled from its syntax tree
+    if not any(line.strip() for line in lines) or any(
+            line.lstrip().startswith("Symbolic") for line in lines):
+        return symbolic_ir.build_program(lines)
+    return codegen.build_program(lines)
+
+def transpile(program, languages, syntax):
+    # program is the request's SymbolicProgram or CodeProgram, built once
+    # for every language; syntax is a SyntaxTable from syntax_registry.current().
+    # Returns ({lang: source text}, {lang: error}).
+    return transpile_pool.render_all(program, languages, syntax)
+
+def transpile_cached(lines, languages, syntax):
+    # transpile, for only the languages not already in transpile_cache
+    digest = input_digest(lines)
+    outputs, missing = {}, []
+    for lang in dict.fromkeys(languages):
+        text = transpile_cache.get(digest, lang, syntax.version)
+        if text is None:
+            missing.append(lang)
+        else:
+            outputs[lang] = text
+    errors = {}
+    if missing:
+        rendered, errors = transpile(build_program(lines), missing, syntax)
+        for lang, text in rendered.items():
+            transpile_cache.put(digest, lang, syntax.version, text)
+        outputs.update(rendered)
+    return outputs, errors
+
+def transpile_each(lines, languages, syntax):
+    # Like transpile_cached, but yields (lang, text, error) for one
+    # language at a time, as soon as it is ready, in the order given
+    digest = input_digest(lines)
+    program = None
+    for lang in dict.fromkeys(languages):
+        text = transpile_cache.get(digest, lang, syntax.version)
+        if text is not None:
+            yield lang, text, None
+            continue
+        if program is None:
+            program = build_program(lines)
+        result = render_languages(program, [lang], syntax)[0]
+        if result[2] is None:
+            transpile_cache.put(digest, lang, syntax.version, result[1])
+        yield result
 
 @app.route("/")
 def index():
@@ -85,43 +128,128 @@ def symbol_reference():
 
 @app.route("/languages")
 def get_languages():
-    syntax = load_syntax()
-    return jsonify(sorted(syntax.keys()))
-
-@app.route("/process", methods=["POST"])
-def process_file_or_form():
-    syntax = load_syntax()
+    return jsonify(syntax_registry.current().names)
+
+def read_lines(form, files):
+    # The input of a /process request: the uploaded usl_file, else the
+    # usl_code field. Raises UnicodeDecodeError for a file that is not UTF-8.
+    uploaded_file = files.get("usl_file")
+    if uploaded_file:
+        return uploaded_file.read().decode().splitlines()
+    return form.get("usl_code", "").splitlines()
+
+def process(lines, languages):
+    """Transpile lines into languages and store the result; returns the /process response."""
+    syntax = syntax_registry.current()
     results = {}
-    uploaded_file = request.files.get("usl_file")
-    input_text = request.form.get("usl_code", "")
-    lines = uploaded_file.read().decode().splitlines() if uploaded_file else input_text.splitlines()
-    languages = request.form.getlist("languages")
+    outputs, errors = transpile_cached(lines, [lang for lang in languages if lang != "usl"], syntax)
 
+    files = []
     for lang in languages:
         if lang == "usl":
-            with open(os.path.join(OUTPUT_DIR, "usl_input_original.usl"), "w", encoding="utf-8") as f:
-                f.writelines(line + "\n" for line in lines)
+            if "usl" not in results:
+                files.append(("usl_input_original.usl", "".join(line + "\n" for line in lines)))
             results["usl"] = "\n".join(lines)
-        else:
-            filename = transpile(lines, lang, syntax)
-            with open(os.path.join(OUTPUT_DIR, filename), "r", encoding="utf-8") as f:
-                results[lang] = f.read()
-
-    # Build ZIP of outputs
-    zip_path = os.path.join(OUTPUT_DIR, "all_outputs.zip")
-    with zipfile.ZipFile(zip_path, "w") as zipf:
-        for f in os.listdir(OUTPUT_DIR):
-            if not f.endswith(".zip"):
-                zipf.write(os.path.join(OUTPUT_DIR, f), arcname=f)
-
-    return jsonify({ "success": True, "outputs": results })
-
-@app.route("/download")
-def download_all():
-    zip_path = os.path.join(OUTPUT_DIR, "all_outputs.zip")
-    if not os.path.exists(zip_path):
+        elif lang in outputs:
+            if lang not in results:
+                files.append((syntax.language(lang).filename, outputs[lang]))
+            results[lang] = outputs[lang]
+    result = result_store.add(files)
+
+    response = { "success": True, "result_id": result.id,
+                 "download_url": f"/download/{result.id}", "outputs": results }
+    if errors:
+        response["errors"] = errors
+    return response
+
+def failure(message, status):
+    return jsonify({"success": False, "error": message}), status
+
+@app.route("/process", methods=["POST"])
+def process_file_or_form():
+    if not process_slots.acquire(blocking=False):
+        response, status = failure(BUSY, 503)
+        response.headers["Retry-After"] = "1"
+        return response, status
+    try:
+        try:
+            lines = read_lines(request.form, request.files)
+        except UnicodeDecodeError:
+            return failure(NOT_UTF8, 400)
+        return jsonify(process(lines, request.form.getlist("languages")))
+    finally:
+        process_slots.release()
+
+def batch_response():
+    # Raises BatchError for a request that cannot be started. The form is
+    # parsed here rather than through request.files: those are closed when
+    # the view returns, before the response has streamed them.
+    _, form, files = parse_form_data(request.environ, max_form_memory_size=MAX_UPLOAD,
+                                     max_content_length=MAX_BATCH)
+    uploads = files.getlist("files")
+
+    def close():
+        close_uploads(upload for _, upload in files.items(multi=True))
+
+    try:
+        languages = form.getlist("languages")
+        if not languages or not uploads:
+            raise BatchError("Send one or more files and one or more languages.")
+        inputs = collect_inputs(uploads)
+        if not inputs:
+            raise BatchError("No .usl files found in the upload.")
+        syntax = syntax_registry.current()
+        records = stream_records(inputs, languages, syntax, MAX_UPLOAD,
+                                 lambda lines, targets: transpile_each(lines, targets, syntax))
+        response = Response(records, mimetype="application/x-ndjson")
+    except BaseException:
+        close()
+        raise
+    response.call_on_close(close)
+    return response
+
+@app.route("/batch", methods=["POST"])
+def batch():
+    # Input files in "files" (any number, .usl or .zip), the target
+    # languages in "languages"; the response streams one NDJSON record per
+    # (file, language), as described in batch.py
+    request.max_content_length = MAX_BATCH  # for the 413 message
+    if not process_slots.acquire(blocking=False):
+        response, status = failure(BUSY, 503)
+        response.headers["Retry-After"] = "1"
+        return response, status
+    try:
+        response = batch_response()
+    except BatchError as e:
+        process_slots.release()
+        return failure(str(e), 400)
+    except BaseException:
+        process_slots.release()
+        raise
+    response.call_on_close(process_slots.release)  # once the stream ends or the client leaves
+    return response
+
+@app.errorhandler(RequestEntityTooLarge)
+def too_large(e):
+    return failure(too_large_message(request.max_content_length), 413)
+
+@app.route("/cache/stats")
+def cache_stats():
+    return jsonify(transpile_cache.stats())
+
+@app.route("/download/<result_id>")
+def download_all(result_id):
+    result = result_store.get(result_id)
+    if result is None:
         return "No zip file found.", 404
-    return send_file(zip_path, as_attachment=True)
+    return Response(stream_zip(result.files, ZIP_LEVEL), mimetype="application/zip",
+                    headers={"Content-Disposition": 'attachment; filename="all_outputs.zip"'})
 
 if __name__ == "__main__":
-    app.run(debug=True, host="0.0.0.0", port=10000)
+    # The debugger only when asked for: it runs arbitrary code for whoever
+    # can reach the page. Otherwise serve as `python serve.py` would.
+    if os.environ.get("USL_DEBUG"):
+        app.run(debug=True, host="0.0.0.0", port=10000)
+    else:
+        import serve
+        serve.main(module=sys.modules[__name__])
@@ -0,0 +1,201 @@
+# asgi.py
+#
+# The web app as an ASGI application, for an async server:
+#
+#     uvicorn asgi:app --workers 4
+#
+# /process is handled natively: the body is received a chunk at a time and
+# the request is refused with 413 as soon as its Content-Length, or the
+# bytes received so far, pass app.MAX_UPLOAD, and the transpiling runs in a
+# thread so the event loop keeps serving other connections meanwhile.
+# Every other route goes through the Flask app, called in a thread as well.
+# Bodies are spooled: held in memory up to app.MAX_UPLOAD bytes, so a /batch
+# of up to app.MAX_BATCH goes to a temporary file. A client that disconnects
+# before its body is complete gets no response and runs nothing.
+#
+# As with serve.py, several worker processes want USL_POOL=serial and a
+# USL_RESULT_DIR they share.
+
+import asyncio
+import io
+import json
+import sys
+import tempfile
+from werkzeug.formparser import parse_form_data
+import app as web
+
+class ClientDisconnected(Exception):
+    """The client went away before sending its whole request body."""
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await lifespan(receive, send)
+    elif scope["type"] == "http":
+        try:
+            if scope["path"] == "/process" and scope["method"] == "POST":
+                await process(scope, receive, send)
+            else:
+                await call_wsgi(scope, receive, send)
+        except ClientDisconnected:
+            pass  # nobody to answer
+    # websockets are not served
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            web.transpile_pool.shutdown()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+async def process(scope, receive, send):
+    length = header(scope, b"content-length")
+    if length is not None and (not length.isdigit() or int(length) > web.MAX_UPLOAD):
+        await send_failure(send, web.TOO_LARGE, 413)
+        return
+    # The body is spooled before a slot is taken, so a slow upload does not
+    # hold one: the slots bound the transpiling, not the clients connected
+    body = await read_body(receive, web.MAX_UPLOAD)
+    if body is None:
+        await send_failure(send, web.TOO_LARGE, 413)
+        return
+    try:
+        if not web.process_slots.acquire(blocking=False):
+            await send_failure(send, web.BUSY, 503, [(b"retry-after", b"1")])
+            return
+        try:
+            loop = asyncio.get_running_loop()
+            try:
+                response = await loop.run_in_executor(None, process_body, scope, body)
+            except UnicodeDecodeError:
+                await send_failure(send, web.NOT_UTF8, 400)
+                return
+        finally:
+            web.process_slots.release()
+        await send_json(send, response, 200)
+    finally:
+        body.close()
+
+def process_body(scope, body):
+    # In a worker thread: parsing the form and transpiling are CPU work
+    _, form, files = parse_form_data(build_environ(scope, body), max_form_memory_size=web.MAX_UPLOAD,
+                                     max_content_length=web.MAX_UPLOAD)
+    return web.process(web.read_lines(form, files), form.getlist("languages"))
+
+async def read_body(receive, limit):
+    """The request body as a rewound file, or None once it grows past limit
+    bytes. Raises ClientDisconnected if the client leaves first."""
+    body = tempfile.SpooledTemporaryFile(max_size=web.MAX_UPLOAD)
+    try:
+        size = 0
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                raise ClientDisconnected
+            chunk = message.get("body", b"")
+            size += len(chunk)
+            if size > limit:
+                body.close()
+                return None
+            body.write(chunk)
+            if not message.get("more_body", False):
+                break
+    except BaseException:
+        body.close()
+        raise
+    body.seek(0)
+    return body
+
+def header(scope, name):
+    for key, value in scope["headers"]:
+        if key.lower() == name:
+            return value.decode("latin-1")
+    return None
+
+async def send_json(send, data, status, headers=()):
+    body = json.dumps(data).encode("utf-8")
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(b"content-type", b"application/json"),
+                            (b"content-length", str(len(body)).encode("latin-1")), *headers]})
+    await send({"type": "http.response.body", "body": body})
+
+async def send_failure(send, message, status, headers=()):
+    await send_json(send, {"success": False, "error": message}, status, headers)
+
+# Every other route: the Flask app, run in a thread. Its responses are
+# small apart from /download and /batch, which are sent on a chunk at a
+# time as the app produces them.
+
+def build_environ(scope, body):
+    # body is a file from read_body, positioned at its start
+    length = body.seek(0, io.SEEK_END)
+    body.seek(0)
+    server = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": "HTTP/" + scope.get("http_version", "1.1"),
+        "CONTENT_LENGTH": str(length),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": body,
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    if scope.get("client"):
+        environ["REMOTE_ADDR"] = scope["client"][0]
+    for key, value in scope["headers"]:
+        key = key.decode("latin-1").upper().replace("-", "_")
+        value = value.decode("latin-1")
+        if key == "CONTENT_TYPE":
+            environ[key] = value
+        elif key != "CONTENT_LENGTH":
+            key = "HTTP_" + key
+            environ[key] = environ[key] + "," + value if key in environ else value
+    return environ
+
+async def call_wsgi(scope, receive, send):
+    limit = web.MAX_BATCH if scope["path"] == "/batch" else web.MAX_UPLOAD
+    body = await read_body(receive, limit)
+    if body is None:
+        await send_failure(send, web.too_large_message(limit), 413)
+        return
+    loop = asyncio.get_running_loop()
+    try:
+        await loop.run_in_executor(None, run_wsgi, build_environ(scope, body), send, loop)
+    finally:
+        body.close()
+
+def run_wsgi(environ, send, loop):
+    # In one thread from start to end, as a WSGI app expects (a streamed
+    # Flask response keeps its request context in that thread). Each send
+    # waits for the event loop, so a slow client holds back the app
+    # rather than letting chunks pile up.
+    def emit(message):
+        asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+    started = []
+
+    def start_response(status, headers, exc_info=None):
+        started[:] = [int(status.split(" ", 1)[0]),
+                      [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers]]
+
+    chunks = web.app(environ, start_response)
+    try:
+        emit({"type": "http.response.start", "status": started[0], "headers": started[1]})
+        for chunk in chunks:
+            if chunk:
+                emit({"type": "http.response.body", "body": chunk, "more_body": True})
+        emit({"type": "http.response.body", "body": b""})
+    finally:
+        close = getattr(chunks, "close", None)
+        if close is not None:
+            close()
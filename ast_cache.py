@@ -0,0 +1,160 @@
+# ast_cache.py
+#
+# On-disk cache of parsed programs, the USL counterpart of .pyc files.
+# A script's optimised, resolved AST is pickled to <cache dir>/<key>.uslc,
+# where the key hashes the source text together with everything that shapes
+# the tree: the optimisation level, the Python version and the size and
+# mtime of the modules that build it (the optimizer folds constants with
+# the interpreter's operators, so interpreter.py counts too). Editing the
+# script or the interpreter therefore changes the key, and a stale entry
+# is simply never looked up again. Loading checks only the magic number
+# and the key stored in the header before unpickling.
+#
+# The cache directory is $USL_CACHE_DIR, or ~/.cache/usl. Writes go through
+# a temporary file and os.replace, so concurrent runs of the same script
+# never see a half-written entry.
+#
+# A hit needs nothing but ast_nodes to rebuild the tree: what the resolver
+# works out about a function's frame is kept as an ast_nodes.FrameLayout,
+# not as its own Scope. So the lexer, parser, optimizer and resolver are
+# imported only when a script has to be compiled.
+
+import gc
+import hashlib
+import os
+import pickle
+import sys
+import time
+
+MAGIC = b'USLA'
+SUFFIX = '.uslc'
+
+def cache_dir():
+    return os.environ.get('USL_CACHE_DIR') or os.path.join(os.path.expanduser('~'), '.cache', 'usl')
+
+# The modules that build the tree, found by file name rather than imported
+_BUILDERS = ('lexer', 'parser', 'ast_nodes', 'optimizer', 'resolver', 'interpreter')
+
+_fingerprint = None
+
+def interpreter_fingerprint():
+    """Identify this interpreter build: a change to any module that builds the AST changes it."""
+    global _fingerprint
+    if _fingerprint is None:
+        parts = [MAGIC, repr(sys.version_info[:2]).encode()]
+        directory = os.path.dirname(os.path.abspath(__file__))
+        for name in _BUILDERS:
+            stat = os.stat(os.path.join(directory, name + '.py'))
+            parts.append(f'{stat.st_size}:{stat.st_mtime_ns}'.encode())
+        _fingerprint = b'|'.join(parts)
+    return _fingerprint
+
+def cache_key(source, opt_level):
+    digest = hashlib.sha256(interpreter_fingerprint())
+    digest.update(b'|O%d|' % opt_level)
+    digest.update(source.encode('utf-8', 'surrogatepass'))
+    return digest.digest()
+
+def compile_source(source, opt_level=1, timings=None):
+    """Parse, optimise and resolve source; returns (program, optimisation report).
+
+    With a timings dict, the seconds spent lexing, parsing and optimising
+    (optimizer plus resolver) are stored in it. The source is then lexed in
+    full before parsing starts, so the phases can be told apart.
+    """
+    from lexer import iter_tokens, tokenize
+    from parser import Parser
+    from optimizer import optimize
+    from resolver import resolve
+    if timings is None:
+        program, report = optimize(Parser(iter_tokens(source)).parse(), opt_level)
+        resolve(program)
+        return program, report
+    start = time.perf_counter()
+    tokens = tokenize(source)
+    lexed = time.perf_counter()
+    program = Parser(tokens).parse()
+    parsed = time.perf_counter()
+    program, report = optimize(program, opt_level)
+    resolve(program)
+    timings['lex'] = lexed - start
+    timings['parse'] = parsed - lexed
+    timings['optimize'] = time.perf_counter() - parsed
+    return program, report
+
+def load_program(path, opt_level=1, use_cache=True, timings=None):
+    """Return the optimised, resolved AST of the script at path, using the cache.
+
+    timings is filled in as by compile_source, or with 'cache load' on a hit.
+    """
+    with open(path, 'r') as f:
+        source = f.read()
+    if not use_cache:
+        return compile_source(source, opt_level, timings)[0]
+    start = time.perf_counter()
+    key = cache_key(source, opt_level)
+    entry = os.path.join(cache_dir(), key.hex() + SUFFIX)
+    program = read_entry(entry, key)
+    if program is None:
+        program = compile_source(source, opt_level, timings)[0]
+        write_entry(entry, key, program)
+    elif timings is not None:
+        timings['cache load'] = time.perf_counter() - start
+    return program
+
+def read_entry(entry, key):
+    try:
+        with open(entry, 'rb') as f:
+            data = f.read()
+    except OSError:
+        return None
+    header = MAGIC + key
+    if data[:len(header)] != header:
+        return None
+    # Unpickling allocates every node at once; without the collector
+    # rescanning the growing tree, loading is about three times faster
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return pickle.loads(data[len(header):])
+    except Exception:
+        return None  # a damaged entry is a miss; the next write replaces it
+    finally:
+        if enabled:
+            gc.enable()
+
+def write_entry(entry, key, program):
+    # The cache is best effort: a read-only or full disk, or a tree too deep
+    # to pickle, just means the next run parses again
+    try:
+        data = MAGIC + key + pickle.dumps(program, pickle.HIGHEST_PROTOCOL)
+        directory = os.path.dirname(entry)
+        os.makedirs(directory, exist_ok=True)
+        import tempfile
+        fd, temp = tempfile.mkstemp(suffix='.tmp', dir=directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(temp, entry)
+        except BaseException:
+            os.unlink(temp)
+            raise
+    except (OSError, RecursionError, pickle.PicklingError):
+        pass
+
+def clear_cache(directory=None):
+    """Delete every cache entry; returns how many were removed."""
+    directory = directory or cache_dir()
+    removed = 0
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return 0
+    for name in names:
+        if name.endswith(SUFFIX) or name.endswith('.tmp'):
+            try:
+                os.unlink(os.path.join(directory, name))
+                removed += 1
+            except FileNotFoundError:
+                pass
+    return removed
@@ -1,102 +1,273 @@
 # ast_nodes.py
+#
+# Nodes use __slots__ to keep large trees compact. `_fields` lists the
+# attributes that hold source-level data (child nodes, names, operators);
+# the remaining slots are annotations filled in by later passes.
+#
+# Every node parsed from source records its token span: `line`/`column` of
+# its first token and `end_line`/`end_column` just past its last token
+# (1-based). Nodes built by other passes have the span slots unset, so read
+# them with getattr(node, 'line', None). There is deliberately no __getattr__
+# fallback: defining one stops CPython from specialising attribute loads on
+# every node, which slows the tree-walking interpreter by a third.
+
+_SPAN = ('line', 'column', 'end_line', 'end_column')
 
 class ASTNode:
-    pass
+    __slots__ = _SPAN
+    _fields = ()
+
+def copy_location(new_node, old_node):
+    """Give new_node the source span of old_node and return it."""
+    for name in _SPAN:
+        setattr(new_node, name, getattr(old_node, name, None))
+    return new_node
 
 class Number(ASTNode):
+    __slots__ = ('value',)
+    _fields = ('value',)
+
     def __init__(self, value):
-        self.value = float(value)
+        # Integer literals stay int; only decimal literals are floats
+        self.value = float(value) if '.' in value else int(value)
 
 class String(ASTNode):
+    __slots__ = ('value',)
+    _fields = ('value',)
+
     def __init__(self, value):
         self.value = bytes(value[1:-1], "utf-8").decode("unicode_escape")
 
 class Boolean(ASTNode):
+    __slots__ = ('value',)
+    _fields = ('value',)
+
     def __init__(self, value):
         self.value = value
 
 class NoneType(ASTNode):
+    __slots__ = ('value',)
+    _fields = ('value',)
+
     def __init__(self):
         self.value = None
 
 class Identifier(ASTNode):
+    __slots__ = ('name', 'depth', 'slot')
+    _fields = ('name',)
+
     def __init__(self, name):
         self.name = name
+        # Filled in by resolver.py: frames to hop up, and the local slot
+        # there (None means a dict lookup in that environment)
+        self.depth = None
+        self.slot = None
 
 class BinaryOp(ASTNode):
+    __slots__ = ('left', 'op', 'right')
+    _fields = ('left', 'op', 'right')
+
     def __init__(self, left, op, right):
         self.left = left
         self.op = op
         self.right = right
 
 class UnaryOp(ASTNode):
+    __slots__ = ('op', 'expr')
+    _fields = ('op', 'expr')
+
     def __init__(self, op, expr):
         self.op = op
         self.expr = expr
 
 class Assignment(ASTNode):
+    __slots__ = ('targets', 'expression')
+    _fields = ('targets', 'expression')
+
     def __init__(self, targets, expression):
         self.targets = targets
         self.expression = expression
 
 class ExpressionStatement(ASTNode):
+    __slots__ = ('expression',)
+    _fields = ('expression',)
+
     def __init__(self, expression):
         self.expression = expression
 
 class FunctionCall(ASTNode):
+    __slots__ = ('func', 'arguments', 'cache')
+    _fields = ('func', 'arguments')
+
     def __init__(self, func, arguments):
         self.func = func
         self.arguments = arguments
+        # Inline cache for method calls, filled in by interpreter.evaluate:
+        # (class of the receiver, method found for it)
+        self.cache = None
 
 class FunctionDef(ASTNode):
+    __slots__ = ('name', 'params', 'body', 'scope', 'slot')
+    _fields = ('name', 'params', 'body')
+
     def __init__(self, name, params, body):
         self.name = name
         self.params = params
         self.body = body
+        # Filled in by resolver.py: a FrameLayout, and the function's own slot
+        self.scope = None
+        self.slot = None
+
+class FrameLayout:
+    """The local slots of a resolved function's frame: varnames[slot] names
+    the local in each slot, and slots maps a name to its slot (the last one,
+    for a repeated parameter). Pickled as varnames alone, so a cached tree
+    loads without the resolver."""
+    __slots__ = ('varnames', 'slots', 'size')
+
+    def __init__(self, varnames):
+        self.varnames = tuple(varnames)
+        self.slots = {name: slot for slot, name in enumerate(self.varnames)}
+        self.size = len(self.varnames)
+
+    def __reduce__(self):
+        return FrameLayout, (self.varnames,)
 
 class ClassDef(ASTNode):
+    __slots__ = ('name', 'bases', 'body', 'slot')
+    _fields = ('name', 'bases', 'body')
+
     def __init__(self, name, bases, body):
         self.name = name
         self.bases = bases
         self.body = body
+        # Filled in by resolver.py
+        self.slot = None
 
 class ReturnStatement(ASTNode):
+    __slots__ = ('expression', 'outside')
+    _fields = ('expression',)
+
     def __init__(self, expression):
         self.expression = expression
+        # Set by resolver.py when the statement is not inside a function
+        self.outside = False
 
 class IfStatement(ASTNode):
+    __slots__ = ('condition', 'then_branch', 'else_branch')
+    _fields = ('condition', 'then_branch', 'else_branch')
+
     def __init__(self, condition, then_branch, else_branch=None):
         self.condition = condition
         self.then_branch = then_branch
         self.else_branch = else_branch
 
 class WhileLoop(ASTNode):
+    __slots__ = ('condition', 'body')
+    _fields = ('condition', 'body')
+
     def __init__(self, condition, body):
         self.condition = condition
         self.body = body
 
 class ForLoop(ASTNode):
+    __slots__ = ('init', 'condition', 'update', 'body')
+    _fields = ('init', 'condition', 'update', 'body')
+
     def __init__(self, init, condition, update, body):
         self.init = init
         self.condition = condition
         self.update = update
         self.body = body
 
+class ForInLoop(ASTNode):
+    __slots__ = ('target', 'iterable', 'body')
+    _fields = ('target', 'iterable', 'body')
+
+    def __init__(self, target, iterable, body):
+        self.target = target  # Identifier bound to each item in turn
+        self.iterable = iterable
+        self.body = body
+
+class ImportStatement(ASTNode):
+    __slots__ = ('module', 'target')
+    _fields = ('module', 'target')
+
+    def __init__(self, module, target):
+        self.module = module  # dotted module name, e.g. 'utils.strings'
+        self.target = target  # Identifier bound to the module: its last component
+
 class BreakStatement(ASTNode):
-    pass
+    __slots__ = ('outside',)
+
+    def __init__(self):
+        # Set by resolver.py when the statement is not inside a loop
+        self.outside = False
 
 class ContinueStatement(ASTNode):
-    pass
+    __slots__ = ('outside',)
+
+    def __init__(self):
+        # Set by resolver.py when the statement is not inside a loop
+        self.outside = False
 
 class Block(ASTNode):
+    __slots__ = ('statements',)
+    _fields = ('statements',)
+
     def __init__(self, statements):
         self.statements = statements
 
 class StatementList(ASTNode):
+    __slots__ = ('statements',)
+    _fields = ('statements',)
+
     def __init__(self, statements):
         self.statements = statements
 
 class Attribute(ASTNode):
+    __slots__ = ('obj', 'attr', 'cache')
+    _fields = ('obj', 'attr')
+
     def __init__(self, obj, attr):
         self.obj = obj
         self.attr = attr
+        # Inline cache, as on FunctionCall
+        self.cache = None
+
+def iter_child_nodes(node):
+    """Yield the direct child nodes of node."""
+    for name in node._fields:
+        value = getattr(node, name)
+        if isinstance(value, ASTNode):
+            yield value
+        elif isinstance(value, list):
+            for item in value:
+                if isinstance(item, ASTNode):
+                    yield item
+
+def dump(node, indent='  '):
+    """Return an indented, multi-line listing of the tree under node.
+
+    Each node shows its class and source span, then its fields one per line;
+    annotations filled in by later passes are left out.
+    """
+    lines = []
+
+    def visit(value, depth, label):
+        prefix = indent * depth + (f'{label}: ' if label else '')
+        if isinstance(value, ASTNode):
+            line = getattr(value, 'line', None)
+            span = '' if line is None else f' {line}:{value.column}-{value.end_line}:{value.end_column}'
+            lines.append(f'{prefix}{type(value).__name__}{span}')
+            for name in value._fields:
+                visit(getattr(value, name), depth + 1, name)
+        elif isinstance(value, (list, tuple)) and value and any(
+                isinstance(item, (ASTNode, list, tuple)) for item in value):
+            for index, item in enumerate(value):
+                visit(item, depth, f'{label}[{index}]')
+        else:
+            lines.append(prefix + repr(value))
+
+    visit(node, 0, None)
+    return '\n'.join(lines)
@@ -0,0 +1,117 @@
+# batch.py
+#
+# Inputs and output of /batch, which transpiles many files into the same
+# languages in one request. The files come as multipart uploads, as .usl
+# members of uploaded zip archives, or both; they are read one at a time
+# as the response is written, so only one input is ever held in memory.
+#
+# The response is newline-delimited JSON, one record per (file, language)
+# written as soon as it is rendered:
+#
+#   {"file": "src/a.usl", "language": "python", "path": "src/a.pyt", "output": "..."}
+#   {"file": "src/a.usl", "language": "cobol", "error": "..."}
+#
+# A file that cannot be read at all gets one record without a language,
+# and a last record sums up the batch:
+#
+#   {"file": "b.usl", "error": "not UTF-8 text"}
+#   {"done": true, "files": 2, "outputs": 1, "errors": 2}
+
+import json
+import posixpath
+import zipfile
+import zlib
+
+class BatchError(ValueError):
+    """A /batch request that cannot be started; reported as 400."""
+
+class Input:
+    __slots__ = ("name", "read")
+
+    def __init__(self, name, read):
+        self.name = name
+        self.read = read  # read(limit) -> up to limit bytes of the file
+
+def is_zip(upload):
+    return (upload.filename or "").lower().endswith(".zip") or upload.mimetype in (
+        "application/zip", "application/x-zip-compressed")
+
+def collect_inputs(uploads):
+    """The Inputs of a list of uploaded files, in upload order, zip members in archive order.
+
+    Archives are opened here, before any output is written, so that a
+    corrupt one fails the request instead of ending the stream early.
+    """
+    inputs = []
+    for upload in uploads:
+        if is_zip(upload):
+            try:
+                archive = zipfile.ZipFile(upload.stream)
+            except (zipfile.BadZipFile, OSError) as e:
+                raise BatchError(f"{upload.filename}: not a zip archive ({e})") from None
+            for info in archive.infolist():
+                if not info.is_dir() and info.filename.lower().endswith(".usl"):
+                    inputs.append(Input(info.filename, member_reader(archive, info)))
+        else:
+            inputs.append(Input(upload.filename or "input.usl", upload.stream.read))
+    return inputs
+
+def close_uploads(uploads):
+    for upload in uploads:
+        upload.close()
+
+def member_reader(archive, info):
+    def read(limit):
+        # The header's file_size is what the archive claims; read no more
+        # than limit bytes whatever it says
+        with archive.open(info) as member:
+            return member.read(limit)
+    return read
+
+def output_path(name, extension):
+    """Where the output for input file name goes: the same path with the language's extension."""
+    return posixpath.splitext(name)[0] + "." + extension
+
+def stream_records(inputs, languages, syntax, max_file_size, transpile_file):
+    """Yield the NDJSON lines of a batch as bytes.
+
+    transpile_file(lines, languages) yields (language, text, error) for each
+    language as soon as it is rendered. "usl" is not passed to it: its
+    output is the input file itself.
+    """
+    languages = list(dict.fromkeys(languages))
+    targets = [lang for lang in languages if lang != "usl"]
+    files = outputs = errors = 0
+    for source in inputs:
+        files += 1
+        try:
+            data = source.read(max_file_size + 1)
+            if len(data) > max_file_size:
+                raise BatchError(f"larger than {max_file_size // 1024} KB")
+            lines = data.decode().splitlines()
+        except UnicodeDecodeError:
+            lines, problem = None, "not UTF-8 text"
+        except (BatchError, zipfile.BadZipFile, OSError, zlib.error,
+                RuntimeError, NotImplementedError) as e:  # encrypted or unsupported members
+            lines, problem = None, str(e)
+        if lines is None:
+            errors += 1
+            yield record({"file": source.name, "error": problem})
+            continue
+        if "usl" in languages:
+            outputs += 1
+            yield record({"file": source.name, "language": "usl", "path": source.name,
+                          "output": "".join(line + "\n" for line in lines)})
+        for lang, text, error in transpile_file(lines, targets):
+            if error is None:
+                outputs += 1
+                yield record({"file": source.name, "language": lang,
+                              "path": output_path(source.name, syntax.language(lang).extension),
+                              "output": text})
+            else:
+                errors += 1
+                yield record({"file": source.name, "language": lang, "error": error})
+    yield record({"done": True, "files": files, "outputs": outputs, "errors": errors})
+
+def record(data):
+    return json.dumps(data).encode("utf-8") + b"\n"
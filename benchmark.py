@@ -0,0 +1,709 @@
+# benchmark.py
+#
+# Micro-benchmarks for the USL toolchain.
+#
+#     python benchmark.py                 # run every benchmark
+#     python benchmark.py engines         # run selected benchmarks
+#     python benchmark.py engines -n 5    # best of 5 runs
+
+import argparse
+import contextlib
+import io
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from lexer import tokenize, iter_tokens
+from parser import Parser
+from incremental import Document
+from resolver import resolve
+from error import UslError
+from usl_programs import CONFORMANCE, PROGRAMS, execute, parse, run_capturing_errors
+
+def run_engine(engine, ast):
+    """Run a parsed program, returning (seconds, captured stdout)."""
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        start = time.perf_counter()
+        execute(engine, ast)
+        elapsed = time.perf_counter() - start
+    return elapsed, out.getvalue()
+
+def best_of(repeat, func, *args):
+    best, result = None, None
+    for _ in range(repeat):
+        elapsed, result = func(*args)
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, result
+
+def report(rows, headers):
+    widths = [max(len(str(row[i])) for row in rows + [headers]) for i in range(len(headers))]
+    print('  '.join(str(h).ljust(w) for h, w in zip(headers, widths)))
+    for row in rows:
+        print('  '.join(str(c).ljust(w) for c, w in zip(row, widths)))
+
+def bench_engines(repeat):
+    """Tree-walking interpreter versus the closure compiler and bytecode VM."""
+    engines = ('tree', 'closure', 'vm')
+    rows = []
+    for name, source in PROGRAMS.items():
+        ast = parse(source)
+        timings, outputs = [], []
+        for engine in engines:
+            elapsed, output = best_of(repeat, run_engine, engine, ast)
+            timings.append(elapsed)
+            outputs.append(output)
+        if any(output != outputs[0] for output in outputs):
+            raise AssertionError(f'{name}: engines disagree: {outputs!r}')
+        base = timings[0]
+        rows.append([name] + [f'{t * 1000:.1f} ms ({base / t:.2f}x)' for t in timings])
+    report(rows, ['program'] + list(engines))
+
+def bench_methods(repeat):
+    """Method-call-heavy OOP workload (inherited methods, two receiver classes)."""
+    ast = parse(PROGRAMS['method_calls'])
+    calls = 20000 * 4  # area, perimeter, scaled and the area call inside it
+    rows = []
+    for engine in ('tree', 'closure', 'vm'):
+        elapsed, _ = best_of(repeat, run_engine, engine, ast)
+        rows.append([engine, f'{elapsed * 1000:.1f} ms', f'{calls / elapsed / 1000:.0f}k calls/s'])
+    report(rows, ['engine', 'time', 'method calls'])
+
+def bench_recursion(repeat):
+    """100k-deep tail recursion on every engine; deep non-tail recursion on the VM."""
+    tail = parse('''
+        def count(n, acc) {
+            if (n == 0) { return acc; }
+            return count(n - 1, acc + n);
+        }
+        print(count(100000, 0));
+    ''')
+    deep = parse('''
+        def sum(n) {
+            if (n == 0) { return 0; }
+            return n + sum(n - 1);
+        }
+        print(sum(100000));
+    ''')
+    rows = []
+    for engine in ('tree', 'closure', 'vm'):
+        tail_time, _ = best_of(repeat, run_engine, engine, tail)
+        try:
+            deep_time, _ = best_of(repeat, run_engine, engine, deep)
+            deep_result = f'{deep_time * 1000:.1f} ms'
+        except UslError as e:
+            deep_result = str(e)
+        rows.append([engine, f'{tail_time * 1000:.1f} ms', deep_result])
+    report(rows, ['engine', 'tail, depth 100k', 'non-tail, depth 100k'])
+
+def float_literals(ast):
+    """Turn every integer literal into a float, as the old numeric model did."""
+    from ast_nodes import Number, iter_child_nodes
+    stack = [ast]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, Number):
+            node.value = float(node.value)
+        stack.extend(iter_child_nodes(node))
+    return ast
+
+def bench_numeric(repeat):
+    """Integer literals kept as int versus the old everything-is-float model."""
+    rows = []
+    for name in ('counting_loop', 'nested_loops', 'primes', 'factorial'):
+        row = [name]
+        for engine in ('tree', 'closure', 'vm'):
+            before, _ = best_of(repeat, run_engine, engine, float_literals(parse(PROGRAMS[name])))
+            after, _ = best_of(repeat, run_engine, engine, parse(PROGRAMS[name]))
+            row.append(f'{before * 1000:.1f} -> {after * 1000:.1f} ms ({before / after:.2f}x)')
+        rows.append(row)
+    report(rows, ['program', 'tree', 'closure', 'vm'])
+
+def bench_iteration(repeat):
+    """for-in over lazy range() versus a materialised list: time and peak memory."""
+    rows = []
+    for size in (10000, 100000, 1000000):
+        for label, iterable in (('range', f'range({size})'), ('list', f'list(range({size}))')):
+            ast = parse(f'''
+                total = 0;
+                for (i in {iterable}) {{ total = total + i; }}
+                print(total);
+            ''')
+            row = [size, label]
+            for engine in ('closure', 'vm'):
+                elapsed, _ = best_of(repeat, run_engine, engine, ast)
+                tracemalloc.start()
+                run_engine(engine, ast)
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                row.append(f'{elapsed * 1000:.1f} ms, peak {peak / 2**20:.2f} MiB')
+            rows.append(row)
+    report(rows, ['items', 'iterable', 'closure', 'vm'])
+
+def bench_control(repeat):
+    """Tight loops using continue and small recursive functions (return/continue cost)."""
+    engines = ('tree', 'closure', 'vm')
+    rows = []
+    for name in ('continue_loop', 'small_calls', 'fib', 'factorial'):
+        ast = parse(PROGRAMS[name])
+        rows.append([name] + [f'{best_of(repeat, run_engine, engine, ast)[0] * 1000:.1f} ms'
+                              for engine in engines])
+    report(rows, ['program'] + list(engines))
+
+def bench_optimizer(repeat):
+    """Unoptimised versus -O1 and -O2 trees, with the optimizer's node report."""
+    from optimizer import optimize
+    rows = []
+    for name, source in PROGRAMS.items():
+        row = [name]
+        outputs = set()
+        for level in (0, 1, 2):
+            ast, stats = optimize(parse(source, resolved=False), level)
+            resolve(ast)
+            elapsed, output = best_of(repeat, run_engine, 'tree', ast)
+            outputs.add(output)
+            row.append(f'{elapsed * 1000:.1f} ms')
+        if len(outputs) != 1:
+            raise AssertionError(f'{name}: optimised output differs')
+        row.append(f'{stats.nodes_before} -> {stats.nodes_after}')
+        rows.append(row)
+    report(rows, ['program', '-O0', '-O1', '-O2', 'nodes at -O2'])
+
+def synthetic_program(lines):
+    """Generate a valid USL program of roughly the given number of lines."""
+    unit = '''def f{0}(a, b) {{
+    x = a * 2 + b;
+    if (x > 10) {{
+        return x - 1;
+    }}
+    while (x < 100) {{ x = x + a; }}
+    return x;
+}}
+y{0} = f{0}({0} + 1, 3);
+'''
+    return ''.join(unit.format(i) for i in range(lines // unit.count('\n')))
+
+def bench_ast_memory(repeat):
+    """Parse time and retained AST memory for a 100k-line synthetic program."""
+    source = synthetic_program(100000)
+    tokens = tokenize(source)
+    parse_time, _ = best_of(repeat, timed, lambda: Parser(tokens).parse())
+    tracemalloc.start()
+    ast = Parser(tokens).parse()
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    from optimizer import count_nodes
+    nodes = count_nodes(ast)
+    report([[source.count('\n'), len(tokens), nodes, f'{parse_time * 1000:.0f} ms',
+             f'{retained / 2**20:.1f} MiB', f'{retained / nodes:.0f} B']],
+           ['lines', 'tokens', 'nodes', 'parse', 'AST memory', 'per node'])
+
+def bench_lexer(repeat):
+    """Lexer throughput on a 100k-line program, and parsing from a token stream."""
+    source = synthetic_program(100000)
+    size = len(source.encode()) / 2**20
+    with tempfile.NamedTemporaryFile('w', suffix='.usl', delete=False) as f:
+        f.write(source)
+    try:
+        def lex_file():
+            with open(f.name) as stream:
+                for _ in iter_tokens(stream):
+                    pass
+        def parse_list():
+            return Parser(tokenize(source)).parse()
+        def parse_file():
+            with open(f.name) as stream:
+                return Parser(iter_tokens(stream)).parse()
+        rows = []
+        for label, func in (('tokenize(str)', lambda: tokenize(source)),
+                            ('iter_tokens(file)', lex_file)):
+            elapsed, _ = best_of(repeat, timed, func)
+            rows.append([label, f'{elapsed * 1000:.0f} ms', f'{size / elapsed:.2f} MB/s', ''])
+        for label, func in (('parse token list', parse_list), ('parse file stream', parse_file)):
+            elapsed, _ = best_of(repeat, timed, func)
+            tracemalloc.start()
+            ast = func()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            del ast
+            rows.append([label, f'{elapsed * 1000:.0f} ms', f'{size / elapsed:.2f} MB/s',
+                         f'{peak / 2**20:.1f} MiB'])
+    finally:
+        os.unlink(f.name)
+    print(f'{source.count(chr(10))} lines, {size:.1f} MB')
+    report(rows, ['stage', 'time', 'throughput', 'peak memory'])
+
+def expression_program(lines):
+    """Generate a program whose statements are long operator-heavy expressions."""
+    unit = 'v{0} = (a{0} + b * {0} - c / 2) * (d % 3 + e) > f and not g or h.k(x, y + 1) == "s";\n'
+    return ''.join(unit.format(i) for i in range(lines))
+
+def bench_parser(repeat):
+    """Parse time of the precedence-climbing parser, with and without error recovery."""
+    rows = []
+    for name, source in (('synthetic', synthetic_program(20000)),
+                         ('expressions', expression_program(5000))):
+        tokens = tokenize(source)
+        strict, _ = best_of(repeat, timed, lambda: Parser(tokens).parse())
+        recovering, _ = best_of(repeat, timed, lambda: Parser(tokens, recover=True).parse())
+        rows.append([name, len(tokens), f'{strict * 1000:.0f} ms',
+                     f'{len(tokens) / strict / 1000:.0f}k tokens/s', f'{recovering * 1000:.0f} ms'])
+    # One statement in ten broken: every error is reported in a single pass
+    broken = ''.join(line if i % 10 else line.replace('=', '= ;', 1)
+                     for i, line in enumerate(expression_program(5000).splitlines(True)))
+    parser = Parser(tokenize(broken), recover=True)
+    elapsed, program = timed(parser.parse)
+    rows.append(['expressions, 10% broken', '', '', f'{len(parser.errors)} errors',
+                 f'{elapsed * 1000:.0f} ms, {len(program.statements)} statements kept'])
+    report(rows, ['program', 'tokens', 'parse', 'throughput', 'recover=True'])
+
+def bench_imports(repeat):
+    """Module loading: the first read runs a module, later imports share it."""
+    import modules
+    rows = []
+    with tempfile.TemporaryDirectory() as directory, temporary_cache():
+        with open(os.path.join(directory, 'big.usl'), 'w') as f:
+            f.write(synthetic_program(5000))
+        # Each call imports the module again and reads one attribute
+        user = parse('''
+            def use() { import big; return big.f1; }
+            i = 0;
+            while (i < 10000) { use(); i = i + 1; }
+        ''')
+        old_path, modules.search_path = modules.search_path, [directory]
+        try:
+            def first_read(use_cache):
+                modules.registry.clear()
+                modules.use_cache = use_cache
+                start = time.perf_counter()
+                modules.import_module('big').f1
+                return time.perf_counter() - start, None
+            cold, _ = best_of(repeat, first_read, False)
+            warm, _ = best_of(repeat, first_read, True)
+            shared, _ = best_of(repeat, run_engine, 'tree', user)
+            lazy, _ = best_of(repeat, timed, lambda: (modules.registry.clear(),
+                                                     modules.import_module('big')))
+        finally:
+            modules.search_path = old_path
+            modules.use_cache = True
+            modules.registry.clear()
+    rows.append(['import without use', f'{lazy * 1e6:.0f} us'])
+    rows.append(['first read, parse (5000 lines)', f'{cold * 1000:.1f} ms'])
+    rows.append(['first read, .uslc cache', f'{warm * 1000:.1f} ms'])
+    rows.append(['10000 more imports + reads', f'{shared * 1000:.1f} ms'])
+    report(rows, ['step', 'time'])
+
+def bench_incremental(repeat):
+    """Edit latency of incremental re-parsing versus parsing the whole file again."""
+    edits = (
+        ('type a character', lambda text, at: (at, 0, 'z')),
+        ('insert a line', lambda text, at: (at, 0, 'w = 1;\n')),
+        ('delete a line', lambda text, at: (at, text.index('\n', at) + 1 - at, '')),
+    )
+    rows = []
+    for lines in (5000, 50000):
+        source = synthetic_program(lines)
+        full, _ = best_of(repeat, timed, lambda: Parser(tokenize(source)).parse())
+        build, doc = timed(Document, source)
+        # Edits go at the start of a statement in the middle of the file,
+        # `x = a * 2 + b;` in the body of a function
+        at = source.index('    x = ', len(source) // 2) + 4
+        for label, make_edit in edits:
+            elapsed, _ = best_of(repeat, timed, lambda: doc.edit(*make_edit(doc.text, at)))
+            # Statements' line numbers catch up with the edit as they are read
+            spans, program = timed(lambda: doc.program)
+            expected = Parser(tokenize(doc.text)).parse()
+            if len(program.statements) != len(expected.statements) or \
+                    program.end_line != expected.end_line:
+                raise AssertionError(f'{label}: incremental parse differs from a full parse')
+            rows.append([lines, label, f'{full * 1000:.0f} ms', f'{build * 1000:.0f} ms',
+                         f'{elapsed * 1000:.2f} ms', f'{spans * 1000:.2f} ms'])
+    report(rows, ['lines', 'edit', 'full parse', 'Document()', 'edit', 'then program'])
+
+def bench_startup(repeat):
+    """Cold (parse) versus warm (.uslc cache) startup of main.py, in-process and end to end."""
+    from ast_cache import load_program
+    main_py = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py')
+    rows = []
+    with temporary_cache() as cache:
+        for lines in (100, 2000, 20000):
+            path = os.path.join(cache, f'script{lines}.usl')
+            with open(path, 'w') as f:
+                f.write(synthetic_program(lines))
+            cold, _ = best_of(repeat, timed, load_program, path, 1, False)
+            load_program(path)
+            warm, _ = best_of(repeat, timed, load_program, path)
+            def start(*flags):
+                subprocess.run([sys.executable, main_py, *flags, path],
+                               check=True, stdout=subprocess.DEVNULL)
+            cold_run, _ = best_of(repeat, timed, start, '--no-cache')
+            warm_run, _ = best_of(repeat, timed, start)
+            rows.append([lines, f'{cold * 1000:.1f} ms', f'{warm * 1000:.1f} ms ({cold / warm:.1f}x)',
+                         f'{cold_run * 1000:.0f} ms', f'{warm_run * 1000:.0f} ms'])
+    report(rows, ['lines', 'parse', 'cache load', 'main.py --no-cache', 'main.py (warm cache)'])
+
+# Regression target for the usl command with a warm cache: `usl run` may
+# take at most this many times as long as a bare `python -c pass` (which
+# keeps the target meaningful on slower machines). Which modules each
+# command may import is checked by test_startup.py
+STARTUP_BUDGET = 6.0
+
+def bench_cli(repeat):
+    """Start-up of the usl commands on a small script, against STARTUP_BUDGET."""
+    usl_py = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'usl.py')
+    def start(*command):
+        subprocess.run([sys.executable, *command], check=True, stdout=subprocess.DEVNULL)
+    with temporary_cache() as cache:
+        path = os.path.join(cache, 'script.usl')
+        with open(path, 'w') as f:
+            f.write('def add(a, b) { return a + b; }\n'
+                    'class Point { def __init__(self, x) { self.x = x; } }\n'
+                    'print(add(1, 2), Point(3).x);\n')
+        start(usl_py, 'run', path)  # fill the cache
+        bare, _ = best_of(max(repeat, 5), timed, start, '-c', 'pass')
+        rows = [['python -c pass', f'{bare * 1000:.0f} ms', '1.0x']]
+        for command in ('run', 'check', 'tokens'):
+            elapsed, _ = best_of(max(repeat, 5), timed, start, usl_py, command, path)
+            rows.append([f'usl {command}', f'{elapsed * 1000:.0f} ms', f'{elapsed / bare:.1f}x'])
+            if command == 'run':
+                run_time = elapsed
+    report(rows, ['command', 'wall time', 'vs python'])
+    if run_time > bare * STARTUP_BUDGET:
+        raise SystemExit(f'usl run takes {run_time / bare:.1f}x as long as python '
+                         f'(budget {STARTUP_BUDGET}x)')
+
+def symbolic_program(lines):
+    """Generate input for the web app's /process: Symbolic lines of every kind it renders."""
+    unit = ('Symbolic: let x{0} = {0} * 2\n'
+            'Symbolic: print("value", x{0})\n'
+            'Symbolic: if x{0} > 10\n'
+            'Symbolic: function f{0}(a, b)\n'
+            'Symbolic: return a + b\n'
+            'Symbolic: comment "step {0}"\n'
+            'Symbolic[python]: print(x{0})\n'
+            'Symbolic: while x{0} > 0\n')
+    return ''.join(unit.format(i) for i in range(max(lines // unit.count('\n'), 1)))
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+def bench_process(repeat):
+    """Latency of the web app's /process with every language selected (needs Flask)."""
+    try:
+        import flask  # noqa: F401
+    except ImportError:
+        print('skipped: Flask is not installed')
+        return
+    with tempfile.TemporaryDirectory() as work, working_directory(work):
+        import app  # creates its upload directory in the current one
+        client = app.app.test_client()
+        languages = client.get('/languages').get_json()
+        listing = [timed(client.get, '/languages')[0] for _ in range(50)]
+        rows = [['GET /languages', '', f'{percentile(listing, 0.5) * 1000:.2f} ms',
+                 f'{percentile(listing, 0.9) * 1000:.2f} ms']]
+        app.transpile_cache.directory = None  # time the in-memory tier only
+        for lines in (10, 100, 1000):
+            form = {'usl_code': symbolic_program(lines), 'languages': languages}
+            def post():
+                response = client.post('/process', data=form)
+                if response.status_code != 200:
+                    raise AssertionError(f'/process returned {response.status_code}')
+                return response
+            cold, cached, downloads = [], [], []
+            for _ in range(max(repeat, 5)):
+                app.transpile_cache.clear()
+                elapsed, response = timed(post)
+                cold.append(elapsed)
+                cached.append(timed(post)[0])
+                url = response.get_json()['download_url']
+                downloads.append(timed(lambda: client.get(url).data)[0])
+            for request, samples in ((f'POST /process, {len(languages)} languages', cold),
+                                     ('  same input again (cached)', cached),
+                                     ('GET /download/<id>', downloads)):
+                rows.append([request, lines, f'{percentile(samples, 0.5) * 1000:.1f} ms',
+                             f'{percentile(samples, 0.9) * 1000:.1f} ms'])
+    report(rows, ['request', 'input lines', 'p50', 'p90'])
+
+def bench_pool(repeat):
+    """All-languages transpilation by pool backend, against input size."""
+    from syntax_registry import TemplateRegistry
+    from symbolic_ir import build_program
+    from transpile_pool import BACKENDS, TranspilePool
+    syntax_file = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                               'syntax_templates_fully_extended.json')
+    syntax = TemplateRegistry(syntax_file).current()
+    workers = max(os.cpu_count() or 1, 2)
+    # min_parallel_work=0 so that even the smallest input goes through the pool
+    pools = {backend: TranspilePool(syntax_file, backend, workers, min_parallel_work=0)
+             for backend in BACKENDS}
+    rows = []
+    try:
+        for lines in (10, 100, 1000, 5000):
+            program = build_program(symbolic_program(lines).splitlines())
+            row, expected = [lines], None
+            for backend, pool in pools.items():
+                pool.render_all(program, syntax.names, syntax)  # start the workers
+                elapsed, result = best_of(repeat, timed, pool.render_all, program, syntax.names, syntax)
+                if expected is None:
+                    expected = result
+                elif result != expected:
+                    raise AssertionError(f'{backend} pool output differs from serial')
+                row.append(f'{elapsed * 1000:.1f} ms')
+            rows.append(row)
+    finally:
+        for pool in pools.values():
+            pool.shutdown()
+    print(f'{len(syntax.names)} languages, {workers} workers, {os.cpu_count()} CPUs')
+    report(rows, ['input lines', *BACKENDS])
+
+def bench_codegen(repeat):
+    """Transpiling USL source through its syntax tree, against program size."""
+    from syntax_registry import TemplateRegistry
+    from codegen import build_program, emitter_for
+    syntax_file = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                               'syntax_templates_fully_extended.json')
+    syntax = TemplateRegistry(syntax_file).current()
+    languages = [syntax.language(name) for name in syntax.names]
+    for language in languages:
+        emitter_for(language)  # compiled once per table, not per request
+    rows = []
+    for lines in (100, 1000, 10000):
+        source = synthetic_program(lines).splitlines()
+        build, program = best_of(repeat, timed, build_program, source)
+        if program.errors:
+            raise AssertionError(f'synthetic program does not parse: {program.errors[0]}')
+        render, _ = best_of(repeat, timed, lambda: [program.render(lang) for lang in languages])
+        rows.append([len(source), program.size(), f'{build * 1000:.1f} ms', f'{render * 1000:.1f} ms',
+                     f'{render / len(languages) / len(source) * 1e6:.2f} us'])
+    print(f'{len(languages)} languages')
+    report(rows, ['lines', 'nodes', 'parse + lower', 'render all', 'per language-line'])
+
+# Sources in other languages for reverse_parser: one unit of each, repeated
+REVERSE_UNITS = {
+    'py': '''# step {0}
+import os
+from collections import OrderedDict
+
+class Shape{0}(Base):
+    """A shape.
+
+    Its docstring spans lines and mentions main - and print.
+    """
+    def area(self, width, height=2):
+        total = width * height
+        if total > 100 and width != {0}:
+            print("large", total)
+        elif total == 0:
+            raise ValueError("empty")
+        for i in range(width):
+            total += i
+            if i % 7 == 0:
+                continue
+        while total > 10:
+            total = total // 2
+            break
+        result = [x - 1 for x in range(3)]
+        return total + {0}
+
+if __name__ == "__main__":
+    Shape{0}().area(3)
+''',
+    'js': '''// step {0}
+import {{ readFile }} from "fs";
+
+/* A block comment
+   that mentions main and print. */
+export class Shape{0} extends Base {{
+}}
+
+function area{0}(width, height) {{
+    let total = width * height;
+    if (total > 100 && width !== {0}) {{
+        console.log("large", total);
+    }} else if (total === 0) {{
+        throw new Error("empty");
+    }}
+    for (let i = 0; i < width; i++) {{
+        total += i;
+        if (i % 7 === 0) {{
+            continue;
+        }}
+    }}
+    const half = (x) => x / 2;
+    total++;
+    return half(total) + {0};
+}}
+''',
+    'c': '''// step {0}
+#include <stdio.h>
+#define LIMIT_{0} 100
+
+/* A block comment
+   that mentions main and print. */
+static int area{0}(int width, int height)
+{{
+    int total = width * height;
+    if (total > LIMIT_{0} && width != {0}) {{
+        printf("large %d\\n", total);
+    }} else if (total == 0) {{
+        return -1;
+    }}
+    for (int i = 0; i < width; i++) {{
+        total += i;
+        switch (i % 3) {{
+        case 0:
+            break;
+        }}
+    }}
+    while (total > 10) {{
+        total = total / 2;
+    }}
+    return total + {0};
+}}
+
+int main(void) {{
+    area{0}(3, 4);
+    return 0;
+}}
+''',
+}
+
+def reverse_source(ext, lines):
+    """Generate a source file of roughly the given number of lines, for reverse_parser."""
+    unit = REVERSE_UNITS[ext]
+    return ''.join(unit.format(i) for i in range(max(lines // unit.count('\n'), 1)))
+
+def bench_reverse(repeat):
+    """reverse_parser throughput, streaming large Python, JavaScript and C files."""
+    from reverse_parser import detect_language_by_extension, reverse_file
+    rows = []
+    with tempfile.TemporaryDirectory() as work:
+        for ext in REVERSE_UNITS:
+            path = os.path.join(work, f'large.{ext}')
+            source = reverse_source(ext, 200000)
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(source)
+            lines = source.count('\n')
+            size = os.path.getsize(path)
+            elapsed, count = best_of(repeat, timed, lambda: sum(1 for _ in reverse_file(path)))
+            rows.append([detect_language_by_extension(path), lines, f'{size / 2**20:.1f} MiB', count,
+                         f'{elapsed * 1000:.0f} ms', f'{lines / elapsed / 1000:.0f}k',
+                         f'{size / 2**20 / elapsed:.1f} MiB/s'])
+    report(rows, ['language', 'lines', 'size', 'symbolic', 'time', 'lines/s', 'throughput'])
+
+def bench_scopes(repeat):
+    """Dict-based environment lookups versus resolved list-backed frames."""
+    rows = []
+    for name, source in PROGRAMS.items():
+        row = [name]
+        for engine in ('tree', 'closure'):
+            before, out_before = best_of(repeat, run_engine, engine, parse(source, resolved=False))
+            after, out_after = best_of(repeat, run_engine, engine, parse(source))
+            if out_before != out_after:
+                raise AssertionError(f'{name}: resolved output differs')
+            row.append(f'{before * 1000:.1f} -> {after * 1000:.1f} ms ({before / after:.2f}x)')
+        rows.append(row)
+    report(rows, ['program', 'tree', 'closure'])
+
+def bench_verify(repeat):
+    """Differential check: every engine must print exactly what evaluate prints."""
+    engines = ('tree', 'closure', 'vm')
+    failures = 0
+    for name, source in {**CONFORMANCE, **PROGRAMS}.items():
+        outputs = [run_capturing_errors(engine, source) for engine in engines]
+        status = 'ok'
+        if any(output != outputs[0] for output in outputs):
+            failures += 1
+            status = 'MISMATCH ' + ' | '.join(f'{e}={o!r}' for e, o in zip(engines, outputs))
+        print(f'{name:<16} {status}')
+    if failures:
+        raise SystemExit(f'{failures} program(s) differ between engines')
+
+def bench_bytecode(repeat):
+    """Compile, serialise and reload bytecode versus re-parsing the source."""
+    from bytecode import compile_program, dumps, loads
+    rows = []
+    for name, source in PROGRAMS.items():
+        source = source * 20
+        parse_time, _ = best_of(repeat, timed, parse, source)
+        compile_time, code = best_of(repeat, timed, lambda: compile_program(parse(source)))
+        data = dumps(code)
+        load_time, _ = best_of(repeat, timed, loads, data)
+        rows.append([name, len(source), len(data),
+                     f'{parse_time * 1000:.2f} ms', f'{compile_time * 1000:.2f} ms',
+                     f'{load_time * 1000:.2f} ms ({parse_time / load_time:.1f}x)'])
+    report(rows, ['program (x20)', 'source bytes', 'code bytes', 'parse', 'parse+compile', 'loads'])
+
+@contextlib.contextmanager
+def working_directory(path):
+    old = os.getcwd()
+    os.chdir(path)
+    try:
+        yield path
+    finally:
+        os.chdir(old)
+
+@contextlib.contextmanager
+def temporary_cache():
+    """Point the .uslc cache at a fresh directory for the duration."""
+    old_cache = os.environ.get('USL_CACHE_DIR')
+    with tempfile.TemporaryDirectory() as cache:
+        os.environ['USL_CACHE_DIR'] = cache
+        try:
+            yield cache
+        finally:
+            if old_cache is None:
+                del os.environ['USL_CACHE_DIR']
+            else:
+                os.environ['USL_CACHE_DIR'] = old_cache
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+BENCHMARKS = {
+    'verify': bench_verify,
+    'engines': bench_engines,
+    'control': bench_control,
+    'methods': bench_methods,
+    'recursion': bench_recursion,
+    'numeric': bench_numeric,
+    'iteration': bench_iteration,
+    'optimizer': bench_optimizer,
+    'scopes': bench_scopes,
+    'bytecode': bench_bytecode,
+    'ast_memory': bench_ast_memory,
+    'lexer': bench_lexer,
+    'parser': bench_parser,
+    'incremental': bench_incremental,
+    'startup': bench_startup,
+    'cli': bench_cli,
+    'process': bench_process,
+    'pool': bench_pool,
+    'codegen': bench_codegen,
+    'reverse': bench_reverse,
+    'imports': bench_imports,
+}
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Run USL benchmarks.')
+    arg_parser.add_argument('names', nargs='*', metavar='name',
+                            help=f'benchmarks to run: {", ".join(BENCHMARKS)} (default: all)')
+    arg_parser.add_argument('-n', '--repeat', type=int, default=3, help='runs per measurement')
+    args = arg_parser.parse_args()
+    for name in args.names:
+        if name not in BENCHMARKS:
+            arg_parser.error(f'unknown benchmark {name!r}')
+    for name in args.names or BENCHMARKS:
+        print(f'== {name}: {BENCHMARKS[name].__doc__}')
+        BENCHMARKS[name](args.repeat)
+        print()
+
+if __name__ == '__main__':
+    main()
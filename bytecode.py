@@ -0,0 +1,444 @@
+# bytecode.py
+#
+# Compiles a parsed (and resolved) program into flat wordcode for vm.py.
+# Every instruction is an (opcode, argument) pair stored in an array('i');
+# literals, names and nested code objects live in per-code-object pools.
+# Code objects round-trip through dumps/loads so they can be cached.
+
+import marshal
+from array import array
+from bisect import bisect_right
+from ast_nodes import *
+from error import UslError
+from resolver import resolve
+
+LOAD_CONST = 0         # push consts[arg]
+LOAD_FAST = 1          # push the local in slot arg
+STORE_FAST = 2         # pop into the local in slot arg
+LOAD_NAME = 3          # push names[arg], looked up by name from the current env
+STORE_NAME = 4         # pop into names[arg] in the current env
+LOAD_DEREF = 5         # push refs[arg] = (depth, slot, name) from an outer env
+LOAD_ATTR = 6          # replace TOS with getattr(TOS, names[arg])
+STORE_ATTR = 7         # TOS is the object, TOS1 the value
+POP_TOP = 8
+DUP_TOP = 9
+JUMP = 10              # jump to instruction index arg
+POP_JUMP_IF_FALSE = 11 # pop TOS and jump to arg if it is falsy
+CALL_FUNCTION = 12     # call with arg positional arguments
+RETURN_VALUE = 13
+MAKE_FUNCTION = 14     # consts[arg] is the function's code object
+MAKE_CLASS = 15        # consts[arg] is the class body's code object
+BINARY_ADD = 16
+BINARY_SUB = 17
+BINARY_MUL = 18
+BINARY_DIV = 19
+BINARY_MOD = 20
+COMPARE_EQ = 21
+COMPARE_NEQ = 22
+COMPARE_LT = 23
+COMPARE_GT = 24
+COMPARE_LE = 25
+COMPARE_GE = 26
+BINARY_AND = 27        # both operands are evaluated, as in interpreter.py
+BINARY_OR = 28
+UNARY_POS = 29
+UNARY_NEG = 30
+UNARY_NOT = 31
+LOAD_METHOD = 32       # TOS is the receiver: replace it with method, receiver, or with
+                       # getattr(receiver, names[arg]), None when there is no USL method
+CALL_METHOD = 33       # call the pair left by LOAD_METHOD with arg positional arguments
+TAIL_CALL = 34         # CALL_FUNCTION in `return f(...)`: a USL callee replaces the frame
+TAIL_CALL_METHOD = 35  # CALL_METHOD in tail position
+GET_ITER = 36          # replace TOS with iter(TOS)
+FOR_ITER = 37          # TOS is an iterator: push its next item, or pop it and jump to arg
+IMPORT_NAME = 38       # push the module named names[arg] (see modules.py)
+RAISE_ERROR = 39       # raise a UslError with the message consts[arg]
+
+OPNAMES = {value: name for name, value in globals().items()
+           if name.isupper() and isinstance(value, int)}
+
+BINARY_OPCODES = {
+    'ADD': BINARY_ADD,
+    'SUB': BINARY_SUB,
+    'MUL': BINARY_MUL,
+    'DIV': BINARY_DIV,
+    'MOD': BINARY_MOD,
+    'EQ': COMPARE_EQ,
+    'NEQ': COMPARE_NEQ,
+    'LT': COMPARE_LT,
+    'GT': COMPARE_GT,
+    'LE': COMPARE_LE,
+    'GE': COMPARE_GE,
+    'AND': BINARY_AND,
+    'OR': BINARY_OR,
+}
+
+UNARY_OPCODES = {
+    'ADD': UNARY_POS,
+    'SUB': UNARY_NEG,
+    'NOT': UNARY_NOT,
+}
+
+MAGIC = b'USLC'
+FORMAT_VERSION = 7
+
+class CodeObject:
+    def __init__(self, name, kind, code, consts, names, varnames=(), refs=(), params=(), bases=(),
+                 lines=()):
+        self.name = name
+        self.kind = kind  # 'module', 'function' or 'class'
+        self.code = code  # array('i') of opcode, argument pairs
+        self.consts = consts
+        self.names = names
+        self.varnames = varnames  # slot -> local name, for functions
+        self.refs = refs  # (depth, slot, name) for names in enclosing scopes
+        self.params = params
+        self.bases = bases
+        self.lines = lines  # (first instruction, source line) per statement
+        self.line_starts = [start for start, line in lines]
+        self.instructions = list(zip(code[0::2], code[1::2]))
+        # Per-instruction inline caches for LOAD_METHOD: (class, method)
+        self.caches = [None] * len(self.instructions)
+        # Frames are built from the same FrameLayout the resolver gives a FunctionDef
+        self.scope = FrameLayout(varnames) if kind == 'function' else None
+
+    def __repr__(self):
+        return f'<code {self.kind} {self.name}>'
+
+    def line_of(self, index):
+        """Source line of the statement that emitted instruction index."""
+        position = bisect_right(self.line_starts, index) - 1
+        return self.lines[position][1] if position >= 0 else None
+
+    def to_tuple(self):
+        consts = tuple(c.to_tuple() if isinstance(c, CodeObject) else c for c in self.consts)
+        return (self.name, self.kind, self.code.tobytes(), consts, tuple(self.names),
+                tuple(self.varnames), tuple(self.refs), tuple(self.params), tuple(self.bases),
+                tuple(self.lines))
+
+    @classmethod
+    def from_tuple(cls, data):
+        name, kind, raw, consts, names, varnames, refs, params, bases, lines = data
+        code = array('i')
+        code.frombytes(raw)
+        # USL literals are never tuples, so a tuple constant is a nested code object
+        consts = [cls.from_tuple(c) if isinstance(c, tuple) else c for c in consts]
+        return cls(name, kind, code, consts, list(names), list(varnames), list(refs),
+                   list(params), list(bases), list(lines))
+
+def dumps(code):
+    return MAGIC + bytes([FORMAT_VERSION]) + marshal.dumps(code.to_tuple())
+
+def loads(data):
+    if data[:4] != MAGIC or data[4] != FORMAT_VERSION:
+        raise UslError('Incompatible bytecode format')
+    return CodeObject.from_tuple(marshal.loads(data[5:]))
+
+def compile_program(program):
+    """Compile a StatementList into a module CodeObject."""
+    resolve(program)
+    compiler = Compiler('<module>', 'module')
+    compiler.compile_statements(program.statements)
+    return compiler.finish()
+
+class Compiler:
+    def __init__(self, name, kind, params=(), scope=None, bases=()):
+        self.name = name
+        self.kind = kind
+        self.params = params
+        self.bases = bases
+        self.code = array('i')
+        self.consts = []
+        self.const_index = {}
+        self.names = []
+        self.name_index = {}
+        self.refs = []
+        self.ref_index = {}
+        self.varnames = list(scope.varnames) if scope is not None else []
+        self.loops = []  # (continue jumps, break jumps) per enclosing loop
+        self.lines = []
+
+    def finish(self):
+        self.emit(LOAD_CONST, self.add_const(None))
+        self.emit(RETURN_VALUE)
+        return CodeObject(self.name, self.kind, self.code, self.consts, self.names,
+                          self.varnames, self.refs, list(self.params), list(self.bases),
+                          self.lines)
+
+    # Emission helpers
+
+    def emit(self, op, arg=0):
+        position = len(self.code) // 2
+        self.code.append(op)
+        self.code.append(arg)
+        return position
+
+    def here(self):
+        return len(self.code) // 2
+
+    def mark_line(self, line):
+        # Instructions emitted from here on belong to the statement at line
+        if line is None:
+            return
+        start = self.here()
+        if self.lines and self.lines[-1][0] == start:
+            self.lines.pop()
+        if not self.lines or self.lines[-1][1] != line:
+            self.lines.append((start, line))
+
+    def patch(self, position, target):
+        self.code[position * 2 + 1] = target
+
+    def add_const(self, value):
+        # Keyed by type as well, so 1.0 and True stay distinct
+        key = (type(value), repr(value)) if not isinstance(value, CodeObject) else id(value)
+        if key not in self.const_index:
+            self.const_index[key] = len(self.consts)
+            self.consts.append(value)
+        return self.const_index[key]
+
+    def add_name(self, name):
+        if name not in self.name_index:
+            self.name_index[name] = len(self.names)
+            self.names.append(name)
+        return self.name_index[name]
+
+    def add_ref(self, depth, slot, name):
+        key = (depth, slot, name)
+        if key not in self.ref_index:
+            self.ref_index[key] = len(self.refs)
+            self.refs.append(key)
+        return self.ref_index[key]
+
+    # Statements
+
+    def compile_statements(self, statements):
+        for stmt in statements:
+            self.compile_statement(stmt)
+
+    def compile_statement(self, node):
+        if node is None:
+            return
+        self.mark_line(getattr(node, 'line', None))
+        method = getattr(self, 'stmt_' + type(node).__name__, None)
+        if method is not None:
+            method(node)
+        else:
+            self.compile_expression(node)
+            self.emit(POP_TOP)
+
+    def stmt_Block(self, node):
+        self.compile_statements(node.statements)
+
+    def stmt_StatementList(self, node):
+        self.compile_statements(node.statements)
+
+    def stmt_ExpressionStatement(self, node):
+        self.compile_expression(node.expression)
+        self.emit(POP_TOP)
+
+    def stmt_Assignment(self, node):
+        self.compile_expression(node.expression)
+        for i, target in enumerate(node.targets):
+            if i < len(node.targets) - 1:
+                self.emit(DUP_TOP)
+            self.compile_store(target)
+
+    def compile_store(self, target):
+        if isinstance(target, Identifier):
+            self.store_name(target.name, target.slot)
+        elif isinstance(target, Attribute):
+            self.compile_expression(target.obj)
+            self.emit(STORE_ATTR, self.add_name(target.attr))
+        else:
+            raise UslError('Invalid assignment target')
+
+    def store_name(self, name, slot):
+        if slot is not None:
+            self.emit(STORE_FAST, slot)
+        else:
+            self.emit(STORE_NAME, self.add_name(name))
+
+    def stmt_FunctionDef(self, node):
+        compiler = Compiler(node.name, 'function', node.params, node.scope)
+        compiler.compile_statement(node.body)
+        self.emit(MAKE_FUNCTION, self.add_const(compiler.finish()))
+        self.store_name(node.name, node.slot)
+
+    def stmt_ClassDef(self, node):
+        compiler = Compiler(node.name, 'class', bases=node.bases)
+        compiler.compile_statement(node.body)
+        self.emit(MAKE_CLASS, self.add_const(compiler.finish()))
+        self.store_name(node.name, node.slot)
+
+    def stmt_ReturnStatement(self, node):
+        if self.kind != 'function':
+            self.emit(RAISE_ERROR, self.add_const('"return" outside function'))
+            return
+        if isinstance(node.expression, FunctionCall):
+            self.compile_call(node.expression, tail=True)
+        elif node.expression:
+            self.compile_expression(node.expression)
+        else:
+            self.emit(LOAD_CONST, self.add_const(None))
+        self.emit(RETURN_VALUE)
+
+    def stmt_IfStatement(self, node):
+        self.compile_expression(node.condition)
+        jump_else = self.emit(POP_JUMP_IF_FALSE)
+        self.compile_statement(node.then_branch)
+        if node.else_branch:
+            jump_end = self.emit(JUMP)
+            self.patch(jump_else, self.here())
+            self.compile_statement(node.else_branch)
+            self.patch(jump_end, self.here())
+        else:
+            self.patch(jump_else, self.here())
+
+    def stmt_WhileLoop(self, node):
+        start = self.here()
+        self.compile_expression(node.condition)
+        exit_jump = self.emit(POP_JUMP_IF_FALSE)
+        continues, breaks = self.compile_loop_body(node.body)
+        self.patch_all(continues, start)
+        self.emit(JUMP, start)
+        self.patch_all(breaks + [exit_jump], self.here())
+
+    def stmt_ForLoop(self, node):
+        self.compile_statement(node.init)
+        self.mark_line(getattr(node, 'line', None))
+        start = self.here()
+        self.compile_expression(node.condition)
+        exit_jump = self.emit(POP_JUMP_IF_FALSE)
+        continues, breaks = self.compile_loop_body(node.body)
+        self.patch_all(continues, self.here())
+        self.mark_line(getattr(node, 'line', None))
+        self.compile_expression(node.update)
+        self.emit(POP_TOP)
+        self.emit(JUMP, start)
+        self.patch_all(breaks + [exit_jump], self.here())
+
+    def stmt_ForInLoop(self, node):
+        self.compile_expression(node.iterable)
+        self.emit(GET_ITER)
+        start = self.here()
+        exit_jump = self.emit(FOR_ITER)
+        self.compile_store(node.target)
+        continues, breaks = self.compile_loop_body(node.body)
+        self.patch_all(continues, start)
+        self.emit(JUMP, start)
+        # break leaves the iterator on the stack; running out pops it
+        self.patch_all(breaks, self.here())
+        self.emit(POP_TOP)
+        self.patch(exit_jump, self.here())
+
+    def stmt_ImportStatement(self, node):
+        self.emit(IMPORT_NAME, self.add_name(node.module))
+        self.compile_store(node.target)
+
+    def compile_loop_body(self, body):
+        # Returns the jump positions emitted by continue and break
+        self.loops.append(([], []))
+        self.compile_statement(body)
+        return self.loops.pop()
+
+    def patch_all(self, positions, target):
+        for position in positions:
+            self.patch(position, target)
+
+    # Misplaced return, break and continue compile to an instruction that
+    # fails when it runs, with the statement's line, as the other engines do
+
+    def stmt_BreakStatement(self, node):
+        if not self.loops:
+            self.emit(RAISE_ERROR, self.add_const('"break" outside loop'))
+            return
+        self.loops[-1][1].append(self.emit(JUMP))
+
+    def stmt_ContinueStatement(self, node):
+        if not self.loops:
+            self.emit(RAISE_ERROR, self.add_const('"continue" outside loop'))
+            return
+        self.loops[-1][0].append(self.emit(JUMP))
+
+    # Expressions
+
+    def compile_expression(self, node):
+        method = getattr(self, 'expr_' + type(node).__name__, None)
+        if method is None:
+            raise UslError('Unknown AST node')
+        method(node)
+
+    def expr_Number(self, node):
+        self.emit(LOAD_CONST, self.add_const(node.value))
+
+    expr_String = expr_Number
+    expr_Boolean = expr_Number
+    expr_NoneType = expr_Number
+
+    def expr_Identifier(self, node):
+        if node.depth is None or (node.depth == 0 and node.slot is None):
+            self.emit(LOAD_NAME, self.add_name(node.name))
+        elif node.depth == 0:
+            self.emit(LOAD_FAST, node.slot)
+        else:
+            self.emit(LOAD_DEREF, self.add_ref(node.depth, node.slot, node.name))
+
+    def expr_BinaryOp(self, node):
+        opcode = BINARY_OPCODES.get(node.op)
+        if opcode is None:
+            raise UslError(f'Unknown operator {node.op}')
+        self.compile_expression(node.left)
+        self.compile_expression(node.right)
+        self.emit(opcode)
+
+    def expr_UnaryOp(self, node):
+        opcode = UNARY_OPCODES.get(node.op)
+        if opcode is None:
+            raise UslError(f'Unknown operator {node.op}')
+        self.compile_expression(node.expr)
+        self.emit(opcode)
+
+    def expr_FunctionCall(self, node):
+        self.compile_call(node)
+
+    def compile_call(self, node, tail=False):
+        # A tail call is still followed by RETURN_VALUE, which returns the
+        # result when the callee was not a USL function
+        if isinstance(node.func, Attribute):
+            self.compile_expression(node.func.obj)
+            self.emit(LOAD_METHOD, self.add_name(node.func.attr))
+            for arg in node.arguments:
+                self.compile_expression(arg)
+            self.emit(TAIL_CALL_METHOD if tail else CALL_METHOD, len(node.arguments))
+            return
+        self.compile_expression(node.func)
+        for arg in node.arguments:
+            self.compile_expression(arg)
+        self.emit(TAIL_CALL if tail else CALL_FUNCTION, len(node.arguments))
+
+    def expr_Attribute(self, node):
+        self.compile_expression(node.obj)
+        self.emit(LOAD_ATTR, self.add_name(node.attr))
+
+def disassemble(code, indent=''):
+    """Return a human-readable listing of a code object and its nested code."""
+    lines = [f'{indent}{code!r}']
+    nested = []
+    for index, (op, arg) in enumerate(code.instructions):
+        name = OPNAMES[op]
+        detail = ''
+        if op in (LOAD_CONST, MAKE_FUNCTION, MAKE_CLASS):
+            detail = repr(code.consts[arg])
+            if isinstance(code.consts[arg], CodeObject):
+                nested.append(code.consts[arg])
+        elif op in (LOAD_NAME, STORE_NAME, LOAD_ATTR, STORE_ATTR, LOAD_METHOD):
+            detail = code.names[arg]
+        elif op in (LOAD_FAST, STORE_FAST):
+            detail = code.varnames[arg]
+        elif op == LOAD_DEREF:
+            detail = repr(code.refs[arg])
+        lines.append(f'{indent}  {index:4d} {name:<18} {arg:<4d} {detail}'.rstrip())
+    for child in nested:
+        lines.append(disassemble(child, indent + '  '))
+    return '\n'.join(lines)
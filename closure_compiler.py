@@ -0,0 +1,478 @@
+# closure_compiler.py
+#
+# Compiles a parsed program into nested Python closures, one per AST node.
+# All type dispatch happens once at compile time, so running the program
+# only calls closures. Results match interpreter.evaluate.
+
+from ast_nodes import *
+from environment import Environment, UNSET
+from error import UslError, locate
+from modules import import_module
+from interpreter import (UslFunction, UslClass, UslInstance, BoundMethod, Completion, BREAK,
+                         CONTINUE, function_result, get_attribute, find_method, call_method,
+                         method_arguments, iterate)
+
+class CompiledFunction(UslFunction):
+    def __init__(self, func_def, env, body):
+        super().__init__(func_def, env)
+        self.body = body
+
+    def execute(self, frame):
+        return self.body(frame)
+
+    def invoke(self, args):
+        return function_result(self.body(self.make_frame(args)))
+
+def compile_program(node):
+    """Compile a StatementList (or any node) into a callable taking an Environment."""
+    return compile_node(node)
+
+def compile_node(node):
+    if node is None:
+        return _noop
+    compiler = _COMPILERS.get(type(node))
+    if compiler is None:
+        raise UslError('Unknown AST node')
+    return compiler(node)
+
+def _noop(env):
+    return None
+
+def compile_literal(node):
+    value = node.value
+    return lambda env: value
+
+def compile_identifier(node):
+    name, depth, slot = node.name, node.depth, node.slot
+    if depth is None or (depth == 0 and slot is None):
+        return lambda env: env.get_variable(name)
+    if slot is None:
+        return lambda env: env.lookup(depth, None, name)
+    if depth == 0:
+        def load_local(env):
+            value = env.slots[slot]
+            if value is UNSET:
+                return env.get_variable(name)
+            return value
+        return load_local
+    if depth == 1:
+        def load_enclosing(env):
+            value = env.parent.slots[slot]
+            if value is UNSET:
+                return env.parent.get_variable(name)
+            return value
+        return load_enclosing
+    return lambda env: env.lookup(depth, slot, name)
+
+def compile_binary_op(node):
+    factory = _BINARY_OPS.get(node.op)
+    if factory is None:
+        raise UslError(f'Unknown operator {node.op}')
+    return factory(compile_node(node.left), compile_node(node.right))
+
+def _and(left, right):
+    # Both operands are evaluated, matching interpreter.eval_binary_op
+    def and_op(env):
+        a = left(env)
+        b = right(env)
+        return a and b
+    return and_op
+
+def _or(left, right):
+    def or_op(env):
+        a = left(env)
+        b = right(env)
+        return a or b
+    return or_op
+
+_BINARY_OPS = {
+    'ADD': lambda l, r: lambda env: l(env) + r(env),
+    'SUB': lambda l, r: lambda env: l(env) - r(env),
+    'MUL': lambda l, r: lambda env: l(env) * r(env),
+    'DIV': lambda l, r: lambda env: l(env) / r(env),
+    'MOD': lambda l, r: lambda env: l(env) % r(env),
+    'EQ': lambda l, r: lambda env: l(env) == r(env),
+    'NEQ': lambda l, r: lambda env: l(env) != r(env),
+    'LT': lambda l, r: lambda env: l(env) < r(env),
+    'GT': lambda l, r: lambda env: l(env) > r(env),
+    'LE': lambda l, r: lambda env: l(env) <= r(env),
+    'GE': lambda l, r: lambda env: l(env) >= r(env),
+    'AND': _and,
+    'OR': _or,
+}
+
+def compile_unary_op(node):
+    expr = compile_node(node.expr)
+    if node.op == 'ADD':
+        return lambda env: +expr(env)
+    elif node.op == 'SUB':
+        return lambda env: -expr(env)
+    elif node.op == 'NOT':
+        return lambda env: not expr(env)
+    else:
+        raise UslError(f'Unknown operator {node.op}')
+
+def compile_assignment(node):
+    expression = compile_node(node.expression)
+    setters = [compile_target(target) for target in node.targets]
+    if len(setters) == 1:
+        setter = setters[0]
+        def assign(env):
+            setter(env, expression(env))
+    else:
+        def assign(env):
+            value = expression(env)
+            for setter in setters:
+                setter(env, value)
+    return assign
+
+def compile_target(target):
+    if isinstance(target, Identifier):
+        name, slot = target.name, target.slot
+        if slot is not None:
+            def set_local(env, value):
+                env.slots[slot] = value
+            return set_local
+        def set_name(env, value):
+            env.set_variable(name, value)
+        return set_name
+    elif isinstance(target, Attribute):
+        obj = compile_node(target.obj)
+        attr = target.attr
+        def set_attr(env, value):
+            setattr(obj(env), attr, value)
+        return set_attr
+    else:
+        raise UslError('Invalid assignment target')
+
+def compile_expression_statement(node):
+    return compile_node(node.expression)
+
+def compile_function_call(node):
+    if isinstance(node.func, Attribute):
+        return compile_method_call(node)
+    func = compile_node(node.func)
+    args = [compile_node(arg) for arg in node.arguments]
+    if len(args) == 0:
+        def call(env):
+            f = func(env)
+            if callable(f):
+                return f()
+            raise UslError(f'"{f}" is not a function')
+    elif len(args) == 1:
+        arg0 = args[0]
+        def call(env):
+            f = func(env)
+            a = arg0(env)
+            if callable(f):
+                return f(a)
+            raise UslError(f'"{f}" is not a function')
+    elif len(args) == 2:
+        arg0, arg1 = args
+        def call(env):
+            f = func(env)
+            a = arg0(env)
+            b = arg1(env)
+            if callable(f):
+                return f(a, b)
+            raise UslError(f'"{f}" is not a function')
+    else:
+        def call(env):
+            f = func(env)
+            values = [arg(env) for arg in args]
+            if callable(f):
+                return f(*values)
+            raise UslError(f'"{f}" is not a function')
+    return call
+
+def compile_method_call(node):
+    # obj.name(args) with a monomorphic inline cache keyed by the receiver's
+    # class; cache hits call the method without building a bound method
+    obj = compile_node(node.func.obj)
+    name = node.func.attr
+    args = [compile_node(arg) for arg in node.arguments]
+    cached_cls = cached_method = None
+    def method_call(env):
+        nonlocal cached_cls, cached_method
+        receiver = obj(env)
+        if type(receiver) is UslInstance and name not in receiver.attributes:
+            if receiver.cls is not cached_cls:
+                cached_cls = receiver.cls
+                cached_method = find_method(cached_cls, name)
+            if cached_method is not None:
+                return call_method(receiver, cached_method, [arg(env) for arg in args])
+        f = get_attribute(receiver, name)
+        values = [arg(env) for arg in args]
+        if callable(f):
+            return f(*values)
+        raise UslError(f'"{f}" is not a function')
+    return method_call
+
+def compile_function_def(node):
+    body = compile_node(node.body)
+    name, slot = node.name, node.slot
+    if slot is not None:
+        def define_local(env):
+            env.slots[slot] = CompiledFunction(node, env, body)
+        return define_local
+    def define(env):
+        env.define_function(name, CompiledFunction(node, env, body))
+    return define
+
+def compile_class_def(node):
+    body = compile_node(node.body)
+    name, slot = node.name, node.slot
+    def define(env):
+        class_env = Environment(env)
+        signal = body(class_env)
+        if signal is not None:
+            raise signal.error()
+        cls = UslClass(name, node, env, class_env.variables)
+        if slot is not None:
+            env.slots[slot] = cls
+        else:
+            env.define_variable(name, cls)
+    return define
+
+def compile_return(node):
+    if node.outside:
+        return compile_misplaced('"return" outside function')
+    if isinstance(node.expression, FunctionCall):
+        return compile_tail_call(node.expression)
+    expression = compile_node(node.expression) if node.expression else _noop
+    def return_(env):
+        return Completion('return', expression(env))
+    return return_
+
+def compile_tail_call(node):
+    # `return f(...)`: hand USL callees back to function_result as a 'tail'
+    # Completion instead of calling them from inside this frame
+    args = [compile_node(arg) for arg in node.arguments]
+    if isinstance(node.func, Attribute):
+        obj = compile_node(node.func.obj)
+        name = node.func.attr
+        cached_cls = cached_method = None
+        def tail_method_call(env):
+            nonlocal cached_cls, cached_method
+            receiver = obj(env)
+            if type(receiver) is UslInstance and name not in receiver.attributes:
+                if receiver.cls is not cached_cls:
+                    cached_cls = receiver.cls
+                    cached_method = find_method(cached_cls, name)
+                if cached_method is not None:
+                    values = method_arguments(cached_method, receiver, [arg(env) for arg in args])
+                    return Completion('tail', (cached_method, values))
+            return tail_result(get_attribute(receiver, name), [arg(env) for arg in args])
+        return tail_method_call
+    func = compile_node(node.func)
+    def tail_call(env):
+        return tail_result(func(env), [arg(env) for arg in args])
+    return tail_call
+
+def tail_result(f, values):
+    if isinstance(f, UslFunction):
+        f.check_arity(values)
+        return Completion('tail', (f, values))
+    if callable(f):
+        return Completion('return', f(*values))
+    raise UslError(f'"{f}" is not a function')
+
+def compile_if(node):
+    condition = compile_node(node.condition)
+    then_branch = compile_node(node.then_branch)
+    if node.else_branch:
+        else_branch = compile_node(node.else_branch)
+        def if_else(env):
+            if condition(env):
+                return then_branch(env)
+            return else_branch(env)
+        return if_else
+    def if_(env):
+        if condition(env):
+            return then_branch(env)
+    return if_
+
+def compile_while(node):
+    condition = compile_node(node.condition)
+    body = compile_node(node.body)
+    def while_(env):
+        while condition(env):
+            signal = body(env)
+            if signal is not None:
+                if signal is BREAK:
+                    break
+                elif signal is not CONTINUE:
+                    return signal
+    return while_
+
+def compile_for(node):
+    init = compile_node(node.init)
+    condition = compile_node(node.condition)
+    update = compile_node(node.update)
+    body = compile_node(node.body)
+    def for_(env):
+        init(env)
+        while condition(env):
+            signal = body(env)
+            if signal is not None:
+                if signal is BREAK:
+                    break
+                elif signal is not CONTINUE:
+                    return signal
+            update(env)
+    return for_
+
+def compile_for_in(node):
+    iterable = compile_node(node.iterable)
+    body = compile_node(node.body)
+    name, slot = node.target.name, node.target.slot
+    if slot is not None:
+        def for_in(env):
+            slots = env.slots
+            for item in iterate(iterable(env)):
+                slots[slot] = item
+                signal = body(env)
+                if signal is not None:
+                    if signal is BREAK:
+                        break
+                    elif signal is not CONTINUE:
+                        return signal
+    else:
+        def for_in(env):
+            variables = env.variables
+            for item in iterate(iterable(env)):
+                variables[name] = item
+                signal = body(env)
+                if signal is not None:
+                    if signal is BREAK:
+                        break
+                    elif signal is not CONTINUE:
+                        return signal
+    return for_in
+
+def compile_import(node):
+    name = node.module
+    store = compile_target(node.target)
+    def import_(env):
+        store(env, import_module(name))
+    return import_
+
+def compile_break(node):
+    if node.outside:
+        return compile_misplaced('"break" outside loop')
+    return lambda env: BREAK
+
+def compile_continue(node):
+    if node.outside:
+        return compile_misplaced('"continue" outside loop')
+    return lambda env: CONTINUE
+
+def compile_misplaced(message):
+    # A statement the resolver found outside its construct fails when it runs
+    def misplaced(env):
+        raise UslError(message)
+    return misplaced
+
+# Statements that can hand a Completion to the enclosing block
+_SIGNALLING = (ReturnStatement, BreakStatement, ContinueStatement, IfStatement,
+               WhileLoop, ForLoop, ForInLoop, Block)
+
+def compile_statements(nodes):
+    """Compile a statement sequence; also returns closure -> source line."""
+    statements = tuple(compile_node(stmt) for stmt in nodes)
+    return statements, {stmt: getattr(node, 'line', None) for stmt, node in zip(statements, nodes)}
+
+def compile_block(node):
+    statements, lines = compile_statements(node.statements)
+    if len(statements) == 1:
+        # Single statements get a wrapper too, so errors report their line
+        stmt = statements[0]
+        line = lines[stmt]
+        if not isinstance(node.statements[0], _SIGNALLING):
+            def block(env):
+                try:
+                    stmt(env)
+                except Exception as e:
+                    raise locate(e, line)
+        else:
+            def block(env):
+                try:
+                    return stmt(env)
+                except Exception as e:
+                    raise locate(e, line)
+    elif not any(isinstance(stmt, _SIGNALLING) for stmt in node.statements):
+        # Nothing in here can return, break or continue
+        def block(env):
+            try:
+                for stmt in statements:
+                    stmt(env)
+            except Exception as e:
+                raise locate(e, lines[stmt])
+    else:
+        def block(env):
+            try:
+                for stmt in statements:
+                    result = stmt(env)
+                    if result is not None and type(result) is Completion:
+                        return result
+            except Exception as e:
+                raise locate(e, lines[stmt])
+    return block
+
+def compile_statement_list(node):
+    statements, lines = compile_statements(node.statements)
+    def statement_list(env):
+        result = None
+        try:
+            for stmt in statements:
+                result = stmt(env)
+                if result is not None and type(result) is Completion:
+                    break
+        except Exception as e:
+            raise locate(e, lines[stmt])
+        if result is not None and type(result) is Completion:
+            raise result.error()
+        return result
+    return statement_list
+
+def compile_attribute(node):
+    obj = compile_node(node.obj)
+    attr = node.attr
+    cached_cls = cached_method = None
+    def attribute(env):
+        nonlocal cached_cls, cached_method
+        value = obj(env)
+        if type(value) is UslInstance and attr not in value.attributes:
+            if value.cls is not cached_cls:
+                cached_cls = value.cls
+                cached_method = find_method(cached_cls, attr)
+            if cached_method is not None:
+                return BoundMethod(value, cached_method)
+        return get_attribute(value, attr)
+    return attribute
+
+_COMPILERS = {
+    Number: compile_literal,
+    String: compile_literal,
+    Boolean: compile_literal,
+    NoneType: compile_literal,
+    Identifier: compile_identifier,
+    BinaryOp: compile_binary_op,
+    UnaryOp: compile_unary_op,
+    Assignment: compile_assignment,
+    ExpressionStatement: compile_expression_statement,
+    FunctionCall: compile_function_call,
+    FunctionDef: compile_function_def,
+    ClassDef: compile_class_def,
+    ReturnStatement: compile_return,
+    IfStatement: compile_if,
+    WhileLoop: compile_while,
+    ForLoop: compile_for,
+    ForInLoop: compile_for_in,
+    ImportStatement: compile_import,
+    BreakStatement: compile_break,
+    ContinueStatement: compile_continue,
+    Block: compile_block,
+    StatementList: compile_statement_list,
+    Attribute: compile_attribute,
+}
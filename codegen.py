@@ -0,0 +1,328 @@
+# codegen.py
+#
+# Transpiles USL source through its syntax tree. The program is parsed
+# with the real Parser, and the tree is lowered once into Nodes, each a
+# template kind with its operands already written out as text and its
+# nested blocks. Each target language then renders the Nodes in a single
+# pass from its `structure` templates. Nesting follows the templates: a
+# template line that is only "{}" is where a block goes, and the
+# statements of the block are indented by that line's indentation.
+#
+# A language's templates are compiled into Shapes, its Emitter, the first
+# time it is rendered. The Emitter is kept on the LanguageSyntax, so it
+# lives exactly as long as the SyntaxTable it was built from.
+#
+# Expressions are written in USL's own notation (and, or, not, True,
+# False): the template file does not say how any language spells them.
+
+from lexer import iter_tokens
+from parser import BINARY_PRECEDENCE, Parser
+from error import UslError
+from ast_nodes import (
+    Assignment, Attribute, Block, Boolean, BreakStatement, ClassDef, ContinueStatement,
+    ExpressionStatement, ForInLoop, ForLoop, FunctionCall, FunctionDef, Identifier,
+    IfStatement, ImportStatement, NoneType, Number, ReturnStatement, String, UnaryOp,
+    WhileLoop,
+)
+from syntax_registry import DEFAULT_TEMPLATES, INVALID_TEMPLATE, Formatter
+
+BINARY_SYMBOLS = {
+    "OR": "or", "AND": "and",
+    "EQ": "==", "NEQ": "!=", "LT": "<", "GT": ">", "LE": "<=", "GE": ">=",
+    "ADD": "+", "SUB": "-", "MUL": "*", "DIV": "/", "MOD": "%",
+}
+UNARY_SYMBOLS = {"NOT": "not ", "ADD": "+", "SUB": "-"}
+UNARY_PRECEDENCE = max(BINARY_PRECEDENCE.values()) + 1
+
+# Indentation of a block whose template has no line for it
+DEFAULT_INDENT = "    "
+
+# Which operand fills each field, for templates whose field count says
+# more than repeating the operands would: for (int i = 0; i < n; i++)
+OPERAND_ORDERS = {
+    ("loop", 4): (0, 0, 1, 0),
+}
+
+class Node:
+    __slots__ = ("kind", "operands", "blocks")
+
+    def __init__(self, kind, operands=(), blocks=()):
+        self.kind = kind  # a structure template key, or "line" or "note"
+        self.operands = operands  # strings for the template's fields
+        self.blocks = blocks  # lists of Nodes, one per nested block
+
+    def __repr__(self):
+        return f"Node({self.kind!r}, {self.operands!r}, {self.blocks!r})"
+
+# Lowering: syntax tree -> Nodes, once for every language
+
+def expression(node, precedence=0):
+    """USL text for an expression; parenthesised if it binds looser than precedence."""
+    kind = type(node)
+    if kind is Identifier:
+        return node.name
+    if kind is Number:
+        return repr(node.value)
+    if kind is String:
+        return '"' + node.value.encode("unicode_escape").decode("ascii").replace('"', '\\"') + '"'
+    if kind is Boolean:
+        return "True" if node.value else "False"
+    if kind is NoneType:
+        return "None"
+    if kind is Attribute:
+        return f"{expression(node.obj, UNARY_PRECEDENCE)}.{node.attr}"
+    if kind is FunctionCall:
+        arguments = ", ".join(expression(argument) for argument in node.arguments)
+        return f"{expression(node.func, UNARY_PRECEDENCE)}({arguments})"
+    if kind is UnaryOp:
+        text = UNARY_SYMBOLS[node.op] + expression(node.expr, UNARY_PRECEDENCE)
+        return f"({text})" if precedence > UNARY_PRECEDENCE else text
+    # BinaryOp: operators are left-associative, so a right operand of the
+    # same precedence needs parentheses and a left one does not
+    own = BINARY_PRECEDENCE[node.op]
+    text = f"{expression(node.left, own)} {BINARY_SYMBOLS[node.op]} {expression(node.right, own + 1)}"
+    return f"({text})" if own < precedence else text
+
+def lower_block(statements):
+    nodes = []
+    for statement in statements:
+        lower(statement, nodes)
+    return nodes
+
+def lower(statement, nodes):
+    """Append the Nodes for one statement to nodes."""
+    kind = type(statement)
+    if kind is ExpressionStatement:
+        value = statement.expression
+        if (type(value) is FunctionCall and type(value.func) is Identifier
+                and value.func.name == "print"):
+            nodes.append(Node("print", (", ".join(expression(a) for a in value.arguments),)))
+        else:
+            nodes.append(Node("line", (expression(value),)))
+    elif kind is Assignment:
+        target = ", ".join(expression(target) for target in statement.targets)
+        nodes.append(Node("assign", (target, expression(statement.expression))))
+    elif kind is FunctionDef:
+        nodes.append(Node("function", (statement.name, ", ".join(statement.params)),
+                          (lower_block(statement.body.statements),)))
+    elif kind is ClassDef:
+        # The class templates declare a constructor: __init__'s parameters
+        # and body go there, and the other members after it. No template
+        # has a base class, so the bases are kept as a note
+        if statement.bases:
+            header = f"class {statement.name} extends {', '.join(statement.bases)}"
+            nodes.append(Node("note", (f"Unsupported base class: {header}",)))
+        params, constructor, members = "", [], []
+        for member in statement.body.statements:
+            if type(member) is FunctionDef and member.name == "__init__":
+                params = ", ".join(member.params[1:])
+                constructor = lower_block(member.body.statements)
+            else:
+                lower(member, members)
+        nodes.append(Node("class", (statement.name, params), (constructor, members)))
+    elif kind is IfStatement:
+        nodes.append(Node("if", (expression(statement.condition),),
+                          (lower_block(statement.then_branch.statements),)))
+        branch = statement.else_branch
+        # else { if (...) {...} } is an elif, as far down as the chain goes
+        while branch is not None:
+            inner = branch.statements
+            if len(inner) == 1 and type(inner[0]) is IfStatement:
+                nodes.append(Node("elif", (expression(inner[0].condition),),
+                                  (lower_block(inner[0].then_branch.statements),)))
+                branch = inner[0].else_branch
+            else:
+                nodes.append(Node("else", (), (lower_block(inner),)))
+                branch = None
+    elif kind is WhileLoop:
+        nodes.append(Node("while", (expression(statement.condition),),
+                          (lower_block(statement.body.statements),)))
+    elif kind is ForInLoop:
+        # The loop templates count up to a bound: for (x in range(n)) fits
+        # them exactly. No template iterates over anything else, so any
+        # other loop is kept as a note with its body under it
+        iterable = statement.iterable
+        body = lower_block(statement.body.statements)
+        if (type(iterable) is FunctionCall and type(iterable.func) is Identifier
+                and iterable.func.name == "range" and len(iterable.arguments) == 1):
+            nodes.append(Node("loop", (statement.target.name, expression(iterable.arguments[0])),
+                              (body,)))
+        else:
+            loop = f"for ({statement.target.name} in {expression(iterable)})"
+            nodes.append(Node("note", (f"Unsupported loop: {loop}",), (body,)))
+    elif kind is ForLoop:
+        # No template has a C-style for; write it as its init, then a while
+        # loop whose body ends with the update, which also goes before
+        # every `continue` of this loop so that none skips it
+        if statement.init is not None:
+            lower(statement.init, nodes)
+        update = Node("line", (expression(statement.update),))
+        body = before_continue(lower_block(statement.body.statements), update)
+        body.append(update)
+        nodes.append(Node("while", (expression(statement.condition),), (body,)))
+    elif kind is ReturnStatement:
+        nodes.append(Node("return", (expression(statement.expression),)))
+    elif kind is ImportStatement:
+        nodes.append(Node("import", (statement.module,)))
+    elif kind is BreakStatement:
+        nodes.append(Node("break"))
+    elif kind is ContinueStatement:
+        nodes.append(Node("continue"))
+    elif kind is Block:
+        nodes.extend(lower_block(statement.statements))
+    else:
+        nodes.append(Node("note", (f"Unsupported statement: {kind.__name__}",)))
+
+def before_continue(nodes, update):
+    """nodes with update inserted before each continue that belongs to their loop."""
+    result = []
+    for node in nodes:
+        if node.kind == "continue":
+            result.append(update)
+        elif node.kind in ("if", "elif", "else"):
+            # Not into nested loops, functions or classes: their continues are their own
+            node.blocks = tuple(before_continue(block, update) for block in node.blocks)
+        result.append(node)
+    return result
+
+# Rendering: Nodes -> text, once per language
+
+class Shape:
+    """A structure template split into lines: text lines and block slots."""
+    __slots__ = ("lines", "arity", "slots", "extra_after", "extra_indent")
+
+    def __init__(self, template):
+        self.lines = []  # (Formatter, first field, field count) or (None, block slot, indent)
+        self.arity = 0  # fields outside block slots
+        self.slots = 0
+        # Blocks beyond the slots (a class's members after its constructor)
+        # go after line extra_after: the last indented line, at the
+        # indentation of the first one, so they stay inside the construct.
+        # A template without indented lines has them after its end
+        self.extra_after, self.extra_indent = None, DEFAULT_INDENT
+        for index, line in enumerate(template.split("\n")):
+            indent = line[:len(line) - len(line.lstrip())]
+            if line.strip() == "{}":
+                self.lines.append((None, self.slots, indent))
+                self.slots += 1
+            else:
+                formatter = Formatter(line)
+                self.lines.append((formatter, self.arity, formatter.arity))
+                self.arity += formatter.arity
+                if indent and line.strip():
+                    if self.extra_after is None:
+                        self.extra_indent = indent
+                    self.extra_after = index
+
+class Emitter:
+    """The templates of one language, compiled for rendering Nodes."""
+
+    def __init__(self, language):
+        self.language = language
+        self.shapes = {}  # kind -> Shape, or None for a template that cannot be rendered
+
+    def shape(self, kind):
+        try:
+            return self.shapes[kind]
+        except KeyError:
+            pass
+        shape = None
+        if kind in self.language.formatters or kind in DEFAULT_TEMPLATES:
+            formatter = self.language.formatter(kind)
+            if formatter.format is not None:
+                shape = Shape(formatter.template)
+        self.shapes[kind] = shape
+        return shape
+
+    def render(self, nodes, errors=()):
+        comment = self.language.comment
+        out = [comment.format(f"This is {self.language.name} syntax")]
+        for error in errors:
+            out.append(comment.format(f"Error: {error}"))
+        self.emit(nodes, "", out)
+        out.append("")
+        return "\n".join(out)
+
+    def emit(self, nodes, indent, out):
+        comment = self.language.comment
+        for node in nodes:
+            kind = node.kind
+            if kind == "line":
+                out.append(indent + node.operands[0])
+                continue
+            if kind == "note":
+                text = comment.format(*node.operands)
+            else:
+                shape = self.shape(kind)
+                if shape is not None:
+                    self.fill(shape, node, indent, out)
+                    continue
+                text = INVALID_TEMPLATE if kind in self.language.formatters else (
+                    comment.format(f"No {kind} template"))
+            out.extend(indent + line for line in text.split("\n"))
+            for block in node.blocks:
+                self.emit(block, indent + DEFAULT_INDENT, out)
+
+    def fill(self, shape, node, indent, out):
+        # Operands are repeated to fill every field and extras are dropped,
+        # as Formatter does for a whole template
+        values = node.operands
+        order = OPERAND_ORDERS.get((node.kind, shape.arity))
+        if order is not None and len(values) > max(order):
+            values = tuple(values[i] for i in order)
+        elif len(values) != shape.arity and values:
+            values = (values * shape.arity)[:shape.arity]
+        elif not values:
+            values = ("",) * shape.arity
+        blocks = node.blocks
+        extra = blocks[shape.slots:]  # blocks the template has no slot for
+        for index, (formatter, first, count) in enumerate(shape.lines):
+            if formatter is None:
+                if first < len(blocks):
+                    self.emit(blocks[first], indent + count, out)
+            else:
+                out.append(indent + formatter(*values[first:first + count]))
+            if index == shape.extra_after:
+                for block in extra:
+                    self.emit(block, indent + shape.extra_indent, out)
+        if shape.extra_after is None:
+            for block in extra:
+                self.emit(block, indent + DEFAULT_INDENT, out)
+
+def emitter_for(language):
+    """The Emitter of a syntax_registry.LanguageSyntax, compiled on first use."""
+    emitter = language.emitter
+    if emitter is None:
+        emitter = language.emitter = Emitter(language)
+    return emitter
+
+class CodeProgram:
+    """A parsed USL program, lowered for rendering in any language."""
+
+    def __init__(self, nodes, errors):
+        self.nodes = nodes
+        self.errors = errors  # syntax errors, as text; the statements around them are kept
+
+    def size(self):
+        """Number of Nodes, nested ones included."""
+        count, pending = 0, [self.nodes]
+        while pending:
+            nodes = pending.pop()
+            count += len(nodes)
+            for node in nodes:
+                pending.extend(node.blocks)
+        return count
+
+    def render(self, language):
+        return emitter_for(language).render(self.nodes, self.errors)
+
+def build_program(lines):
+    """Parse USL source lines and lower them, once for every language."""
+    parser = Parser(iter_tokens("\n".join(lines)), recover=True)
+    try:
+        tree = parser.parse()
+    except UslError as e:  # raised by the lexer, which ends the token stream
+        parser.errors.append(e)
+        tree = None
+    nodes = lower_block(tree.statements) if tree is not None else []
+    return CodeProgram(nodes, [str(error) for error in parser.errors])
@@ -1,26 +1,70 @@
 # environment.py
 
+from types import MappingProxyType
+
+class _Unset:
+    def __repr__(self):
+        return '<unset>'
+
+# Marks a local slot whose name has not been assigned yet
+UNSET = _Unset()
+
+# The names every program starts with live in one table shared by all root
+# environments, rather than being copied into each: it is built when the
+# first root environment is made and consulted when a lookup falls off the
+# root. Assigning one of these names at the top level shadows it in the root
+# scope; the table itself never changes.
+_builtins = None
+
+def builtins():
+    """The builtin table, as a read-only mapping."""
+    return MappingProxyType(_builtins if _builtins is not None else load_builtins())
+
+def load_builtins():
+    global _builtins
+    if _builtins is None:
+        from usl_builtins import built_in_functions
+        _builtins = {'None': None, 'True': True, 'False': False, **built_in_functions}
+    return _builtins
+
 class Environment:
-    def __init__(self, parent=None):
+    __slots__ = ('variables', 'parent', 'scope', 'slots')
+
+    def __init__(self, parent=None, scope=None):
         self.variables = {}
         self.parent = parent
-        if parent is None:
-            # Initialize built-in variables and functions
-            self.variables.update({
-                'None': None,
-                'True': True,
-                'False': False,
-            })
-            from usl_builtins import built_in_functions
-            self.variables.update(built_in_functions)
+        # Function frames resolved by resolver.py keep their locals in a
+        # list indexed by slot; everything else lives in the variables dict.
+        self.scope = scope
+        self.slots = [UNSET] * scope.size if scope is not None else None
+        if parent is None and _builtins is None:
+            load_builtins()  # every lookup ends at a root environment
 
     def get_variable(self, name):
-        if name in self.variables:
-            return self.variables[name]
-        elif self.parent:
-            return self.parent.get_variable(name)
-        else:
-            raise NameError(f'Undefined variable "{name}"')
+        env = self
+        while env is not None:
+            if name in env.variables:
+                return env.variables[name]
+            if env.scope is not None:
+                slot = env.scope.slots.get(name)
+                if slot is not None and env.slots[slot] is not UNSET:
+                    return env.slots[slot]
+            env = env.parent
+        if name in _builtins:
+            return _builtins[name]
+        raise NameError(f'Undefined variable "{name}"')
+
+    def lookup(self, depth, slot, name):
+        # Resolved lookup: hop `depth` frames up, then read the slot (or the
+        # dict when slot is None). Unassigned slots fall back to the dict path.
+        env = self
+        for _ in range(depth):
+            env = env.parent
+        if slot is not None:
+            value = env.slots[slot]
+            if value is not UNSET:
+                return value
+        return env.get_variable(name)
 
     def set_variable(self, name, value):
         self.variables[name] = value
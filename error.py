@@ -11,12 +11,21 @@ class UslError(Exception):
         else:
             return self.args[0]
 
-class UslReturn(Exception):
-    def __init__(self, value):
-        self.value = value
+def locate(error, line):
+    """Tag an error raised by the statement at `line` and return it.
 
-class UslBreak(Exception):
-    pass
-
-class UslContinue(Exception):
-    pass
+    The innermost statement wins: an error that already has a line is left
+    alone. Python errors (ZeroDivisionError, NameError, ...) are wrapped in a
+    UslError so they are reported against the source too.
+    """
+    if isinstance(error, UslError):
+        if error.line is None:
+            error.line = line
+        return error
+    message = str(error)
+    if isinstance(error, RecursionError):
+        # Same wording whichever Python frame hit the limit
+        message = 'Maximum recursion depth exceeded'
+    located = UslError(message, line)
+    located.__cause__ = error
+    return located
@@ -0,0 +1,228 @@
+# incremental.py
+#
+# Incremental re-parsing for editors. A Document keeps its source split into
+# top-level segments, one per top-level statement: a segment starts at the
+# first token of its statement and runs up to the start of the next one, so
+# comments and blank lines belong to the segment before them. An edit
+# re-lexes and re-parses only the segments it touches; every other
+# FunctionDef, ClassDef or statement subtree is reused as is.
+#
+# Segments after an edit move by a fixed number of characters and lines.
+# Rather than touching each of them, the move is kept as one pending shift
+# (first segment, offset delta, line delta), which further edits in the same
+# place simply add to. The shift is applied to the segments only when an
+# edit lands somewhere else. The line numbers inside a statement's subtree
+# are brought up to date only when that statement is read from `program`,
+# so neither typing nor reading the program afterwards costs more in a
+# 50,000-line file than in a 50-line one.
+
+import re
+from ast_nodes import iter_child_nodes
+from lexer import scan
+from parser import Parser, program_of
+from error import UslError
+
+class Segment:
+    __slots__ = ('start', 'line', 'column', 'node', 'error', 'synced')
+
+    def __init__(self, start, line, column, node, error=None):
+        self.start = start  # offset where re-lexing this segment begins
+        self.line = line
+        self.column = column
+        self.node = node  # the top-level statement, or None if it does not parse
+        self.error = error
+        self.synced = line  # the segment's line when node's line numbers were last right
+
+class Statements(list):
+    """A Document's top-level statement nodes. Each is read through
+    Document.statement, which first moves its line numbers by any shift
+    still pending for it."""
+    __slots__ = ('document',)
+
+    def __init__(self, document):
+        super().__init__()
+        self.document = document
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.document.statement(i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('statement index out of range')
+        return self.document.statement(index)
+
+    def __iter__(self):
+        statement = self.document.statement
+        for index in range(len(self)):
+            yield statement(index)
+
+class Document:
+    def __init__(self, text=''):
+        self.text = text
+        self.segments = []
+        self.statements = Statements(self)  # segment nodes, in order
+        self.pending = None  # (first segment, offset delta, line delta)
+        self.broken = 0  # segments holding a syntax error
+        try:
+            self.replace(0, 0, 0, 0, 0)
+        except UslError:
+            pass  # reported by `program` until an edit fixes it
+
+    @property
+    def program(self):
+        """The current StatementList; raises the first syntax error, if any.
+
+        Its statement list is the document's own, so it follows later
+        edits: read `program` again after editing.
+        """
+        if self.broken:
+            raise next(s.error for s in self.segments if s.node is None)
+        return program_of(self.statements)
+
+    def statement(self, index):
+        # The node of segment index, with its line numbers made current
+        segment = self.segments[index]
+        line = self.line_of(index)
+        if segment.synced != line:
+            shift_lines(segment.node, line - segment.synced)
+            segment.synced = line
+        return segment.node
+
+    def edit(self, offset, deleted, inserted):
+        """Replace `deleted` characters at `offset` with `inserted`.
+
+        Raises UslError if the edited statements no longer parse; the
+        document stays usable, and a later edit that fixes them clears it.
+        """
+        text = self.text
+        end = offset + deleted
+        if not 0 <= offset <= end <= len(text):
+            raise ValueError(f'Edit {offset}:{end} is outside the document (length {len(text)})')
+        if not self.segments:
+            self.text = text[:offset] + inserted + text[end:]
+            self.replace(0, 0, 0, 0, 0)
+            return
+        # The statement before the edit is re-parsed too, since text typed
+        # after it (an `else`, say) can extend it. Statements that start on
+        # the line where the edit ends are included because their columns move.
+        first = max(self.find(offset) - 1, 0)
+        last = self.find(end)
+        end_line = self.line_of(last) + text.count('\n', self.start_of(last), end)
+        while last + 1 < len(self.segments) and self.line_of(last + 1) == end_line:
+            last += 1
+        self.text = text[:offset] + inserted + text[end:]
+        self.replace(first, last, len(inserted) - deleted,
+                     self.start_of(first), inserted.count('\n') - text.count('\n', offset, end))
+
+    def replace(self, first, last, delta, start, lines):
+        # Re-parse segments first..last, whose text now starts at `start` and
+        # has grown by `delta` characters and `lines` lines, growing the
+        # region while a statement or string runs past its end.
+        segments = self.segments
+        if segments:
+            line, column = self.line_of(first), segments[first].column
+        else:
+            line, column = 1, 1
+        while True:
+            more = last + 1 < len(segments)
+            stop = self.start_of(last + 1) + delta if more else len(self.text)
+            try:
+                new = self.parse_region(start, stop, line, column, final=not more)
+            except UslError as e:
+                new = [Segment(start, line, column, None, e)]
+            if new is not None and (new or first or not more):
+                break
+            last += 1  # ran off the end of the region; take in the next statement
+        pending = self.pending
+        if pending and not first <= pending[0] <= last + 1:
+            self.flush()
+            pending = None
+        if pending:
+            delta += pending[1]
+            lines += pending[2]
+        if first == 0 and new:
+            new[0].start, new[0].line, new[0].column, new[0].synced = 0, 1, 1, 1
+        self.broken += (sum(s.node is None for s in new)
+                        - sum(s.node is None for s in segments[first:last + 1]))
+        segments[first:last + 1] = new
+        self.statements[first:last + 1] = [s.node for s in new]
+        after = first + len(new)
+        self.pending = (after, delta, lines) if after < len(segments) and (delta or lines) else None
+        for segment in new:
+            if segment.node is None:
+                raise segment.error
+
+    def parse_region(self, start, stop, line, column, final):
+        # Segments for text[start:stop], or None if the text runs on into
+        # the next segment (an unterminated string or statement)
+        region = self.text[start:stop]
+        scanner = scan(region, line, column - 1, final)
+        tokens = []
+        try:
+            while True:
+                tokens.append(next(scanner))
+        except StopIteration as stop_scan:
+            if stop_scan.value:
+                return None
+        newlines = [m.start() for m in re.finditer('\n', region)]
+        parser = Parser(tokens)
+        segments = []
+        while parser.current_token():
+            token = parser.current_token()
+            try:
+                stmt = parser.parse_statement()
+            except UslError:
+                if not final and parser.current_token() is None:
+                    return None
+                raise
+            if stmt is None:
+                continue
+            if token.line == line:
+                offset = start + token.column - column
+            else:
+                offset = start + newlines[token.line - line - 1] + token.column
+            segments.append(Segment(offset, token.line, token.column, stmt))
+        return segments
+
+    def find(self, offset):
+        # Index of the segment containing offset
+        lo, hi = 0, len(self.segments)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.start_of(mid) <= offset:
+                lo = mid + 1
+            else:
+                hi = mid
+        return max(lo - 1, 0)
+
+    def start_of(self, index):
+        pending = self.pending
+        if pending and index >= pending[0]:
+            return self.segments[index].start + pending[1]
+        return self.segments[index].start
+
+    def line_of(self, index):
+        pending = self.pending
+        if pending and index >= pending[0]:
+            return self.segments[index].line + pending[2]
+        return self.segments[index].line
+
+    def flush(self):
+        # Apply the pending shift to every segment it covers (but not to
+        # their nodes: see statement)
+        index, delta, lines = self.pending
+        for segment in self.segments[index:]:
+            segment.start += delta
+            segment.line += lines
+        self.pending = None
+
+def shift_lines(node, lines):
+    if node is None:
+        return
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        node.line += lines
+        node.end_line += lines
+        stack.extend(iter_child_nodes(node))
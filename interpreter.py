@@ -1,9 +1,31 @@
 # interpreter.py
 
+import operator
 from ast_nodes import *
-from environment import Environment
-from usl_builtins import built_in_functions
-from error import UslError, UslReturn, UslBreak, UslContinue
+from environment import Environment, UNSET
+from error import UslError, locate
+from modules import import_module
+
+# Statements report return/break/continue by returning a Completion instead
+# of raising; anything else a statement returns means "carry on". A
+# `return f(...)` of a USL function completes with kind 'tail' and value
+# (function, args): function_result makes the call after the caller's frame
+# is gone, so tail recursion runs in constant Python stack.
+class Completion:
+    __slots__ = ('kind', 'value')
+
+    def __init__(self, kind, value=None):
+        self.kind = kind
+        self.value = value
+
+    def error(self):
+        # Raised when a signal escapes the construct that should consume it
+        if self.kind in ('return', 'tail'):
+            return UslError('"return" outside function')
+        return UslError(f'"{self.kind}" outside loop')
+
+BREAK = Completion('break')
+CONTINUE = Completion('continue')
 
 def evaluate(node, env):
     if isinstance(node, Number):
@@ -15,11 +37,22 @@ def evaluate(node, env):
     elif isinstance(node, NoneType):
         return None
     elif isinstance(node, Identifier):
-        return env.get_variable(node.name)
+        if not node.depth:
+            # Unresolved, or resolved to the current environment
+            if node.slot is not None:
+                value = env.slots[node.slot]
+                if value is not UNSET:
+                    return value
+            return env.get_variable(node.name)
+        return env.lookup(node.depth, node.slot, node.name)
     elif isinstance(node, BinaryOp):
         left = evaluate(node.left, env)
         right = evaluate(node.right, env)
-        return eval_binary_op(node.op, left, right)
+        # eval_binary_op, inlined: this is the hottest path in most programs
+        operation = BINARY_OPERATORS.get(node.op)
+        if operation is None:
+            raise UslError(f'Unknown operator {node.op}')
+        return operation(left, right)
     elif isinstance(node, UnaryOp):
         expr = evaluate(node.expr, env)
         return eval_unary_op(node.op, expr)
@@ -27,7 +60,10 @@ def evaluate(node, env):
         value = evaluate(node.expression, env)
         for target in node.targets:
             if isinstance(target, Identifier):
-                env.set_variable(target.name, value)
+                if target.slot is not None:
+                    env.slots[target.slot] = value
+                else:
+                    env.set_variable(target.name, value)
             elif isinstance(target, Attribute):
                 obj = evaluate(target.obj, env)
                 setattr(obj, target.attr, value)
@@ -37,32 +73,32 @@ def evaluate(node, env):
     elif isinstance(node, ExpressionStatement):
         return evaluate(node.expression, env)
     elif isinstance(node, FunctionCall):
-        func = evaluate(node.func, env)
-        args = [evaluate(arg, env) for arg in node.arguments]
-        if callable(func):
-            return func(*args)
-        elif isinstance(func, FunctionDef):
-            func_env = Environment(func.env)
-            if len(args) != len(func.params):
-                raise UslError(f'Function "{func.name}" expected {len(func.params)} arguments, got {len(args)}')
-            for param, arg in zip(func.params, args):
-                func_env.set_variable(param, arg)
-            try:
-                evaluate(func.body, func_env)
-            except UslReturn as ret:
-                return ret.value
-            return None
-        else:
-            raise UslError(f'"{func}" is not a function')
+        func, args = evaluate_call(node, env)
+        if isinstance(func, UslFunction):
+            return func.invoke(args)
+        return func(*args)
     elif isinstance(node, FunctionDef):
-        node.env = env
-        env.define_function(node.name, node)
+        func = UslFunction(node, env)
+        if node.slot is not None:
+            env.slots[node.slot] = func
+        else:
+            env.define_function(node.name, func)
     elif isinstance(node, ClassDef):
         cls = UslClass(node.name, node, env)
-        env.define_variable(node.name, cls)
+        if node.slot is not None:
+            env.slots[node.slot] = cls
+        else:
+            env.define_variable(node.name, cls)
     elif isinstance(node, ReturnStatement):
+        if node.outside:
+            raise UslError('"return" outside function')
+        if type(node.expression) is FunctionCall:
+            func, args = evaluate_call(node.expression, env)
+            if isinstance(func, UslFunction):
+                return Completion('tail', (func, args))
+            return Completion('return', func(*args))
         value = evaluate(node.expression, env) if node.expression else None
-        raise UslReturn(value)
+        return Completion('return', value)
     elif isinstance(node, IfStatement):
         condition = evaluate(node.condition, env)
         if condition:
@@ -71,94 +107,251 @@ def evaluate(node, env):
             return evaluate(node.else_branch, env)
     elif isinstance(node, WhileLoop):
         while evaluate(node.condition, env):
-            try:
-                evaluate(node.body, env)
-            except UslBreak:
-                break
-            except UslContinue:
-                continue
-            except UslReturn as ret:
-                raise ret
+            signal = evaluate(node.body, env)
+            if signal is not None:
+                if signal is BREAK:
+                    break
+                elif signal is not CONTINUE:
+                    return signal
     elif isinstance(node, ForLoop):
         evaluate(node.init, env)
         while evaluate(node.condition, env):
-            try:
-                evaluate(node.body, env)
-                evaluate(node.update, env)
-            except UslBreak:
-                break
-            except UslContinue:
-                evaluate(node.update, env)
-                continue
-            except UslReturn as ret:
-                raise ret
+            signal = evaluate(node.body, env)
+            if signal is not None:
+                if signal is BREAK:
+                    break
+                elif signal is not CONTINUE:
+                    return signal
+            evaluate(node.update, env)
+    elif isinstance(node, ForInLoop):
+        target = node.target
+        for item in iterate(evaluate(node.iterable, env)):
+            if target.slot is not None:
+                env.slots[target.slot] = item
+            else:
+                env.set_variable(target.name, item)
+            signal = evaluate(node.body, env)
+            if signal is not None:
+                if signal is BREAK:
+                    break
+                elif signal is not CONTINUE:
+                    return signal
     elif isinstance(node, BreakStatement):
-        raise UslBreak()
+        if node.outside:
+            raise UslError('"break" outside loop')
+        return BREAK
     elif isinstance(node, ContinueStatement):
-        raise UslContinue()
+        if node.outside:
+            raise UslError('"continue" outside loop')
+        return CONTINUE
     elif isinstance(node, Block):
-        for stmt in node.statements:
-            result = evaluate(stmt, env)
-            if isinstance(stmt, ReturnStatement):
-                return result
+        try:
+            for stmt in node.statements:
+                result = evaluate(stmt, env)
+                if result is not None and type(result) is Completion:
+                    return result
+        except Exception as e:
+            raise locate(e, getattr(stmt, 'line', None))
         return None
     elif isinstance(node, StatementList):
-        for stmt in node.statements:
-            result = evaluate(stmt, env)
+        result = None
+        try:
+            for stmt in node.statements:
+                result = evaluate(stmt, env)
+                if result is not None and type(result) is Completion:
+                    break
+        except Exception as e:
+            raise locate(e, getattr(stmt, 'line', None))
+        if result is not None and type(result) is Completion:
+            raise result.error()
         return result
     elif isinstance(node, Attribute):
         obj = evaluate(node.obj, env)
-        if hasattr(obj, node.attr):
-            return getattr(obj, node.attr)
-        elif isinstance(obj, UslInstance):
-            return getattr(obj, node.attr)
+        if type(obj) is UslInstance and node.attr not in obj.attributes:
+            cache = node.cache
+            if cache is None or cache[0] is not obj.cls:
+                cache = node.cache = (obj.cls, find_method(obj.cls, node.attr))
+            if cache[1] is not None:
+                return BoundMethod(obj, cache[1])
+        return get_attribute(obj, node.attr)
+    elif isinstance(node, ImportStatement):
+        module = import_module(node.module)
+        target = node.target
+        if target.slot is not None:
+            env.slots[target.slot] = module
         else:
-            raise UslError(f'Attribute "{node.attr}" not found')
+            env.set_variable(target.name, module)
     else:
         raise UslError('Unknown AST node')
 
+# Numbers are Python ints and floats: int op int stays int (exact at any
+# size) except for '/', which always gives a float, and any float operand
+# promotes the result to float. The operator module's C functions dispatch
+# on the operand types themselves, so each call takes Python's own int/int,
+# float/float or mixed path with no Python-level type checks.
+BINARY_OPERATORS = {
+    'ADD': operator.add,
+    'SUB': operator.sub,
+    'MUL': operator.mul,
+    'DIV': operator.truediv,
+    'MOD': operator.mod,
+    'EQ': operator.eq,
+    'NEQ': operator.ne,
+    'LT': operator.lt,
+    'GT': operator.gt,
+    'LE': operator.le,
+    'GE': operator.ge,
+    # Both operands have already been evaluated
+    'AND': lambda left, right: left and right,
+    'OR': lambda left, right: left or right,
+}
+
+UNARY_OPERATORS = {
+    'ADD': operator.pos,
+    'SUB': operator.neg,
+    'NOT': operator.not_,
+}
+
 def eval_binary_op(op, left, right):
-    if op == 'ADD':
-        return left + right
-    elif op == 'SUB':
-        return left - right
-    elif op == 'MUL':
-        return left * right
-    elif op == 'DIV':
-        return left / right
-    elif op == 'MOD':
-        return left % right
-    elif op == 'EQ':
-        return left == right
-    elif op == 'NEQ':
-        return left != right
-    elif op == 'LT':
-        return left < right
-    elif op == 'GT':
-        return left > right
-    elif op == 'LE':
-        return left <= right
-    elif op == 'GE':
-        return left >= right
-    elif op == 'AND':
-        return left and right
-    elif op == 'OR':
-        return left or right
-    else:
+    operation = BINARY_OPERATORS.get(op)
+    if operation is None:
         raise UslError(f'Unknown operator {op}')
+    return operation(left, right)
 
 def eval_unary_op(op, expr):
-    if op == 'ADD':
-        return +expr
-    elif op == 'SUB':
-        return -expr
-    elif op == 'NOT':
-        return not expr
-    else:
+    operation = UNARY_OPERATORS.get(op)
+    if operation is None:
         raise UslError(f'Unknown operator {op}')
+    return operation(expr)
+
+def evaluate_call(node, env):
+    """Evaluate a FunctionCall's callee and arguments without calling it.
+
+    Returns (function, args). A USL function or method comes back with its
+    arity checked and, for methods, the receiver prepended, ready for
+    invoke(); any other callable is returned as-is.
+    """
+    func_node = node.func
+    if type(func_node) is Attribute:
+        # Method call: look the method up through this call site's cache
+        # instead of building a bound method
+        obj = evaluate(func_node.obj, env)
+        if type(obj) is UslInstance and func_node.attr not in obj.attributes:
+            cache = node.cache
+            if cache is None or cache[0] is not obj.cls:
+                cache = node.cache = (obj.cls, find_method(obj.cls, func_node.attr))
+            if cache[1] is not None:
+                args = [evaluate(arg, env) for arg in node.arguments]
+                return cache[1], method_arguments(cache[1], obj, args)
+        func = get_attribute(obj, func_node.attr)
+    else:
+        func = evaluate(func_node, env)
+    args = [evaluate(arg, env) for arg in node.arguments]
+    if isinstance(func, UslFunction):
+        func.check_arity(args)
+    elif not callable(func):
+        raise UslError(f'"{func}" is not a function')
+    return func, args
+
+def function_result(signal):
+    # Turn the Completion a function body finished with into its return
+    # value, running any tail calls it hands back
+    while signal is not None:
+        if signal.kind == 'return':
+            return signal.value
+        if signal.kind != 'tail':
+            raise signal.error()
+        func, args = signal.value
+        signal = func.execute(func.make_frame(args))
+    return None
+
+def iterate(value):
+    # Iterators are consumed lazily, one item per loop iteration
+    try:
+        return iter(value)
+    except TypeError:
+        raise UslError(f'"{value}" is not iterable') from None
+
+def get_attribute(obj, name):
+    try:
+        return getattr(obj, name)
+    except AttributeError:
+        if isinstance(obj, UslInstance):
+            raise
+        raise UslError(f'Attribute "{name}" not found') from None
+
+def find_method(cls, name):
+    # The function obj.name binds for instances of cls, or None when the
+    # name is missing or holds a plain value
+    method = cls.method_table.get(name)
+    return method if isinstance(method, UslFunction) else None
+
+def method_arguments(method, instance, args):
+    expected_args = len(method.params) - 1  # Exclude 'self'
+    if len(args) != expected_args:
+        raise UslError(f'Method "{method.name}" expected {expected_args} arguments, got {len(args)}')
+    return (instance, *args)
+
+def call_method(instance, method, args):
+    return method.invoke(method_arguments(method, instance, args))
+
+def linearize(cls):
+    """C3 linearisation of cls and its bases, most derived first."""
+    sequences = [list(base.mro) for base in cls.bases] + [list(cls.bases)]
+    mro = [cls]
+    while True:
+        sequences = [seq for seq in sequences if seq]
+        if not sequences:
+            return mro
+        for seq in sequences:
+            head = seq[0]
+            if not any(head in other[1:] for other in sequences):
+                break
+        else:
+            raise UslError(f'Cannot create a consistent method order for class "{cls.name}"')
+        mro.append(head)
+        for seq in sequences:
+            if seq[0] is head:
+                del seq[0]
+
+class UslFunction:
+    def __init__(self, func_def, env):
+        self.name = func_def.name
+        self.params = func_def.params
+        self.func_def = func_def
+        self.scope = func_def.scope
+        self.env = env
+
+    def __call__(self, *args):
+        self.check_arity(args)
+        return self.invoke(args)
+
+    def check_arity(self, args):
+        if len(args) != len(self.params):
+            raise UslError(f'Function "{self.name}" expected {len(self.params)} arguments, got {len(args)}')
+
+    def make_frame(self, args):
+        # Arity has already been checked by the caller
+        scope = self.scope
+        if scope is None:
+            func_env = Environment(self.env)
+            for param, arg in zip(self.params, args):
+                func_env.set_variable(param, arg)
+        else:
+            # Resolved function: parameters occupy the first slots
+            func_env = Environment(self.env, scope)
+            func_env.slots[:len(args)] = args
+        return func_env
+
+    def execute(self, frame):
+        # Run the body in a prepared frame and return its Completion, if any
+        return evaluate(self.func_def.body, frame)
+
+    def invoke(self, args):
+        return function_result(self.execute(self.make_frame(args)))
 
 class UslClass:
-    def __init__(self, name, class_def, env):
+    def __init__(self, name, class_def, env, methods=None):
         self.name = name
         self.class_def = class_def
         self.env = env
@@ -166,36 +359,37 @@ class UslClass:
         self.bases = []
         for base_name in class_def.bases:
             base = env.get_variable(base_name)
+            if not isinstance(base, UslClass):
+                raise UslError(f'Base "{base_name}" of class "{name}" is not a class')
             self.bases.append(base)
-        self.initialize_class()
+        if methods is None:
+            self.initialize_class()
+        else:
+            # The class body has already been executed by another engine
+            self.methods = methods
+        # Classes are immutable once built, so the full lookup order and a
+        # flattened name -> member table are computed once here
+        self.mro = linearize(self)
+        self.method_table = {}
+        for cls in reversed(self.mro):
+            self.method_table.update(cls.methods)
 
     def initialize_class(self):
         class_env = Environment(self.env)
-        evaluate(self.class_def.body, class_env)
+        signal = evaluate(self.class_def.body, class_env)
+        if signal is not None:
+            raise signal.error()
         self.methods = class_env.variables
 
     def __call__(self, *args, **kwargs):
         instance = UslInstance(self)
-        init_method = self.methods.get('__init__')
-        if not init_method:
-            # Check base classes for __init__
-            for base in self.bases:
-                init_method = base.methods.get('__init__')
-                if init_method:
-                    break
+        init_method = self.method_table.get('__init__')
         if init_method:
-            func_env = Environment(init_method.env)
-            func_env.set_variable('self', instance)
-            if isinstance(init_method, FunctionDef):
+            if isinstance(init_method, UslFunction):
                 expected_args = len(init_method.params) - 1  # Exclude 'self'
                 if len(args) != expected_args:
                     raise UslError(f'__init__ expected {expected_args} arguments, got {len(args)}')
-                for param, arg in zip(init_method.params[1:], args):  # Skip 'self'
-                    func_env.set_variable(param, arg)
-                try:
-                    evaluate(init_method.body, func_env)
-                except UslReturn:
-                    pass
+                init_method.invoke((instance,) + args)
             else:
                 raise UslError('__init__ is not a function')
         return instance
@@ -210,21 +404,13 @@ class UslInstance:
     def __getattr__(self, name):
         if name in self.attributes:
             return self.attributes[name]
-        if name in self.cls.methods:
-            method = self.cls.methods[name]
-            if isinstance(method, FunctionDef):
+        method_table = self.cls.method_table
+        if name in method_table:
+            method = method_table[name]
+            if isinstance(method, UslFunction):
                 return self.bind_method(method)
             else:
                 return method
-        # Search in base classes
-        for base in self.cls.bases:
-            if isinstance(base, UslClass):
-                if name in base.methods:
-                    method = base.methods[name]
-                    if isinstance(method, FunctionDef):
-                        return self.bind_method(method)
-                    else:
-                        return method
         raise AttributeError(f"'{self.cls.name}' object has no attribute '{name}'")
 
     def __setattr__(self, name, value):
@@ -234,16 +420,14 @@ class UslInstance:
             self.attributes[name] = value
 
     def bind_method(self, method):
-        def bound_method(*args):
-            func_env = Environment(self.cls.env)
-            func_env.set_variable('self', self)
-            expected_args = len(method.params) - 1  # Exclude 'self'
-            if len(args) != expected_args:
-                raise UslError(f'Method "{method.name}" expected {expected_args} arguments, got {len(args)}')
-            for param, arg in zip(method.params[1:], args):  # Skip 'self' in params
-                func_env.set_variable(param, arg)
-            try:
-                evaluate(method.body, func_env)
-            except UslReturn as ret:
-                return ret.value
-        return bound_method
+        return BoundMethod(self, method)
+
+class BoundMethod:
+    __slots__ = ('instance', 'method')
+
+    def __init__(self, instance, method):
+        self.instance = instance
+        self.method = method
+
+    def __call__(self, *args):
+        return call_method(self.instance, self.method, args)
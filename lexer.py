@@ -4,36 +4,52 @@ import re
 from error import UslError
 
 class Token:
-    def __init__(self, type_, value, line):
+    __slots__ = ('type', 'value', 'line', 'column')
+
+    def __init__(self, type_, value, line, column=None):
         self.type = type_
         self.value = value
         self.line = line
+        self.column = column
 
     def __repr__(self):
         return f'Token({self.type}, {self.value}, line {self.line})'
 
+    def end(self):
+        # (line, column) just past the token; only strings can span lines
+        if self.type == 'STRING' and '\n' in self.value:
+            return self.line + self.value.count('\n'), len(self.value) - self.value.rfind('\n')
+        return self.line, self.column + len(self.value)
+
+# Keywords are matched as IDENT and then classified with one dict lookup,
+# instead of trying a \bkeyword\b alternative for every identifier
+KEYWORDS = {
+    'def': 'DEF',
+    'class': 'CLASS',
+    'extends': 'EXTENDS',
+    'return': 'RETURN',
+    'if': 'IF',
+    'else': 'ELSE',
+    'for': 'FOR',
+    'while': 'WHILE',
+    'break': 'BREAK',
+    'continue': 'CONTINUE',
+    'in': 'IN',
+    'import': 'IMPORT',
+    'not': 'NOT',
+    'and': 'AND',
+    'or': 'OR',
+    'True': 'TRUE',
+    'False': 'FALSE',
+}
+
 TOKEN_SPEC = [
-    ('COMMENT',  r'\#.*'),                   # Comments
-    ('NEWLINE',  r'\n'),                     # Line endings
+    ('IDENT',    r'[A-Za-z_]\w*'),           # Identifiers and keywords
     ('SKIP',     r'[ \t]+'),                 # Skip spaces and tabs
-    ('STRING',   r'"([^"\\]|\\.)*"'),        # String literal with escape sequences
+    ('NEWLINE',  r'\n'),                     # Line endings
     ('NUMBER',   r'\d+(\.\d*)?'),            # Integer or decimal number
-    ('DEF',      r'\bdef\b'),                # Function definition
-    ('CLASS',    r'\bclass\b'),              # Class definition
-    ('EXTENDS',  r'\bextends\b'),            # Inheritance keyword
-    ('RETURN',   r'\breturn\b'),             # Return keyword
-    ('IF',       r'\bif\b'),                 # If keyword
-    ('ELSE',     r'\belse\b'),               # Else keyword
-    ('FOR',      r'\bfor\b'),                # For keyword
-    ('WHILE',    r'\bwhile\b'),              # While keyword
-    ('BREAK',    r'\bbreak\b'),              # Break keyword
-    ('CONTINUE', r'\bcontinue\b'),           # Continue keyword
-    ('IN',       r'\bin\b'),                 # In keyword
-    ('NOT',      r'\bnot\b'),                # Not keyword
-    ('AND',      r'\band\b'),                # And keyword
-    ('OR',       r'\bor\b'),                 # Or keyword
-    ('TRUE',     r'\bTrue\b'),               # True keyword
-    ('FALSE',    r'\bFalse\b'),              # False keyword
+    ('STRING',   r'"([^"\\]|\\.)*"'),        # String literal with escape sequences
+    ('COMMENT',  r'\#.*'),                   # Comments
     ('EQ',       r'=='),                     # Equal operator
     ('NEQ',      r'!='),                     # Not equal operator
     ('LE',       r'<='),                     # Less than or equal to
@@ -53,31 +69,82 @@ TOKEN_SPEC = [
     ('SEMICOLON',r';'),                      # Semicolon
     ('COMMA',    r','),                      # Comma separator
     ('DOT',      r'\.'),                     # Dot operator
-    ('IDENT',    r'[A-Za-z_]\w*'),           # Identifiers
     ('MISMATCH', r'.'),                      # Any other character
 ]
 
 token_regex = '|'.join('(?P<%s>%s)' % pair for pair in TOKEN_SPEC)
-get_token = re.compile(token_regex).match
+scan_tokens = re.compile(token_regex).finditer
+# The rest of a string literal after its opening quote, up to the closing
+# quote or the end of the text
+string_body = re.compile(r'[^"\\]*(?:\\.[^"\\]*)*').match
 
 def tokenize(code):
-    line_num = 1
-    pos = 0
-    tokens = []
-    while pos < len(code):
-        mo = get_token(code, pos)
-        if mo:
-            kind = mo.lastgroup
-            value = mo.group(kind)
-            if kind == 'NEWLINE':
-                line_num += 1
-            elif kind == 'SKIP' or kind == 'COMMENT':
-                pass
-            elif kind == 'MISMATCH':
-                raise UslError(f'Unexpected character {value!r}', line_num)
-            else:
-                tokens.append(Token(kind, value, line_num))
-            pos = mo.end()
+    """Return the list of tokens in a source string."""
+    return list(iter_tokens(code))
+
+def iter_tokens(source):
+    """Yield tokens lazily from a source string or a text stream.
+
+    A stream is read a line at a time, so Parser(iter_tokens(f)) never
+    holds more than the current line and the parser's lookahead.
+    """
+    if isinstance(source, str):
+        yield from scan(source, 1, 0, True)
+        return
+    parts, line_num, column = [], 1, 0  # parts: an unterminated string so far
+    for line in source:
+        if parts:
+            # Look for the string's end in this line alone rather than
+            # rescanning all of it, so a string that never closes stays linear
+            end = string_body(line).end()
+            parts.append(line)
+            if end == len(line):
+                continue
+            # A backslash ending the line, instead of a quote, means the
+            # string can never close; the final scan reports it
+            final = line[end] != '"'
+            line = ''.join(parts)
+            parts = []
+        else:
+            final = False
+        # scan returns the tail of an unterminated string, which may close on a later line
+        pending = yield from scan(line, line_num, column, final)
+        if pending:
+            start = len(line) - len(pending)
+            line_num += line.count('\n', 0, start)
+            column = start - line.rfind('\n', 0, start) - 1
+            if string_body(pending, 1).end() < len(pending):
+                yield from scan(pending, line_num, column, True)
+            parts = [pending]
+        else:
+            line_num += line.count('\n')
+            column = 0
+    if parts:
+        yield from scan(''.join(parts), line_num, column, True)
+
+def scan(text, line_num, column, final):
+    # Tokenize text whose first character is at (line_num, column + 1).
+    # Unless final, an unterminated string stops the scan and is returned.
+    line_start = -column
+    for mo in scan_tokens(text):
+        kind = mo.lastgroup
+        if kind == 'IDENT':
+            value = mo.group()
+            yield Token(KEYWORDS.get(value, 'IDENT'), value, line_num, mo.start() - line_start + 1)
+        elif kind == 'SKIP' or kind == 'COMMENT':
+            pass
+        elif kind == 'NEWLINE':
+            line_num += 1
+            line_start = mo.end()
+        elif kind == 'MISMATCH':
+            value = mo.group()
+            if value == '"' and not final:
+                return text[mo.start():]
+            raise UslError(f'Unexpected character {value!r}', line_num)
         else:
-            raise UslError(f'Unexpected character {code[pos]!r}', line_num)
-    return tokens
+            value = mo.group()
+            yield Token(kind, value, line_num, mo.start() - line_start + 1)
+            if kind == 'STRING' and '\n' in value:
+                line_num += value.count('\n')
+                line_start = mo.start() + value.rfind('\n') + 1
+    return ''
@@ -0,0 +1,155 @@
+# loadtest.py
+#
+# Load test for the web app's /process: concurrent clients each post
+# requests back to back, and the latency percentiles and throughput of the
+# whole run are reported.
+#
+#     python loadtest.py                            # starts serve.py on a free port
+#     python loadtest.py --url http://host:10000    # a server already running
+#     python loadtest.py --clients 16 --requests 400 --lines 1000 --vary
+
+import argparse
+import http.client
+import json
+import os
+import secrets
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+
+from benchmark import percentile, report, symbolic_program
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def start_server(args):
+    port = free_port()
+    command = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'serve.py'),
+               '--host', '127.0.0.1', '--port', str(port)]
+    if args.workers:
+        command += ['--workers', str(args.workers)]
+    server = subprocess.Popen(command, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return server, f'http://127.0.0.1:{port}'
+        except OSError:
+            if server.poll() is not None:
+                break
+            time.sleep(0.1)
+    server.kill()
+    raise SystemExit('serve.py did not start')
+
+def form_body(source, languages, upload):
+    """The body and content type of a /process request."""
+    if not upload:
+        body = urllib.parse.urlencode({'usl_code': source, 'languages': languages}, doseq=True)
+        return body.encode('utf-8'), 'application/x-www-form-urlencoded'
+    boundary = secrets.token_hex(16)
+    parts = [f'--{boundary}\r\nContent-Disposition: form-data; name="languages"\r\n\r\n{lang}\r\n'
+             for lang in languages]
+    parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="usl_file"; filename="input.usl"\r\n'
+                 f'Content-Type: text/plain\r\n\r\n{source}\r\n--{boundary}--\r\n')
+    return ''.join(parts).encode('utf-8'), f'multipart/form-data; boundary={boundary}'
+
+def client(url, bodies, content_type, latencies, statuses, lock):
+    # One connection, kept alive, posting each body in turn
+    target = urllib.parse.urlsplit(url)
+    connection = http.client.HTTPConnection(target.hostname, target.port, timeout=120)
+    headers = {'Content-Type': content_type}
+    for body in bodies:
+        start = time.perf_counter()
+        try:
+            connection.request('POST', '/process', body, headers)
+            response = connection.getresponse()
+            response.read()
+            status = response.status
+        except (OSError, http.client.HTTPException):
+            connection.close()
+            status = 'failed'
+        elapsed = time.perf_counter() - start
+        with lock:
+            statuses[status] = statuses.get(status, 0) + 1
+            if status == 200:
+                latencies.append(elapsed)
+    connection.close()
+
+def fetch_languages(url):
+    target = urllib.parse.urlsplit(url)
+    connection = http.client.HTTPConnection(target.hostname, target.port, timeout=30)
+    try:
+        connection.request('GET', '/languages')
+        return json.loads(connection.getresponse().read())
+    finally:
+        connection.close()
+
+def run(url, args):
+    languages = fetch_languages(url) if args.languages == 'all' else args.languages.split(',')
+    source = symbolic_program(args.lines)
+    # Without --vary every request sends the same input, so after the first
+    # one the transpile cache answers
+    if args.vary:
+        bodies = [form_body(f'{source}Symbolic: comment "request {n}"\n', languages, args.upload)
+                  for n in range(args.requests)]
+    else:
+        bodies = [form_body(source, languages, args.upload)] * args.requests
+    content_type = bodies[0][1]
+    bodies = [body for body, _ in bodies]
+    latencies, statuses, lock = [], {}, threading.Lock()
+    threads = [threading.Thread(target=client, args=(url, bodies[i::args.clients], content_type,
+                                                     latencies, statuses, lock))
+               for i in range(args.clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    print(f'{args.requests} requests from {args.clients} clients, {args.lines} input lines, '
+          f'{len(languages)} languages, {len(bodies[0]) // 1024} KB per request')
+    rows = [['requests/s', f'{statuses.get(200, 0) / elapsed:.1f}']]
+    if latencies:
+        for name, fraction in (('p50', 0.5), ('p90', 0.9), ('p99', 0.99)):
+            rows.append([name, f'{percentile(latencies, fraction) * 1000:.1f} ms'])
+        rows.append(['max', f'{max(latencies) * 1000:.1f} ms'])
+    for status, count in sorted(statuses.items(), key=str):
+        rows.append([f'status {status}', count])
+    report(rows, ['', ''])
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='loadtest', description='Load test the web app\'s /process.')
+    parser.add_argument('--url', help='server to test (default: start serve.py on a free port)')
+    parser.add_argument('--workers', type=int, help='worker processes of the serve.py started')
+    parser.add_argument('--clients', type=int, default=8, help='concurrent clients (default 8)')
+    parser.add_argument('--requests', type=int, default=200, help='requests in all (default 200)')
+    parser.add_argument('--lines', type=int, default=100, help='input lines per request (default 100)')
+    parser.add_argument('--languages', default='all',
+                        help='comma-separated languages, or all (the default)')
+    parser.add_argument('--upload', action='store_true', help='send the input as a file upload')
+    parser.add_argument('--vary', action='store_true',
+                        help='make every request\'s input different, so none is served from the cache')
+    args = parser.parse_args(argv)
+    if args.clients < 1 or args.requests < 1:
+        parser.error('--clients and --requests must be at least 1')
+
+    server = None
+    url = args.url
+    if url is None:
+        server, url = start_server(args)
+    try:
+        run(url.rstrip('/'), args)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,111 @@
+# modules.py
+#
+# Running programs, and the module system behind `import`.
+#
+# `import a.b;` binds b to the Module for "a.b". Modules live in one
+# process-wide registry, so every importer shares a single Module: its
+# source is parsed once (through the .uslc cache), executed once, and its
+# global Environment serves every attribute read. Nothing is loaded at the
+# import statement beyond checking that the module exists; the first
+# attribute read runs it. A module that is read while it is still running,
+# because its own top-level code led back to it, is an import cycle and
+# raises UslError. Reads from inside functions happen after loading, so
+# modules may still refer to each other that way.
+#
+# Names resolve to the standard library in native_modules.py first, then to
+# <dir>/a/b.usl for each dir on search_path.
+
+import os
+from environment import Environment
+from error import UslError
+
+ENGINES = ('tree', 'closure', 'vm')
+
+def run(ast, env, engine='tree'):
+    """Execute a resolved program in env with the given engine."""
+    if engine == 'closure':
+        from closure_compiler import compile_program
+        return compile_program(ast)(env)
+    if engine == 'vm':
+        from bytecode import compile_program
+        from vm import execute
+        return execute(compile_program(ast), env)
+    from interpreter import evaluate
+    return evaluate(ast, env)
+
+# How imported modules are found and run; main.py sets these from its
+# arguments, with the script's own directory first on the path
+search_path = [os.curdir] + [p for p in os.environ.get('USL_PATH', '').split(os.pathsep) if p]
+engine = 'tree'
+opt_level = 1
+use_cache = True
+
+registry = {}  # dotted name -> Module
+loading = []  # names of the modules being executed, outermost first
+
+class Module:
+    __slots__ = ('_name', '_path', '_namespace')
+
+    def __init__(self, name, path):
+        object.__setattr__(self, '_name', name)
+        object.__setattr__(self, '_path', path)  # None for a native module
+        object.__setattr__(self, '_namespace', None)
+
+    def __getattr__(self, attr):
+        # Only called for names that are not slots, which is every USL name
+        if attr.startswith('__'):
+            raise AttributeError(attr)
+        namespace = self._namespace
+        if namespace is None:
+            namespace = self._load()
+        try:
+            return namespace[attr]
+        except KeyError:
+            raise UslError(f'Module "{self._name}" has no attribute "{attr}"') from None
+
+    def __setattr__(self, attr, value):
+        namespace = self._namespace
+        if namespace is None:
+            namespace = self._load()
+        namespace[attr] = value
+
+    def __repr__(self):
+        return f'<module {self._name}>'
+
+    def _load(self):
+        name = self._name
+        if name in loading:
+            cycle = loading[loading.index(name):] + [name]
+            raise UslError('Import cycle: ' + ' -> '.join(cycle))
+        loading.append(name)
+        try:
+            if self._path is None:
+                from native_modules import NATIVE_MODULES
+                namespace = NATIVE_MODULES[name]()
+            else:
+                from ast_cache import load_program
+                env = Environment()
+                run(load_program(self._path, opt_level, use_cache), env, engine)
+                namespace = env.variables
+        finally:
+            loading.pop()
+        object.__setattr__(self, '_namespace', namespace)
+        return namespace
+
+def import_module(name):
+    """Return the shared Module for a dotted name, without loading it."""
+    module = registry.get(name)
+    if module is None:
+        module = registry[name] = Module(name, find_module(name))
+    return module
+
+def find_module(name):
+    from native_modules import NATIVE_MODULES
+    if name in NATIVE_MODULES:
+        return None
+    relative = os.path.join(*name.split('.')) + '.usl'
+    for directory in search_path:
+        path = os.path.join(directory, relative)
+        if os.path.isfile(path):
+            return os.path.abspath(path)
+    raise UslError(f'Module "{name}" not found')
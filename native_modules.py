@@ -0,0 +1,465 @@
+# native_modules.py
+#
+# The standard library modules of STANDARD_LIBRARY.md, implemented in
+# Python. `import math;` binds a modules.Module whose namespace comes from
+# the factory in NATIVE_MODULES, built the first time an attribute is read.
+# Classes are plain Python classes: USL code constructs them by calling
+# them, math.Random(), and calls their camelCase methods directly.
+
+import datetime as _datetime
+import math as _math
+import os
+import platform
+import random
+import re
+import subprocess
+import sys
+from collections import deque
+
+def show(value):
+    # How a value prints inside a collection: strings are quoted
+    return f'"{value}"' if isinstance(value, str) else str(value)
+
+# io
+
+class File:
+    def __init__(self, path):
+        self.path = path
+        self.handle = None
+
+    def open(self, mode='r'):
+        if mode not in ('r', 'w', 'a'):
+            raise ValueError(f'Unknown file mode "{mode}"')
+        self.handle = open(self.path, mode)
+
+    def close(self):
+        if self.handle is not None:
+            self.handle.close()
+            self.handle = None
+
+    def readLine(self):
+        line = self.handle.readline()
+        return line.rstrip('\n') if line else None  # None is io.EOF
+
+    def write(self, data):
+        self.handle.write(str(data))
+
+def read_file(path):
+    with open(path) as f:
+        return f.read()
+
+def write_file(path, data):
+    with open(path, 'w') as f:
+        f.write(str(data))
+
+def append_file(path, data):
+    with open(path, 'a') as f:
+        f.write(str(data))
+
+def make_io():
+    return {
+        'print': print,
+        'read': input,
+        'readFile': read_file,
+        'writeFile': write_file,
+        'appendFile': append_file,
+        'File': File,
+        'EOF': None,
+    }
+
+# math
+
+class Random:
+    def __init__(self, seed=None):
+        self.generator = random.Random(seed)
+
+    def nextInt(self, low, high):
+        return self.generator.randrange(low, high)  # high is exclusive
+
+    def nextFloat(self, low, high):
+        return self.generator.uniform(low, high)
+
+def make_math():
+    return {
+        'PI': _math.pi,
+        'E': _math.e,
+        'abs': abs,
+        'ceil': _math.ceil,
+        'floor': _math.floor,
+        'round': round,
+        'sqrt': _math.sqrt,
+        'pow': pow,
+        'sin': _math.sin,
+        'cos': _math.cos,
+        'tan': _math.tan,
+        'log': _math.log,
+        'exp': _math.exp,
+        'min': min,
+        'max': max,
+        'Random': Random,
+    }
+
+# string
+
+class StringBuilder:
+    def __init__(self):
+        self.parts = []
+
+    def append(self, text):
+        self.parts.append(str(text))
+        return self
+
+    def toString(self):
+        return ''.join(self.parts)
+
+    def clear(self):
+        self.parts.clear()
+
+    def __str__(self):
+        return self.toString()
+
+def make_string():
+    return {
+        'length': len,
+        'substring': lambda text, start, end=None: text[start:end],
+        'indexOf': lambda text, sub: text.find(sub),
+        'toUpperCase': str.upper,
+        'toLowerCase': str.lower,
+        'replace': lambda text, old, new: text.replace(old, new),
+        'split': lambda text, delimiter: text.split(delimiter),
+        'trim': str.strip,
+        'concat': lambda *texts: ''.join(str(text) for text in texts),
+        'StringBuilder': StringBuilder,
+        'EMPTY': '',
+    }
+
+# collections
+
+class List:
+    def __init__(self, *items):
+        self.items = list(items)
+
+    def append(self, item):
+        self.items.append(item)
+
+    def remove(self, item):
+        self.items.remove(item)
+
+    def get(self, index):
+        return self.items[index]
+
+    def set(self, index, item):
+        self.items[index] = item
+
+    def contains(self, item):
+        return item in self.items
+
+    def size(self):
+        return len(self.items)
+
+    def clear(self):
+        self.items.clear()
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __str__(self):
+        return '[' + ', '.join(show(item) for item in self.items) + ']'
+
+class Set:
+    def __init__(self, *items):
+        self.items = dict.fromkeys(items)  # a dict keeps insertion order
+
+    def add(self, item):
+        self.items[item] = None
+
+    def remove(self, item):
+        del self.items[item]
+
+    def contains(self, item):
+        return item in self.items
+
+    def size(self):
+        return len(self.items)
+
+    def clear(self):
+        self.items.clear()
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __str__(self):
+        return '{' + ', '.join(show(item) for item in self.items) + '}'
+
+class Map:
+    def __init__(self):
+        self.items = {}
+
+    def add(self, key, value):
+        self.items[key] = value
+
+    def remove(self, key):
+        del self.items[key]
+
+    def get(self, key):
+        return self.items.get(key)
+
+    def contains(self, key):
+        return key in self.items
+
+    def size(self):
+        return len(self.items)
+
+    def clear(self):
+        self.items.clear()
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __str__(self):
+        return '{' + ', '.join(f'{show(k)}: {show(v)}' for k, v in self.items.items()) + '}'
+
+class Queue:
+    def __init__(self):
+        self.items = deque()
+
+    def enqueue(self, item):
+        self.items.append(item)
+
+    def dequeue(self):
+        return self.items.popleft()
+
+    def isEmpty(self):
+        return not self.items
+
+    def size(self):
+        return len(self.items)
+
+    def clear(self):
+        self.items.clear()
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __str__(self):
+        return '[' + ', '.join(show(item) for item in self.items) + ']'
+
+class Stack:
+    def __init__(self):
+        self.items = []
+
+    def push(self, item):
+        self.items.append(item)
+
+    def pop(self):
+        return self.items.pop()
+
+    def peek(self):
+        return self.items[-1]
+
+    def isEmpty(self):
+        return not self.items
+
+    def size(self):
+        return len(self.items)
+
+    def clear(self):
+        self.items.clear()
+
+    def __iter__(self):
+        return reversed(self.items)  # top first
+
+    def __len__(self):
+        return len(self.items)
+
+    def __str__(self):
+        return '[' + ', '.join(show(item) for item in self.items) + ']'
+
+def collection_add(collection, *item):
+    # add(list, x), add(set, x), add(map, key, value); Python lists and sets too
+    if isinstance(collection, (list, List)):
+        collection.append(*item)
+    elif isinstance(collection, Queue):
+        collection.enqueue(*item)
+    elif isinstance(collection, Stack):
+        collection.push(*item)
+    elif isinstance(collection, dict):
+        key, value = item
+        collection[key] = value
+    else:
+        collection.add(*item)
+
+def collection_remove(collection, item):
+    if isinstance(collection, (list, set)):
+        collection.remove(item)
+    elif isinstance(collection, dict):
+        del collection[item]
+    else:
+        collection.remove(item)
+
+def for_each(collection, func):
+    for item in collection:
+        func(item)
+
+def make_collections():
+    return {
+        'List': List,
+        'Set': Set,
+        'Map': Map,
+        'Queue': Queue,
+        'Stack': Stack,
+        'add': collection_add,
+        'remove': collection_remove,
+        'contains': lambda collection, item: item in collection,
+        'size': len,
+        'clear': lambda collection: collection.clear(),
+        'forEach': for_each,
+        'enqueue': Queue.enqueue,
+        'dequeue': Queue.dequeue,
+        'push': Stack.push,
+        'pop': Stack.pop,
+        'peek': Stack.peek,
+        'isEmpty': lambda collection: len(collection) == 0,
+    }
+
+# datetime
+
+# YYYY, MM, DD, HH, SS as in STANDARD_LIBRARY.md; MM straight after HH is
+# the minute, anywhere else the month
+_DATE_FIELDS = re.compile(r'YYYY|MM|DD|HH|SS')
+_DIRECTIVES = {'YYYY': '%Y', 'MM': '%m', 'DD': '%d', 'HH': '%H', 'SS': '%S'}
+
+def strftime_format(pattern):
+    previous = None
+    def directive(match):
+        nonlocal previous
+        field = match.group()
+        result = '%M' if field == 'MM' and previous == 'HH' else _DIRECTIVES[field]
+        previous = field
+        return result
+    return _DATE_FIELDS.sub(directive, pattern.replace('%', '%%'))
+
+class Date:
+    def __init__(self, year, month, day, hour=0, minute=0, second=0):
+        self.value = _datetime.datetime(year, month, day, hour, minute, second)
+
+    @classmethod
+    def wrap(cls, value):
+        date = cls.__new__(cls)
+        date.value = value
+        return date
+
+    def toString(self, pattern='YYYY-MM-DD HH:MM:SS'):
+        return self.value.strftime(strftime_format(pattern))
+
+    def addDays(self, days):
+        self.value += _datetime.timedelta(days=days)
+        return self
+
+    def addHours(self, hours):
+        self.value += _datetime.timedelta(hours=hours)
+        return self
+
+    def differenceInDays(self, other):
+        return (other.value.date() - self.value.date()).days
+
+    def __eq__(self, other):
+        return isinstance(other, Date) and self.value == other.value
+
+    def __lt__(self, other):
+        return self.value < other.value
+
+    def __hash__(self):
+        return hash(self.value)
+
+    def __str__(self):
+        return self.toString()
+
+def make_datetime():
+    return {
+        'Date': Date,
+        'now': lambda: Date.wrap(_datetime.datetime.now().replace(microsecond=0)),
+        'format': lambda date, pattern: date.toString(pattern),
+        'parse': lambda text, pattern: Date.wrap(
+            _datetime.datetime.strptime(text, strftime_format(pattern))),
+        'addDays': lambda date, days: Date.wrap(date.value + _datetime.timedelta(days=days)),
+        'addHours': lambda date, hours: Date.wrap(date.value + _datetime.timedelta(hours=hours)),
+        'diffInDays': lambda first, second: (first.value.date() - second.value.date()).days,
+        'EPOCH': Date(1970, 1, 1),
+    }
+
+# system
+
+OS_WINDOWS = 'Windows'
+OS_MACOS = 'MacOS'
+OS_LINUX = 'Linux'
+
+def current_os():
+    return {'Windows': OS_WINDOWS, 'Darwin': OS_MACOS, 'Linux': OS_LINUX}.get(
+        platform.system(), platform.system())
+
+def run_command(command):
+    result = subprocess.run(command, shell=True, capture_output=True, text=True)
+    return result.stdout.rstrip('\n')
+
+def set_env(name, value):
+    os.environ[name] = str(value)
+
+def exit_program(code=0):
+    sys.stdout.flush()
+    raise SystemExit(code)
+
+class Process:
+    def __init__(self, command, args=()):
+        self.command = [command, *args]
+        self.process = None
+        self.output = None
+
+    def start(self):
+        self.process = subprocess.Popen(self.command, stdout=subprocess.PIPE, text=True)
+
+    def kill(self):
+        if self.process is not None:
+            self.process.kill()
+
+    def isRunning(self):
+        return self.process is not None and self.process.poll() is None
+
+    def getOutput(self):
+        if self.output is None and self.process is not None:
+            self.output = self.process.communicate()[0]
+        return self.output
+
+def make_system():
+    return {
+        'getEnv': os.environ.get,
+        'setEnv': set_env,
+        'exec': run_command,
+        'exit': exit_program,
+        'Process': Process,
+        'OS_WINDOWS': OS_WINDOWS,
+        'OS_MACOS': OS_MACOS,
+        'OS_LINUX': OS_LINUX,
+        'currentOS': current_os,
+    }
+
+NATIVE_MODULES = {
+    'io': make_io,
+    'math': make_math,
+    'string': make_string,
+    'collections': make_collections,
+    'datetime': make_datetime,
+    'system': make_system,
+}
@@ -0,0 +1,267 @@
+# optimizer.py
+#
+# AST-to-AST optimisation pass, run after Parser.parse and before the
+# resolver. Levels:
+#
+#   0  no changes
+#   1  constant folding of BinaryOp/UnaryOp, pruning of if/while statements
+#      with constant conditions, and removal of statements that follow a
+#      return, break or continue in the same block. Folding runs inside loop
+#      bodies too, so invariant literal expressions are computed once here
+#      instead of on every iteration.
+#   2  additionally applies algebraic identities (x + 0, x * 1, ...) that
+#      are only exact when the other operand is a number. Only integer 0 and
+#      1 qualify: x * 1.0 turns an int into a float, and so does x / 1.
+#
+# Every rewrite preserves the program's output at level 1.
+
+from ast_nodes import *
+from error import UslError
+from interpreter import eval_binary_op, eval_unary_op
+
+LEVELS = (0, 1, 2)
+
+# Folding a string operation must not blow up the tree
+MAX_FOLDED_STRING = 4096
+
+_LITERALS = (Number, String, Boolean, NoneType)
+
+class OptimizationReport:
+    def __init__(self, level):
+        self.level = level
+        self.nodes_before = 0
+        self.nodes_after = 0
+        self.folded = 0
+        self.branches_pruned = 0
+        self.unreachable_removed = 0
+        self.simplified = 0
+
+    @property
+    def nodes_removed(self):
+        return self.nodes_before - self.nodes_after
+
+    def __str__(self):
+        return (f'optimizer -O{self.level}: {self.nodes_before} -> {self.nodes_after} nodes '
+                f'({self.nodes_removed} removed); {self.folded} folded, '
+                f'{self.branches_pruned} branches pruned, '
+                f'{self.unreachable_removed} unreachable statements dropped, '
+                f'{self.simplified} identities simplified')
+
+def optimize(program, level=1):
+    """Optimise a StatementList in place. Returns (program, report)."""
+    if level not in LEVELS:
+        raise UslError(f'Unknown optimisation level {level}')
+    report = OptimizationReport(level)
+    report.nodes_before = count_nodes(program)
+    if level > 0:
+        Optimizer(level, report).visit_statement_list(program)
+    report.nodes_after = count_nodes(program)
+    return program, report
+
+def count_nodes(node):
+    count = 0
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        count += 1
+        stack.extend(iter_child_nodes(node))
+    return count
+
+def literal(value, location):
+    """Build the literal node for an already-evaluated constant."""
+    if value is None:
+        node = NoneType()
+    elif isinstance(value, bool):
+        node = Boolean(value)
+    elif isinstance(value, (int, float)):
+        # Bypass Number.__init__ so the folded value keeps its exact type
+        node = Number.__new__(Number)
+        node.value = value
+    elif isinstance(value, str):
+        # Bypass String.__init__, which expects quoted source text
+        node = String.__new__(String)
+        node.value = value
+    else:
+        return None
+    return copy_location(node, location)
+
+class Optimizer:
+    def __init__(self, level, report):
+        self.level = level
+        self.report = report
+
+    # Statements: each visitor returns the list of statements to keep
+
+    def visit_statement_list(self, node):
+        node.statements = self.visit_statements(node.statements)
+
+    def visit_statements(self, statements):
+        result = []
+        for index, stmt in enumerate(statements):
+            result.extend(self.visit_statement(stmt))
+            if result and isinstance(result[-1], (ReturnStatement, BreakStatement, ContinueStatement)):
+                self.report.unreachable_removed += len(statements) - index - 1
+                break
+        return result
+
+    def visit_statement(self, node):
+        if node is None:
+            return []
+        method = getattr(self, 'stmt_' + type(node).__name__, None)
+        if method is None:
+            return [node]
+        return method(node)
+
+    def visit_block(self, node):
+        node.statements = self.visit_statements(node.statements)
+        return node
+
+    def stmt_Block(self, node):
+        # A nested block does not open a scope, so its statements can be spliced
+        return self.visit_statements(node.statements)
+
+    def stmt_ExpressionStatement(self, node):
+        node.expression = self.visit_expression(node.expression)
+        if isinstance(node.expression, _LITERALS):
+            # A bare constant has no effect
+            return []
+        return [node]
+
+    def stmt_Assignment(self, node):
+        node.expression = self.visit_expression(node.expression)
+        node.targets = [self.visit_expression(target) for target in node.targets]
+        return [node]
+
+    def stmt_ReturnStatement(self, node):
+        if node.expression is not None:
+            node.expression = self.visit_expression(node.expression)
+        return [node]
+
+    def stmt_FunctionDef(self, node):
+        self.visit_block(node.body)
+        return [node]
+
+    def stmt_ClassDef(self, node):
+        self.visit_block(node.body)
+        return [node]
+
+    def stmt_IfStatement(self, node):
+        node.condition = self.visit_expression(node.condition)
+        if isinstance(node.condition, _LITERALS):
+            self.report.branches_pruned += 1
+            if node.condition.value:
+                return self.visit_statements(node.then_branch.statements)
+            elif node.else_branch:
+                return self.visit_statements(node.else_branch.statements)
+            return []
+        self.visit_block(node.then_branch)
+        if node.else_branch:
+            self.visit_block(node.else_branch)
+        return [node]
+
+    def stmt_WhileLoop(self, node):
+        node.condition = self.visit_expression(node.condition)
+        if isinstance(node.condition, _LITERALS) and not node.condition.value:
+            self.report.branches_pruned += 1
+            return []
+        self.visit_block(node.body)
+        return [node]
+
+    def stmt_ForLoop(self, node):
+        if node.init is not None:
+            init = self.visit_statement(node.init)
+            node.init = init[0] if init else None
+        node.condition = self.visit_expression(node.condition)
+        node.update = self.visit_expression(node.update)
+        self.visit_block(node.body)
+        return [node]
+
+    def stmt_ForInLoop(self, node):
+        node.iterable = self.visit_expression(node.iterable)
+        self.visit_block(node.body)
+        return [node]
+
+    # Expressions: each visitor returns the replacement node
+
+    def visit_expression(self, node):
+        method = getattr(self, 'expr_' + type(node).__name__, None)
+        if method is None:
+            return node
+        return method(node)
+
+    def expr_UnaryOp(self, node):
+        node.expr = self.visit_expression(node.expr)
+        if isinstance(node.expr, _LITERALS):
+            return self.fold(node, eval_unary_op, node.op, node.expr.value)
+        return node
+
+    def expr_BinaryOp(self, node):
+        node.left = self.visit_expression(node.left)
+        node.right = self.visit_expression(node.right)
+        left, right = node.left, node.right
+        if isinstance(left, _LITERALS) and isinstance(right, _LITERALS):
+            return self.fold(node, eval_binary_op, node.op, left.value, right.value)
+        if self.level >= 2:
+            return self.simplify(node)
+        return node
+
+    def expr_FunctionCall(self, node):
+        node.func = self.visit_expression(node.func)
+        node.arguments = [self.visit_expression(arg) for arg in node.arguments]
+        return node
+
+    def expr_Attribute(self, node):
+        node.obj = self.visit_expression(node.obj)
+        return node
+
+    def fold(self, node, operation, *operands):
+        # Checked before the operation runs: "ab" * 300000000 would build
+        # the whole string just to find out it is too long
+        if folded_length(*operands) > MAX_FOLDED_STRING:
+            return node
+        try:
+            value = operation(*operands)
+        except Exception:
+            # Leave it for runtime so the error is raised where it was before
+            return node
+        if isinstance(value, str) and len(value) > MAX_FOLDED_STRING:
+            return node
+        folded = literal(value, node)
+        if folded is None:
+            return node
+        self.report.folded += 1
+        return folded
+
+    def simplify(self, node):
+        # Identities that hold for numbers; "s" + 0 would have raised at runtime
+        left, op, right = node.left, node.op, node.right
+        if op in ('ADD', 'SUB') and is_number(right, 0):
+            self.report.simplified += 1
+            return left
+        if op == 'ADD' and is_number(left, 0):
+            self.report.simplified += 1
+            return right
+        if op == 'MUL' and is_number(right, 1):
+            self.report.simplified += 1
+            return left
+        if op == 'MUL' and is_number(left, 1):
+            self.report.simplified += 1
+            return right
+        return node
+
+def folded_length(op, *values):
+    """Length of the string an operation on literal values would build, or 0."""
+    if len(values) != 2:
+        return 0
+    left, right = values
+    if op == 'ADD' and isinstance(left, str) and isinstance(right, str):
+        return len(left) + len(right)
+    if op == 'MUL':
+        if isinstance(left, str) and isinstance(right, int):
+            return len(left) * right
+        if isinstance(right, str) and isinstance(left, int):
+            return len(right) * left
+    return 0
+
+def is_number(node, value):
+    return isinstance(node, Number) and type(node.value) is int and node.value == value
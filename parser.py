@@ -1,42 +1,111 @@
 # parser.py
 
+from collections import deque
 from lexer import Token
 from ast_nodes import *
 from error import UslError
 
+# Binding power of each binary operator; higher binds tighter
+BINARY_PRECEDENCE = {
+    'OR': 1,
+    'AND': 2,
+    'EQ': 3, 'NEQ': 3,
+    'LT': 4, 'GT': 4, 'LE': 4, 'GE': 4,
+    'ADD': 5, 'SUB': 5,
+    'MUL': 6, 'DIV': 6, 'MOD': 6,
+}
+
+UNARY_OPERATORS = frozenset(('NOT', 'ADD', 'SUB'))
+
 class Parser:
-    def __init__(self, tokens):
-        self.tokens = tokens
-        self.position = 0
+    def __init__(self, tokens, recover=False):
+        # Any iterable of tokens: a list from tokenize(), or lexer.iter_tokens()
+        # to parse a stream without materialising every token
+        self.tokens = iter(tokens)
+        self.lookahead = deque()  # tokens read but not yet consumed
+        self.previous = None  # last consumed token, where node spans end
+        # With recover=True a syntax error is recorded in self.errors and
+        # parsing resumes at the next statement, so one pass reports them all
+        self.recover = recover
+        self.errors = []
 
     def current_token(self):
-        return self.tokens[self.position] if self.position < len(self.tokens) else None
+        if self.lookahead:
+            return self.lookahead[0]
+        return self.peek(0)
 
     def expect(self, *expected_types):
         token = self.current_token()
         if token and token.type in expected_types:
-            self.position += 1
+            self.lookahead.popleft()
+            self.previous = token
             return token
         else:
             expected = ', '.join(expected_types)
             actual = token.type if token else 'EOF'
             raise UslError(f'Expected {expected}, got {actual}', token.line if token else None)
 
+    def advance(self):
+        # Consume the current token, which the caller has already checked
+        token = self.lookahead.popleft()
+        self.previous = token
+        return token
+
     def match(self, *expected_types):
         token = self.current_token()
         return token and token.type in expected_types
 
+    def peek(self, offset=1):
+        lookahead = self.lookahead
+        while len(lookahead) <= offset:
+            token = next(self.tokens, None)
+            if token is None:
+                return None
+            lookahead.append(token)
+        return lookahead[offset]
+
+    def finish(self, node, start):
+        # Record the span from `start` (a token or a node) to the last consumed token
+        node.line = start.line
+        node.column = start.column
+        node.end_line, node.end_column = self.previous.end()
+        return node
+
     def parse(self):
         statements = []
-        while self.current_token():
-            stmt = self.parse_statement()
+        while True:
+            try:
+                if not self.current_token():
+                    break
+                stmt = self.parse_statement()
+            except UslError as e:
+                self.synchronize(e, in_block=False)
+                continue
             if stmt:
                 statements.append(stmt)
-            else:
-                break
-        return StatementList(statements)
+        return program_of(statements)
+
+    def synchronize(self, error, in_block):
+        # Record error and skip past the next `;`. A `}` also ends the damaged
+        # statement: inside a block it is left to close the block, at top
+        # level it is stray and skipped. A lexer error ends the token stream.
+        if not self.recover:
+            raise error
+        self.errors.append(error)
+        while True:
+            token = self.current_token()
+            if token is None:
+                return
+            if token.type == 'RBRACE':
+                if not in_block:
+                    self.advance()
+                return
+            self.advance()
+            if token.type == 'SEMICOLON':
+                return
 
     def parse_statement(self):
+        start = self.current_token()
         if self.match('SEMICOLON'):
             self.expect('SEMICOLON')
             return None
@@ -52,121 +121,93 @@ class Parser:
             return self.parse_for_loop()
         elif self.match('RETURN'):
             return self.parse_return_statement()
+        elif self.match('IMPORT'):
+            return self.parse_import_statement()
         elif self.match('BREAK'):
             self.expect('BREAK')
             self.expect('SEMICOLON')
-            return BreakStatement()
+            return self.finish(BreakStatement(), start)
         elif self.match('CONTINUE'):
             self.expect('CONTINUE')
             self.expect('SEMICOLON')
-            return ContinueStatement()
+            return self.finish(ContinueStatement(), start)
         else:
             expr = self.parse_expression()
             if self.match('ASSIGN'):
                 self.expect('ASSIGN')
                 value = self.parse_expression()
                 self.expect('SEMICOLON')
-                return Assignment([expr], value)
+                return self.finish(Assignment([expr], value), start)
             elif self.match('SEMICOLON'):
                 self.expect('SEMICOLON')
-                return ExpressionStatement(expr)
+                return self.finish(ExpressionStatement(expr), start)
             else:
-                raise UslError(f'Expected ASSIGN or SEMICOLON', self.current_token().line)
-
-    def parse_expression(self):
-        return self.parse_or_expression()
-
-    def parse_or_expression(self):
-        left = self.parse_and_expression()
-        while self.match('OR'):
-            op = self.expect('OR').type
-            right = self.parse_and_expression()
-            left = BinaryOp(left, op, right)
-        return left
-
-    def parse_and_expression(self):
-        left = self.parse_equality_expression()
-        while self.match('AND'):
-            op = self.expect('AND').type
-            right = self.parse_equality_expression()
-            left = BinaryOp(left, op, right)
-        return left
-
-    def parse_equality_expression(self):
-        left = self.parse_relational_expression()
-        while self.match('EQ', 'NEQ'):
-            op = self.expect('EQ', 'NEQ').type
-            right = self.parse_relational_expression()
-            left = BinaryOp(left, op, right)
-        return left
-
-    def parse_relational_expression(self):
-        left = self.parse_additive_expression()
-        while self.match('LT', 'GT', 'LE', 'GE'):
-            op = self.expect('LT', 'GT', 'LE', 'GE').type
-            right = self.parse_additive_expression()
-            left = BinaryOp(left, op, right)
-        return left
-
-    def parse_additive_expression(self):
-        left = self.parse_multiplicative_expression()
-        while self.match('ADD', 'SUB'):
-            op = self.expect('ADD', 'SUB').type
-            right = self.parse_multiplicative_expression()
-            left = BinaryOp(left, op, right)
-        return left
-
-    def parse_multiplicative_expression(self):
+                token = self.current_token()
+                raise UslError(f'Expected ASSIGN or SEMICOLON', token.line if token else None)
+
+    def parse_expression(self, min_precedence=1):
+        # Precedence climbing: one loop for every binary operator family.
+        # The right operand only takes operators that bind tighter, so all
+        # binary operators are left-associative.
         left = self.parse_unary_expression()
-        while self.match('MUL', 'DIV', 'MOD'):
-            op = self.expect('MUL', 'DIV', 'MOD').type
-            right = self.parse_unary_expression()
-            left = BinaryOp(left, op, right)
-        return left
+        lookahead = self.lookahead
+        while True:
+            token = lookahead[0] if lookahead else self.peek(0)
+            if token is None:
+                return left
+            precedence = BINARY_PRECEDENCE.get(token.type, 0)
+            if precedence < min_precedence:
+                return left
+            self.advance()
+            right = self.parse_expression(precedence + 1)
+            left = self.finish(BinaryOp(left, token.type, right), left)
 
     def parse_unary_expression(self):
-        if self.match('NOT', 'ADD', 'SUB'):
-            op = self.expect('NOT', 'ADD', 'SUB').type
+        # Prefix operators bind tighter than any binary operator
+        token = self.current_token()
+        if token is not None and token.type in UNARY_OPERATORS:
+            self.advance()
             expr = self.parse_unary_expression()
-            return UnaryOp(op, expr)
-        else:
-            return self.parse_primary_expression()
+            return self.finish(UnaryOp(token.type, expr), token)
+        return self.parse_primary_expression()
 
     def parse_primary_expression(self):
         token = self.current_token()
-        if self.match('NUMBER'):
-            self.expect('NUMBER')
-            return Number(token.value)
-        elif self.match('STRING'):
-            self.expect('STRING')
-            return String(token.value)
-        elif self.match('TRUE'):
-            self.expect('TRUE')
-            return Boolean(True)
-        elif self.match('FALSE'):
-            self.expect('FALSE')
-            return Boolean(False)
-        elif self.match('IDENT'):
+        kind = token.type if token else 'EOF'
+        if kind == 'IDENT':
             return self.parse_identifier()
-        elif self.match('LPAREN'):
-            self.expect('LPAREN')
+        elif kind == 'NUMBER':
+            self.advance()
+            return self.finish(Number(token.value), token)
+        elif kind == 'STRING':
+            self.advance()
+            return self.finish(String(token.value), token)
+        elif kind == 'TRUE' or kind == 'FALSE':
+            self.advance()
+            return self.finish(Boolean(kind == 'TRUE'), token)
+        elif kind == 'LPAREN':
+            self.advance()
             expr = self.parse_expression()
             self.expect('RPAREN')
             return expr
         else:
-            raise UslError(f'Unexpected token {token.type}', token.line)
+            raise UslError(f'Unexpected token {kind}', token.line if token else None)
 
     def parse_identifier(self):
+        # An identifier and its postfix operators: calls and attribute access
         token = self.expect('IDENT')
-        expr = Identifier(token.value)
-        while self.match('LPAREN', 'DOT'):
-            if self.match('LPAREN'):
+        expr = self.finish(Identifier(token.value), token)
+        while True:
+            token = self.current_token()
+            kind = token.type if token else None
+            if kind == 'LPAREN':
                 expr = self.parse_function_call(expr)
-            elif self.match('DOT'):
-                self.expect('DOT')
+            elif kind == 'DOT':
+                self.advance()
                 attr_name = self.expect('IDENT').value
-                expr = Attribute(expr, attr_name)
-        return expr
+                expr = self.finish(Attribute(expr, attr_name), expr)
+            else:
+                return expr
 
     def parse_function_call(self, func):
         self.expect('LPAREN')
@@ -177,10 +218,10 @@ class Parser:
                 self.expect('COMMA')
                 arguments.append(self.parse_expression())
         self.expect('RPAREN')
-        return FunctionCall(func, arguments)
+        return self.finish(FunctionCall(func, arguments), func)
 
     def parse_function_def(self):
-        self.expect('DEF')
+        start = self.expect('DEF')
         name = self.expect('IDENT').value
         self.expect('LPAREN')
         params = []
@@ -191,20 +232,20 @@ class Parser:
                 params.append(self.expect('IDENT').value)
         self.expect('RPAREN')
         body = self.parse_block()
-        return FunctionDef(name, params, body)
+        return self.finish(FunctionDef(name, params, body), start)
 
     def parse_class_def(self):
-        self.expect('CLASS')
+        start = self.expect('CLASS')
         name = self.expect('IDENT').value
         bases = []
         if self.match('EXTENDS'):
             self.expect('EXTENDS')
             bases.append(self.expect('IDENT').value)
         body = self.parse_block()
-        return ClassDef(name, bases, body)
+        return self.finish(ClassDef(name, bases, body), start)
 
     def parse_if_statement(self):
-        self.expect('IF')
+        start = self.expect('IF')
         self.expect('LPAREN')
         condition = self.parse_expression()
         self.expect('RPAREN')
@@ -213,39 +254,81 @@ class Parser:
         if self.match('ELSE'):
             self.expect('ELSE')
             else_branch = self.parse_block()
-        return IfStatement(condition, then_branch, else_branch)
+        return self.finish(IfStatement(condition, then_branch, else_branch), start)
 
     def parse_while_loop(self):
-        self.expect('WHILE')
+        start = self.expect('WHILE')
         self.expect('LPAREN')
         condition = self.parse_expression()
         self.expect('RPAREN')
         body = self.parse_block()
-        return WhileLoop(condition, body)
+        return self.finish(WhileLoop(condition, body), start)
 
     def parse_for_loop(self):
-        self.expect('FOR')
+        start = self.expect('FOR')
         self.expect('LPAREN')
+        if self.match('IDENT') and self.peek() and self.peek().type == 'IN':
+            return self.parse_for_in_loop(start)
         init = self.parse_statement()
         condition = self.parse_expression()
         self.expect('SEMICOLON')
         update = self.parse_expression()
         self.expect('RPAREN')
         body = self.parse_block()
-        return ForLoop(init, condition, update, body)
+        return self.finish(ForLoop(init, condition, update, body), start)
+
+    def parse_for_in_loop(self, start):
+        # for (name in iterable) { ... }; the FOR and LPAREN are consumed
+        token = self.expect('IDENT')
+        target = self.finish(Identifier(token.value), token)
+        self.expect('IN')
+        iterable = self.parse_expression()
+        self.expect('RPAREN')
+        body = self.parse_block()
+        return self.finish(ForInLoop(target, iterable, body), start)
 
     def parse_return_statement(self):
-        self.expect('RETURN')
+        start = self.expect('RETURN')
         expression = self.parse_expression()
         self.expect('SEMICOLON')
-        return ReturnStatement(expression)
+        return self.finish(ReturnStatement(expression), start)
+
+    def parse_import_statement(self):
+        # import name; or import package.name; binds the last component
+        start = self.expect('IMPORT')
+        token = self.expect('IDENT')
+        parts = [token.value]
+        while self.match('DOT'):
+            self.advance()
+            token = self.expect('IDENT')
+            parts.append(token.value)
+        target = self.finish(Identifier(token.value), token)
+        self.expect('SEMICOLON')
+        return self.finish(ImportStatement('.'.join(parts), target), start)
 
     def parse_block(self):
-        self.expect('LBRACE')
+        start = self.expect('LBRACE')
         statements = []
-        while not self.match('RBRACE'):
-            stmt = self.parse_statement()
+        while True:
+            token = self.current_token()
+            if token is None or token.type == 'RBRACE':
+                break
+            try:
+                stmt = self.parse_statement()
+            except UslError as e:
+                self.synchronize(e, in_block=True)
+                continue
             if stmt:
                 statements.append(stmt)
         self.expect('RBRACE')
-        return Block(statements)
+        return self.finish(Block(statements), start)
+
+def program_of(statements):
+    """Wrap top-level statements in a StatementList spanning all of them."""
+    program = StatementList(statements)
+    if statements:
+        program.line, program.column = statements[0].line, statements[0].column
+        program.end_line, program.end_column = statements[-1].end_line, statements[-1].end_column
+    else:
+        program.line, program.column, program.end_line, program.end_column = 1, 1, 1, 1
+    return program
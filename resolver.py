@@ -0,0 +1,212 @@
+# resolver.py
+#
+# Static scope resolution. Runs between Parser.parse and execution and
+# annotates every Identifier (reads and assignment targets) with a
+# (depth, slot) pair: how many environments to hop up, and the index of the
+# local in that function frame. Function locals then live in a list-backed
+# frame instead of a dict.
+#
+# The global scope and class bodies stay dict-based, so their names resolve
+# to (depth, None) and are looked up by name in that environment. Locals read
+# before they are assigned fall back to the dict path at runtime.
+#
+# It also marks the return statements outside a function and the break and
+# continue statements outside a loop (a function or class body starts a new
+# scope with no loops around it), so every engine fails at the statement
+# itself, with its line, when one runs.
+
+from ast_nodes import *
+
+class Scope:
+    def __init__(self, kind, parent=None):
+        self.kind = kind  # 'global', 'class' or 'function'
+        self.parent = parent
+        self.slots = {}  # name -> slot index (function scopes)
+        self.names = set()  # names bound in dict-based scopes
+        self.size = 0
+        self.loops = 0  # loops around the statement being visited, in this scope
+
+    def declare(self, name):
+        if self.kind == 'function':
+            if name not in self.slots:
+                self.slots[name] = self.size
+                self.size += 1
+        else:
+            self.names.add(name)
+
+    def declare_param(self, name):
+        # Every parameter gets its own slot so arguments can be copied
+        # positionally; a repeated name maps to the last one.
+        self.slots[name] = self.size
+        self.size += 1
+
+    def slot_of(self, name):
+        return self.slots.get(name) if self.kind == 'function' else None
+
+    def layout(self, params):
+        # What the engines need of a function scope, as plain data
+        varnames = [None] * self.size
+        for name, slot in self.slots.items():
+            varnames[slot] = name
+        for slot, param in enumerate(params):
+            varnames[slot] = param
+        return FrameLayout(varnames)
+
+def resolve(program):
+    """Annotate a parsed program in place and return it."""
+    Resolver().resolve_program(program)
+    return program
+
+class Resolver:
+    def __init__(self):
+        self.scope = None
+
+    def resolve_program(self, program):
+        self.scope = Scope('global')
+        self.declare_body(program.statements)
+        self.visit(program)
+
+    def declare_body(self, statements):
+        for stmt in statements:
+            self.declare_statement(stmt)
+
+    def declare_statement(self, node):
+        if isinstance(node, Assignment):
+            for target in node.targets:
+                if isinstance(target, Identifier):
+                    self.scope.declare(target.name)
+        elif isinstance(node, (FunctionDef, ClassDef)):
+            self.scope.declare(node.name)
+        elif isinstance(node, IfStatement):
+            self.declare_statement(node.then_branch)
+            if node.else_branch:
+                self.declare_statement(node.else_branch)
+        elif isinstance(node, WhileLoop):
+            self.declare_statement(node.body)
+        elif isinstance(node, ForLoop):
+            self.declare_statement(node.init)
+            self.declare_statement(node.body)
+        elif isinstance(node, ForInLoop):
+            self.scope.declare(node.target.name)
+            self.declare_statement(node.body)
+        elif isinstance(node, ImportStatement):
+            self.scope.declare(node.target.name)
+        elif isinstance(node, Block):
+            self.declare_body(node.statements)
+
+    def lookup(self, name):
+        depth = 0
+        scope = self.scope
+        while scope.parent is not None:
+            slot = scope.slot_of(name)
+            if slot is not None:
+                return depth, slot
+            if name in scope.names:
+                return depth, None
+            scope = scope.parent
+            depth += 1
+        # Global scope, including builtins and names defined at runtime
+        return depth, None
+
+    def visit(self, node):
+        if node is None:
+            return
+        method = getattr(self, 'visit_' + type(node).__name__, None)
+        if method is not None:
+            method(node)
+
+    def visit_all(self, nodes):
+        for node in nodes:
+            self.visit(node)
+
+    def visit_Identifier(self, node):
+        node.depth, node.slot = self.lookup(node.name)
+
+    def visit_BinaryOp(self, node):
+        self.visit(node.left)
+        self.visit(node.right)
+
+    def visit_UnaryOp(self, node):
+        self.visit(node.expr)
+
+    def visit_Assignment(self, node):
+        self.visit(node.expression)
+        for target in node.targets:
+            if isinstance(target, Identifier):
+                # Assignment always binds in the current scope
+                target.depth, target.slot = 0, self.scope.slot_of(target.name)
+            else:
+                self.visit(target)
+
+    def visit_ExpressionStatement(self, node):
+        self.visit(node.expression)
+
+    def visit_FunctionCall(self, node):
+        self.visit(node.func)
+        self.visit_all(node.arguments)
+
+    def visit_FunctionDef(self, node):
+        node.slot = self.scope.slot_of(node.name)
+        scope = Scope('function', self.scope)
+        for param in node.params:
+            scope.declare_param(param)
+        self.scope = scope
+        self.declare_statement(node.body)
+        self.visit(node.body)
+        self.scope = scope.parent
+        node.scope = scope.layout(node.params)
+
+    def visit_ClassDef(self, node):
+        node.slot = self.scope.slot_of(node.name)
+        scope = Scope('class', self.scope)
+        self.scope = scope
+        self.declare_statement(node.body)
+        self.visit(node.body)
+        self.scope = scope.parent
+
+    def visit_ReturnStatement(self, node):
+        node.outside = self.scope.kind != 'function'
+        self.visit(node.expression)
+
+    def visit_BreakStatement(self, node):
+        node.outside = not self.scope.loops
+
+    visit_ContinueStatement = visit_BreakStatement
+
+    def visit_IfStatement(self, node):
+        self.visit(node.condition)
+        self.visit(node.then_branch)
+        self.visit(node.else_branch)
+
+    def visit_WhileLoop(self, node):
+        self.visit(node.condition)
+        self.visit_loop_body(node.body)
+
+    def visit_ForLoop(self, node):
+        self.visit(node.init)
+        self.visit(node.condition)
+        self.visit(node.update)
+        self.visit_loop_body(node.body)
+
+    def visit_ForInLoop(self, node):
+        self.visit(node.iterable)
+        # The loop variable binds in the current scope, like an assignment
+        node.target.depth, node.target.slot = 0, self.scope.slot_of(node.target.name)
+        self.visit_loop_body(node.body)
+
+    def visit_loop_body(self, body):
+        self.scope.loops += 1
+        self.visit(body)
+        self.scope.loops -= 1
+
+    def visit_ImportStatement(self, node):
+        node.target.depth, node.target.slot = 0, self.scope.slot_of(node.target.name)
+
+    def visit_Block(self, node):
+        self.visit_all(node.statements)
+
+    def visit_StatementList(self, node):
+        self.visit_all(node.statements)
+
+    def visit_Attribute(self, node):
+        self.visit(node.obj)
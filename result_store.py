@@ -0,0 +1,146 @@
+# result_store.py
+#
+# Per-request outputs of /process, kept in memory under an unguessable id
+# instead of in a directory shared by every request. /download/<id> streams
+# a zip of one result, compressing and sending each file as it is added, so
+# the archive is never written to disk or held whole in memory.
+#
+# The store keeps at most max_results results, each for at most max_age
+# seconds; the oldest go first. When the server runs several worker
+# processes, a download can reach a different process than the /process
+# request that made the result, so the store can also keep each result in
+# a directory the workers share.
+
+import io
+import json
+import os
+import secrets
+import tempfile
+import threading
+import time
+import zipfile
+from collections import OrderedDict
+
+class Result:
+    __slots__ = ("id", "files", "created")
+
+    def __init__(self, files, result_id=None):
+        self.id = result_id or secrets.token_urlsafe(12)
+        self.files = files  # [(filename, text)], in the order they were requested
+        self.created = time.monotonic()
+
+class ResultStore:
+    def __init__(self, max_results=100, max_age=3600, directory=None):
+        self.max_results = max_results
+        self.max_age = max_age
+        self.directory = directory  # shared with other worker processes, or None
+        self.results = OrderedDict()  # id -> Result, oldest first
+        self.lock = threading.Lock()
+        self.swept = time.monotonic()  # when old files were last removed from directory
+
+    def add(self, files):
+        """Store a list of (filename, text) and return its Result."""
+        result = Result(files)
+        with self.lock:
+            self.results[result.id] = result
+            self.expire()
+        if self.directory is not None:
+            self.write(result)
+        return result
+
+    def get(self, result_id):
+        with self.lock:
+            self.expire()
+            result = self.results.get(result_id)
+        if result is None and self.directory is not None:
+            result = self.read(result_id)
+        return result
+
+    def expire(self):
+        results = self.results
+        while len(results) > self.max_results:
+            results.popitem(last=False)
+        cutoff = time.monotonic() - self.max_age
+        while results and next(iter(results.values())).created < cutoff:
+            results.popitem(last=False)
+
+    # The directory holds <id>.json, a list of [filename, text] pairs
+
+    def write(self, result):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            fd, temp = tempfile.mkstemp(suffix=".tmp", dir=self.directory)
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    json.dump(result.files, f)
+                os.replace(temp, os.path.join(self.directory, result.id + ".json"))
+            except BaseException:
+                os.unlink(temp)
+                raise
+        except OSError:
+            pass  # this process can still serve it from memory
+        if time.monotonic() - self.swept > 60:
+            self.sweep()
+
+    def read(self, result_id):
+        if not result_id.replace("-", "").replace("_", "").isalnum():
+            return None  # ids are token_urlsafe; anything else is not a file of ours
+        path = os.path.join(self.directory, result_id + ".json")
+        try:
+            if time.time() - os.path.getmtime(path) > self.max_age:
+                return None
+            with open(path, "r", encoding="utf-8") as f:
+                return Result([tuple(pair) for pair in json.load(f)], result_id)
+        except (OSError, ValueError):
+            return None
+
+    def sweep(self):
+        self.swept = time.monotonic()
+        cutoff = time.time() - self.max_age
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return
+        for name in names:
+            if name.endswith((".json", ".tmp")):
+                path = os.path.join(self.directory, name)
+                try:
+                    if os.path.getmtime(path) < cutoff:
+                        os.unlink(path)
+                except OSError:
+                    pass
+
+class _Sink(io.RawIOBase):
+    # A write-only, unseekable stream: ZipFile then writes a data descriptor
+    # after each member instead of seeking back to patch its header
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def take(self):
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+def stream_zip(files, level=6):
+    """Yield a zip archive of (filename, text) pairs a member at a time.
+
+    level is the DEFLATE level, 1 (fastest) to 9 (smallest); 0 stores the
+    files uncompressed.
+    """
+    sink = _Sink()
+    if level:
+        archive = zipfile.ZipFile(sink, "w", zipfile.ZIP_DEFLATED, compresslevel=level)
+    else:
+        archive = zipfile.ZipFile(sink, "w", zipfile.ZIP_STORED)
+    with archive:
+        for filename, text in files:
+            archive.writestr(filename, text.encode("utf-8"))
+            yield sink.take()
+    yield sink.take()  # the central directory
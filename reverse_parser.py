@@ -1,5 +1,25 @@
+# reverse_parser.py
+#
+# Turns source code in another language back into `Symbolic:` lines. Each
+# language family has a Recogniser: its statement patterns compiled into
+# regexes of anchored alternatives, one regex per character a statement
+# can start with, so that a line is classified by a single match of the
+# regex for its first character. The name of the alternative that matched
+# says what the line is, and its groups hold the parts the symbolic form
+# needs. Comments, docstrings and lines of only brackets are skipped.
+# Keywords must be whole words at the start of the statement, so a line is
+# no longer taken for a `main` or an operator because "main" or "-"
+# appears somewhere in it.
+#
+# Input is read a line at a time from any iterable of lines, a file object
+# included, and output is produced as it goes: iter_symbolic is a
+# generator, and reverse_parser collects it into a list.
+#
+#     python reverse_parser.py program.py     # print the symbolic lines
 
 import os
+import re
+import sys
 
 def detect_language_by_extension(filename):
     ext = os.path.splitext(filename)[-1].lower()
@@ -13,58 +33,222 @@ def detect_language_by_extension(filename):
     }
     return ext_map.get(ext, "unknown")
 
-def reverse_parser(code_lines, language):
-    symbolic_lines = []
+# Statement patterns, applied to a stripped line, as (kind, leads,
+# pattern). leads are the words (or characters) a line that matches can
+# start with, or None if it can start with anything: a line is tried
+# against the rules with a lead of its first character, then those whose
+# leads are None. The named groups are the parts the symbolic form is
+# made from.
+
+_PYTHON_RULES = [
+    ("main", "if", r"if\s+__name__\s*==\s*['\"]__main__['\"]\s*:"),
+    ("function", "async def", r"(?:async\s+)?def\s+(?P<name>\w+)\s*\((?P<args>.*)\)\s*(?:->.*)?:"),
+    ("class", "class", r"class\s+(?P<rest>(?:.*[^\s:])?)[\s:]*$"),
+    ("print", "print", r"print\s*\((?P<args>.*)\)$"),
+    ("return", "return", r"return\b\s*(?P<value>.*)"),
+    ("if", "if elif", r"(?:el)?if\b(?P<cond>.*)"),
+    ("loop", "async for while", r"(?:async\s+)?(?:for|while)\b.*"),
+    ("import", "from import", r"(?:from\s+\S+\s+)?import\s+(?P<rest>.*)"),
+    ("try", "try", r"try\s*:"),
+    ("throw", "raise", r"raise\b.*"),
+]
+
+_C_FAMILY_RULES = [
+    ("import", "#", r"\#\s*include\s*[<\"](?P<rest>[^>\"]+)[>\"]"),
+    ("skip", "#", r"\#.*"),  # other preprocessor lines
+    ("print", "console printf puts System print",
+     r"(?:console\.(?:log|error|info)|printf|puts|System\.out\.print(?:ln|f)?|print)"
+     r"\s*\((?P<args>.*)\)\s*;?$"),
+    ("print", "std cout", r"(?:std::)?cout\s*<<\s*(?P<stream>(?:.*[^\s;])?)[\s;]*$"),
+    ("main", None, r"(?=[^(]*main)(?:[\w:<>*&\[\]]+\s+)+\**main\s*\(.*\)\s*\{?$"),
+    ("function", "export default async function",
+     r"(?:export\s+)?(?:default\s+)?(?:async\s+)?function\s*\*?\s*(?P<name>\w*)"
+     r"\s*\((?P<args>[^)]*)\)"),
+    ("function", "export const let var",
+     r"(?:export\s+)?(?:const|let|var)\s+(?P<name>\w+)\s*=\s*(?:async\s*)?"
+     r"\((?P<args>[^)]*)\)\s*=>"),
+    ("function", None,
+     r"(?=[^;]*\)\s*(?:const\s*)?(?:throws\s+[\w., ]+)?\{?$)(?=[^(=;\"']*\()"
+     r"(?!(?:if|for|while|switch|return|else|do|catch|new|throw|case)\b)"
+     r"(?:[\w:<>*&\[\],]+\s+)+[*&]*(?P<name>\w+)\s*\((?P<args>[^;]*)\)"
+     r"\s*(?:const\s*)?(?:throws\s+[\w., ]+)?\{?$"),
+    ("class", "export default public private protected abstract final static class struct interface",
+     r"(?:export\s+)?(?:default\s+)?(?:(?:public|private|protected|abstract|final|static)\s+)*"
+     r"(?:class|struct|interface)\s+(?P<rest>(?:[^;(=*&]*[^\s{;(=*&,])?)[\s{]*$"),
+    ("namespace", "namespace", r"namespace\s+(?P<rest>(?:.*[^\s{])?)[\s{]*$"),
+    ("return", "return", r"return\b\s*(?P<value>(?:.*[^\s;])?)[\s;]*$"),
+    ("if", "} else if", r"(?:\}\s*)?(?:else\s+)?if\b(?P<cond>.*)"),
+    ("loop", "} for while do", r"(?:\}\s*)?(?:for|while|do)\b.*"),
+    ("switch", "switch", r"switch\b\s*(?P<rest>.*)"),
+    ("import", "import", r"import\s+(?P<rest>(?:.*[^\s;])?)[\s;]*$"),
+    ("try", "try", r"try\b\s*\{?$"),
+    ("throw", "throw", r"throw\b.*"),
+]
+
+_COMMON_RULES = [
+    ("continue", "continue", r"continue\b.*"),
+    ("break", "break", r"break\b.*"),
+    ("yield", "yield", r"yield\b.*"),
+    ("await", "await", r"await\b.*"),
+    ("async", "async", r"async\b.*"),
+    # A target (names, attributes, subscripts, a declaration's type) and
+    # then =, or a compound assignment; not ==
+    ("assign", None, r"(?=[^=]+=(?!=))[^=;(){}\"'<>!]*(?:(?:<[\w\s,:<>*]*>|<<|>>)[^=;(){}\"'<>!]*)*=(?!=)"),
+    ("operator", None, r"(?=[^-+*/%]*[-+*/%]).*?(?:\+\+|--|[\w)\]]\s*(?:\*\*|//|[-+*/%])\s*[\w(\"'])"),
+]
+
+_FAMILIES = {
+    "python": (("#",), ('"""', "'''"), _PYTHON_RULES),
+    "c_family": (("//",), ("/*",), _C_FAMILY_RULES),
+    "unknown": (("//", "#"), ("/*",), _PYTHON_RULES + _C_FAMILY_RULES),
+}
+_LANGUAGE_FAMILIES = {
+    "python": "python",
+    "javascript": "c_family",
+    "typescript": "c_family",
+    "c": "c_family",
+    "cpp": "c_family",
+    "java": "c_family",
+}
+
+# Lines made of nothing but these are skipped
+_BRACKETS = "{}()[];, \t"
+
+_PART = re.compile(r"\(\?P<(\w+)>")
+
+class Recogniser:
+    """The compiled statement patterns and comment syntax of one language family."""
+    __slots__ = ("comments", "block_comments", "skip_starts", "matchers", "general", "actions")
+
+    def __init__(self, comments, block_comments, rules):
+        self.comments = comments  # prefixes of line comments
+        self.block_comments = block_comments  # openers of comments that can span lines
+        # First characters of the lines that may be skipped without matching
+        # (comments, brackets only) and "" for blank lines
+        self.skip_starts = frozenset({""} | set(_BRACKETS) |
+                                     {opener[0] for opener in comments + block_comments})
+        # Each rule is an alternative named r<index>; its part groups are
+        # renamed r<index>_<part> so that every name in a regex is unique.
+        # actions[rule] is what a line it matches becomes (see _action)
+        self.actions = {}
+        alternatives = []
+        for index, (kind, leads, pattern) in enumerate(rules + _COMMON_RULES):
+            starts = {lead[0] for lead in leads.split()} if leads else None
+            name = f"r{index}"
+            parts = {part: f"{name}_{part}" for part in _PART.findall(pattern)}
+            self.actions[name] = _action(kind, parts)
+            renamed = _PART.sub(lambda m: f"(?P<{name}_{m.group(1)}>", pattern)
+            alternatives.append((starts, f"(?P<{name}>{renamed})"))
+
+        def combined(first):
+            # The rules for lines starting with first, then the rules for
+            # any line, each in priority order
+            return re.compile("|".join([alternative for starts, alternative in alternatives
+                                        if starts is not None and first in starts] +
+                                       [alternative for starts, alternative in alternatives
+                                        if starts is None])).match
 
-    for line in code_lines:
+        # matchers[first character](line) -> re.Match, whose lastgroup names
+        # the rule that matched; general is for lines starting with any other
+        self.matchers = {first: combined(first)
+                         for starts, _ in alternatives if starts is not None for first in starts}
+        self.general = combined(None)
+
+_recognisers = {}
+
+def recogniser(language):
+    family = _LANGUAGE_FAMILIES.get(language, "unknown")
+    compiled = _recognisers.get(family)
+    if compiled is None:
+        compiled = _recognisers[family] = Recogniser(*_FAMILIES[family])
+    return compiled
+
+_FIXED = {
+    "main": "Symbolic: main",
+    "try": "Symbolic: try",
+    "throw": "Symbolic: throw error",
+    "continue": "Symbolic: continue",
+    "break": "Symbolic: break",
+    "await": "Symbolic: await result",
+    "async": "Symbolic: async fetch(url)",
+    "yield": "Symbolic: yield value",
+}
+
+def _action(kind, parts):
+    """What a line matched by a rule of kind becomes: None (skipped), the
+    symbolic line itself, or a function of (match, stripped line) that
+    writes it. parts maps the rule's part names to its groups."""
+    if kind == "skip":
+        return None
+    if kind in _FIXED:
+        return _FIXED[kind]
+    if kind in ("assign", "loop", "operator"):
+        prefix = "Symbolic: let " if kind == "assign" else f"Symbolic: {kind} "
+        return lambda found, stripped: prefix + stripped
+    if kind == "print" and "stream" in parts:
+        stream = parts["stream"]
+
+        def write(found, stripped):
+            items = (item.strip() for item in found.group(stream).split("<<"))
+            return f"Symbolic: print({', '.join(item for item in items if item not in ('std::endl', 'endl'))})"
+        return write
+    if kind == "print":
+        args = parts["args"]
+        return lambda found, stripped: f"Symbolic: print({found.group(args)})"
+    if kind == "function":
+        name, args = parts["name"], parts["args"]
+        return lambda found, stripped: f"Symbolic: function {found.group(name)}({found.group(args)})"
+    if kind == "return":
+        value = parts["value"]
+        return lambda found, stripped: "Symbolic: return " + found.group(value).strip()
+    if kind == "if":
+        cond = parts["cond"]
+        return lambda found, stripped: "Symbolic: if " + found.group(cond).strip().strip("() {}:")
+    rest = parts["rest"]  # class, switch, import, namespace
+    prefix = f"Symbolic: {kind} "
+    return lambda found, stripped: prefix + found.group(rest)
+
+def iter_symbolic(lines, language):
+    """Yield the symbolic line for each statement line of lines, a file object or any iterable."""
+    rec = recogniser(language)
+    matchers, general, actions = rec.matchers, rec.general, rec.actions
+    comments, block_comments, skip_starts = rec.comments, rec.block_comments, rec.skip_starts
+    closer = None  # what ends the comment or docstring being skipped
+    for line in lines:
         stripped = line.strip()
-        if not stripped or stripped.startswith(("//", "#")):
+        if closer is not None:
+            if closer in stripped:
+                closer = None
+            continue
+        first = stripped[:1]
+        if first in skip_starts:
+            if not stripped.lstrip(_BRACKETS) or stripped.startswith(comments):
+                continue
+            if stripped.startswith(block_comments):
+                opener = stripped[:3] if stripped[:3] in ('"""', "'''") else stripped[:2]
+                end = "*/" if opener == "/*" else opener
+                if end not in stripped[len(opener):]:
+                    closer = end
+                continue
+        found = matchers.get(first, general)(stripped)
+        if found is None:
+            yield "// Could not parse: " + stripped
             continue
+        action = actions[found.lastgroup]
+        if action.__class__ is str:
+            yield action
+        elif action is not None:
+            yield action(found, stripped)
+
+def reverse_parser(code_lines, language):
+    return list(iter_symbolic(code_lines, language))
+
+def reverse_file(path, language=None):
+    """Yield the symbolic lines of a source file, reading it as they are produced."""
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        yield from iter_symbolic(f, language or detect_language_by_extension(path))
 
-        l = stripped.lower()
-
-        if "print" in l:
-            symbolic_lines.append("Symbolic: print(" + stripped.split("(", 1)[-1].rsplit(")", 1)[0] + ")")
-        elif "=" in l and "==" not in l:
-            symbolic_lines.append("Symbolic: let " + stripped)
-        elif l.startswith("def ") or "function" in l or l.startswith("fn "):
-            func_part = stripped.split("(", 1)[0].split()[-1]
-            args = stripped.split("(", 1)[-1].rsplit(")", 1)[0]
-            symbolic_lines.append(f"Symbolic: function {func_part}({args})")
-        elif "return " in l:
-            symbolic_lines.append("Symbolic: return " + stripped.split("return", 1)[-1].strip())
-        elif "if " in l:
-            cond = stripped.split("if", 1)[-1].split(":")[0].strip("() {}:")
-            symbolic_lines.append("Symbolic: if " + cond)
-        elif "for " in l or "while" in l:
-            symbolic_lines.append("Symbolic: loop " + stripped)
-        elif "class " in l:
-            symbolic_lines.append("Symbolic: class " + stripped.split("class", 1)[-1].strip())
-        elif "switch" in l:
-            symbolic_lines.append("Symbolic: switch " + stripped.split("switch", 1)[-1].strip())
-        elif "import " in l:
-            symbolic_lines.append("Symbolic: import " + stripped.split("import", 1)[-1].strip())
-        elif "try" in l:
-            symbolic_lines.append("Symbolic: try")
-        elif "throw" in l:
-            symbolic_lines.append("Symbolic: throw error")
-        elif "continue" in l:
-            symbolic_lines.append("Symbolic: continue")
-        elif "break" in l:
-            symbolic_lines.append("Symbolic: break")
-        elif "await" in l:
-            symbolic_lines.append("Symbolic: await result")
-        elif "async" in l:
-            symbolic_lines.append("Symbolic: async fetch(url)")
-        elif "yield" in l:
-            symbolic_lines.append("Symbolic: yield value")
-        elif "+" in l or "-" in l or "*" in l or "/" in l:
-            symbolic_lines.append("Symbolic: operator " + stripped)
-        elif "namespace" in l:
-            symbolic_lines.append("Symbolic: namespace " + stripped.split("namespace", 1)[-1].strip())
-        elif "main" in l:
-            symbolic_lines.append("Symbolic: main")
-        else:
-            symbolic_lines.append("// Could not parse: " + stripped)
-
-    return symbolic_lines
+if __name__ == "__main__":
+    for path in sys.argv[1:]:
+        for symbolic in reverse_file(path):
+            print(symbolic)
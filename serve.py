@@ -0,0 +1,115 @@
+# serve.py
+#
+# Production server for the web app, instead of the Flask development
+# server:
+#
+#     python serve.py                          # one worker per CPU
+#     python serve.py --workers 4 --threads 8 --backlog 64
+#
+# Each worker process handles up to --threads requests at once; connections
+# beyond those wait in a listen queue of --backlog, and past that are
+# refused by the operating system. Within a worker, app.MAX_PENDING bounds
+# how many /process requests run at once (see USL_MAX_PENDING).
+#
+# Uses gunicorn where it is installed, else waitress, else Werkzeug's
+# threaded server, which runs a single process.
+#
+# With several worker processes, /process renders serially in each (the
+# workers already use the CPUs, and a transpile pool per worker would only
+# oversubscribe them) unless USL_POOL says otherwise, and results are also
+# kept in a directory the workers share, so that a download finds its
+# result whichever worker it reaches.
+
+import argparse
+import importlib.util
+import os
+import sys
+import tempfile
+
+def configure(module, workers):
+    # Adjust the objects app.py made from the environment for several workers
+    if workers <= 1:
+        return
+    if "USL_POOL" not in os.environ:
+        module.transpile_pool.backend = "serial"
+    if module.result_store.directory is None:
+        module.result_store.directory = tempfile.mkdtemp(prefix="usl_results_")
+
+def serve_gunicorn(application, args):
+    from gunicorn.app.base import BaseApplication
+
+    class Server(BaseApplication):
+        def load_config(self):
+            settings = {
+                "bind": f"{args.host}:{args.port}",
+                "workers": args.workers,
+                "worker_class": "gthread",
+                "threads": args.threads,
+                "backlog": args.backlog,
+                "timeout": args.timeout,
+            }
+            for key, value in settings.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return application
+
+    Server().run()
+
+def serve_waitress(application, args):
+    import waitress
+    waitress.serve(application, host=args.host, port=args.port, threads=args.threads,
+                   backlog=args.backlog, connection_limit=args.threads + args.backlog,
+                   channel_timeout=args.timeout)
+
+def serve_werkzeug(application, args):
+    from werkzeug.serving import ThreadedWSGIServer
+
+    class Server(ThreadedWSGIServer):
+        request_queue_size = args.backlog
+
+    server = Server(args.host, args.port, application)
+    print(f"Serving on http://{args.host}:{args.port} (Werkzeug, 1 process)", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+def choose_server(args):
+    if sys.platform != "win32" and importlib.util.find_spec("gunicorn"):
+        return serve_gunicorn
+    if importlib.util.find_spec("waitress"):
+        args.workers = 1  # waitress runs one process
+        return serve_waitress
+    if args.workers > 1:
+        print("Neither gunicorn nor waitress is installed; serving from 1 process. "
+              "Install gunicorn for more workers.", file=sys.stderr)
+    args.workers = 1
+    return serve_werkzeug
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(prog="serve", description="Serve the USL web app.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", "10000")))
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("USL_WORKERS", "0")) or os.cpu_count() or 1,
+                        help="worker processes (default: USL_WORKERS, else one per CPU)")
+    parser.add_argument("--threads", type=int, default=int(os.environ.get("USL_THREADS", "4")),
+                        help="requests each worker handles at once (default 4)")
+    parser.add_argument("--backlog", type=int, default=int(os.environ.get("USL_BACKLOG", "64")),
+                        help="connections waiting for a thread before new ones are refused (default 64)")
+    parser.add_argument("--timeout", type=int, default=60,
+                        help="seconds before a stuck request is abandoned (default 60)")
+    return parser
+
+def main(argv=None, module=None):
+    args = build_arg_parser().parse_args(argv)
+    serve = choose_server(args)
+    if module is None:
+        import app as module
+    configure(module, args.workers)
+    serve(module.app, args)
+
+if __name__ == "__main__":
+    main()
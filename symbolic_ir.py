@@ -0,0 +1,93 @@
+# symbolic_ir.py
+#
+# The language-neutral form of a /process request. `Symbolic:` lines are
+# classified once into Statements (a kind plus its operands), and so are
+# the `Symbolic[lang]:` lines that override them for one language. Each
+# target language then only renders its templates over the statements it
+# gets: its overrides if the input has any, otherwise the shared ones.
+#
+# Kinds that have a structure template (print, assign, if, function,
+# return, comment) render through it; "note" and "error" become a line in
+# the language's comment syntax.
+
+class Statement:
+    __slots__ = ("kind", "operands", "source")
+
+    def __init__(self, kind, operands, source):
+        self.kind = kind
+        self.operands = operands
+        self.source = source  # the symbolic text, for error messages
+
+    def __repr__(self):
+        return f"Statement({self.kind!r}, {self.operands!r})"
+
+class SymbolicProgram:
+    def __init__(self, shared, overrides):
+        self.shared = shared  # Statements from `Symbolic:` lines
+        self.overrides = overrides  # language -> Statements from `Symbolic[language]:` lines
+
+    def statements_for(self, lang):
+        return self.overrides.get(lang) or self.shared
+
+    def size(self):
+        """Number of statements, shared and overriding."""
+        return len(self.shared) + sum(len(statements) for statements in self.overrides.values())
+
+    def render(self, language):
+        return render(self, language)
+
+def classify(symbolic):
+    """Turn one symbolic statement into a Statement."""
+    try:
+        if "print(" in symbolic:
+            value = symbolic.split("print(", 1)[1].split(")", 1)[0]
+            return Statement("print", (value,), symbolic)
+        if "let " in symbolic and "=" in symbolic:
+            assign = symbolic.split("let ", 1)[1]
+            left, right = assign.split("=", 1)
+            return Statement("assign", (left.strip(), right.strip()), symbolic)
+        if symbolic.startswith("if "):
+            return Statement("if", (symbolic[3:], "pass"), symbolic)
+        if symbolic.startswith("function "):
+            head = symbolic.split("function", 1)[-1].strip()
+            if "(" in head:
+                name, args = head.split("(", 1)
+                return Statement("function", (name.strip(), args.rstrip(")"), "pass"), symbolic)
+            return Statement("note", ("Invalid function format: " + symbolic,), symbolic)
+        if symbolic.startswith("return "):
+            return Statement("return", (symbolic[7:].strip(),), symbolic)
+        if symbolic.startswith("comment "):
+            return Statement("comment", (symbolic[8:].strip().strip('"'),), symbolic)
+        return Statement("note", ("Unrecognized: " + symbolic,), symbolic)
+    except Exception as e:
+        return Statement("error", (f"Error: {e} in line: {symbolic}",), symbolic)
+
+def build_program(lines):
+    """Classify the symbolic lines of a request, once for every language."""
+    shared, overrides = [], {}
+    for line in lines:
+        line = line.strip()
+        if line.startswith("Symbolic["):
+            end = line.find("]")
+            if end != -1:
+                statement = classify(line.split("]:", 1)[-1].strip())
+                overrides.setdefault(line[9:end], []).append(statement)
+        elif line.startswith("Symbolic:"):
+            shared.append(classify(line.split(":", 1)[-1].strip()))
+    return SymbolicProgram(shared, overrides)
+
+def render(program, language):
+    """The source text of program in one language (a syntax_registry.LanguageSyntax)."""
+    comment = language.comment
+    out = [comment.format(f"This is {language.name} syntax")]
+    for statement in program.statements_for(language.name):
+        kind = statement.kind
+        try:
+            if kind == "note" or kind == "error":
+                out.append(comment.format(*statement.operands))
+            else:
+                out.append(language.formatter(kind)(*statement.operands))
+        except Exception as e:
+            out.append(comment.format(f"Error: {e} in line: {statement.source}"))
+    out.append("")
+    return "\n".join(out)
@@ -0,0 +1,131 @@
+# syntax_registry.py
+#
+# The syntax template table behind app.py, loaded once instead of on every
+# request. Each language's `structure` templates are compiled into
+# Formatters when the file is read: the number of "{}" fields is counted and
+# the template is test-formatted once, so rendering a line is a single
+# str.format call and a broken template is known up front. The table is
+# reloaded when the file's mtime or size changes, so edits to the JSON show
+# up without restarting the server.
+#
+# Requests work on a SyntaxTable snapshot from TemplateRegistry.current().
+# A reload builds a new snapshot and swaps it in, so a request never sees a
+# table that is half old and half new.
+
+import hashlib
+import json
+import os
+import threading
+
+INVALID_TEMPLATE = "// Invalid template"
+
+class Formatter:
+    """A structure template compiled for repeated rendering."""
+    __slots__ = ("template", "arity", "format")
+
+    def __init__(self, template):
+        self.template = template
+        self.format = None  # stays None for a template that cannot be rendered
+        if not isinstance(template, str):
+            self.arity = 0
+            return
+        self.arity = template.count("{}")
+        try:
+            template.format(*[""] * self.arity)
+        except (IndexError, KeyError, ValueError):
+            return
+        self.format = template.format
+
+    def __call__(self, *values):
+        # Values are repeated to fill every field and extras are dropped,
+        # so a template with more or fewer fields than the node still renders
+        render = self.format
+        if render is None:
+            return INVALID_TEMPLATE
+        arity = self.arity
+        if len(values) != arity:
+            if not values:
+                return INVALID_TEMPLATE
+            values = (values * arity)[:arity]
+        return render(*values)
+
+# What transpile falls back to for a missing structure key
+DEFAULT_TEMPLATES = {
+    "print": "{}",
+    "assign": "{} = {}",
+    "if": "if {}:\n    {}",
+    "function": "def {}({}):\n    {}",
+    "return": "return {}",
+    "comment": "# {}",
+}
+_DEFAULT_FORMATTERS = {key: Formatter(template) for key, template in DEFAULT_TEMPLATES.items()}
+
+class LanguageSyntax:
+    """The compiled templates of one language."""
+    __slots__ = ("name", "extension", "comment", "formatters", "emitter")
+
+    def __init__(self, name, entry):
+        structure = entry.get("structure", {})
+        extensions = entry.get("file_extensions", [])
+        self.name = name
+        self.extension = extensions[0] if extensions else name[:3]
+        # The raw comment template; app.transpile formats it directly
+        self.comment = structure.get("comment", DEFAULT_TEMPLATES["comment"])
+        self.formatters = {key: Formatter(template) for key, template in structure.items()}
+        self.emitter = None  # codegen.Emitter, built the first time it is needed
+
+    @property
+    def filename(self):
+        return f"{self.name}.{self.extension}"
+
+    def formatter(self, key):
+        formatter = self.formatters.get(key)
+        return formatter if formatter is not None else _DEFAULT_FORMATTERS[key]
+
+class SyntaxTable:
+    """One loaded version of the template file."""
+
+    def __init__(self, data, version):
+        self.version = version  # hash of the file contents
+        self.languages = {name: LanguageSyntax(name, entry) for name, entry in data.items()}
+        self.names = sorted(data)
+
+    def language(self, name):
+        syntax = self.languages.get(name)
+        if syntax is None:
+            # Unknown names render with the default templates, as before;
+            # they come from requests, so they are not kept
+            syntax = LanguageSyntax(name, {})
+        return syntax
+
+class TemplateRegistry:
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.stamp = None  # (mtime_ns, size) of the file behind self.table
+        self.table = None
+        self.current()
+
+    def current(self):
+        """The up-to-date SyntaxTable, reloading the file if it has changed."""
+        stat = os.stat(self.path)
+        if (stat.st_mtime_ns, stat.st_size) != self.stamp:
+            with self.lock:
+                if (stat.st_mtime_ns, stat.st_size) != self.stamp:
+                    self.reload(stat)
+        return self.table
+
+    def reload(self, stat):
+        with open(self.path, "rb") as f:
+            data = f.read()
+        try:
+            table = SyntaxTable(json.loads(data.decode("utf-8")),
+                                hashlib.sha256(data).hexdigest()[:16])
+        except ValueError:
+            if self.table is None:
+                raise
+            # Most likely caught mid-write; keep serving the previous table
+            # and look again on the next request
+            return
+        self.table = table
+        self.stamp = (stat.st_mtime_ns, stat.st_size)
@@ -0,0 +1,208 @@
+# test_app.py
+#
+#     python -m unittest test_app
+
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+import zipfile
+from unittest import mock
+
+# Render in the request thread: no worker processes for a test
+os.environ.setdefault('USL_POOL', 'serial')
+UPLOAD_DIR_EXISTED = os.path.isdir('usl_web_uploads')
+
+import app
+from result_store import ResultStore
+from syntax_registry import TemplateRegistry
+from transpile_cache import TranspileCache
+from transpile_pool import TranspilePool
+
+SOURCE = 'x = 1;\nprint(x);\n'
+
+def tearDownModule():
+    # Importing app makes its upload directory in the working directory
+    if not UPLOAD_DIR_EXISTED:
+        shutil.rmtree('usl_web_uploads', ignore_errors=True)
+
+class AppTestCase(unittest.TestCase):
+    def setUp(self):
+        # Fresh state for each test, rendered from a copy of the template
+        # file that a test may edit
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.syntax_file = os.path.join(directory.name, 'syntax.json')
+        shutil.copyfile(app.SYNTAX_FILE, self.syntax_file)
+        registry = TemplateRegistry(self.syntax_file)
+        self.cache = TranspileCache(current_version=lambda: registry.current().version)
+        self.slots = threading.BoundedSemaphore(2)
+        for name, value in {'syntax_registry': registry,
+                            'transpile_pool': TranspilePool(self.syntax_file, 'serial'),
+                            'result_store': ResultStore(),
+                            'transpile_cache': self.cache,
+                            'process_slots': self.slots}.items():
+            patcher = mock.patch.object(app, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.client = app.app.test_client()
+
+    def process(self, **data):
+        data.setdefault('languages', ['python', 'c'])
+        return self.client.post('/process', data=data)
+
+    def assertFailure(self, response, status, message):
+        self.assertEqual(response.status_code, status)
+        self.assertEqual(response.get_json(), {'success': False, 'error': message})
+
+    def assertSlotsFree(self):
+        for _ in range(2):
+            self.assertTrue(self.slots.acquire(blocking=False))
+        self.assertFalse(self.slots.acquire(blocking=False))
+
+class ProcessTests(AppTestCase):
+    def test_form_input(self):
+        response = self.process(usl_code=SOURCE, languages=['python', 'usl'])
+        self.assertEqual(response.status_code, 200)
+        body = response.get_json()
+        self.assertTrue(body['success'])
+        self.assertEqual(sorted(body['outputs']), ['python', 'usl'])
+        self.assertIn('print(x)', body['outputs']['python'])
+        self.assertEqual(body['outputs']['usl'], SOURCE.rstrip('\n'))
+        self.assertEqual(body['download_url'], f'/download/{body["result_id"]}')
+        self.assertSlotsFree()
+
+    def test_file_input(self):
+        response = self.process(usl_file=(io.BytesIO(SOURCE.encode()), 'a.usl'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sorted(response.get_json()['outputs']), ['c', 'python'])
+
+    def test_busy_when_slots_are_full(self):
+        for _ in range(2):
+            self.slots.acquire()
+        for path in ('/process', '/batch'):
+            with self.subTest(path):
+                response = self.client.post(path, data={'usl_code': SOURCE})
+                self.assertFailure(response, 503, app.BUSY)
+                self.assertEqual(response.headers['Retry-After'], '1')
+        self.slots.release()
+        self.assertEqual(self.process(usl_code=SOURCE).status_code, 200)
+
+    def test_oversized_body(self):
+        large = 'x = 1;\n' * (app.MAX_UPLOAD // 7 + 1)
+        for data in ({'usl_code': large},
+                     {'usl_file': (io.BytesIO(large.encode()), 'a.usl')}):
+            with self.subTest(next(iter(data))):
+                self.assertFailure(self.process(**data), 413, app.TOO_LARGE)
+        self.assertSlotsFree()
+
+    def test_non_utf8_upload(self):
+        response = self.process(usl_file=(io.BytesIO(b'print("\xff\xfe");\n'), 'a.usl'))
+        self.assertFailure(response, 400, app.NOT_UTF8)
+        self.assertSlotsFree()
+
+class PoolTests(AppTestCase):
+    def test_backends_render_alike(self):
+        languages = ['python', 'c', 'java', 'rust', 'usl', 'no-such-language']
+        expected = self.process(usl_code=SOURCE, languages=languages).get_json()
+        for backend in ('thread', 'process'):
+            with self.subTest(backend):
+                # Every request split over two workers, however small
+                pool = TranspilePool(self.syntax_file, backend, 2, min_parallel_work=0)
+                self.addCleanup(pool.shutdown)
+                self.cache.clear()
+                with mock.patch.object(app, 'transpile_pool', pool):
+                    body = self.process(usl_code=SOURCE, languages=languages).get_json()
+                self.assertEqual(body['outputs'], expected['outputs'])
+                self.assertIsNotNone(pool.executor)
+
+class DownloadTests(AppTestCase):
+    def test_zip_of_the_outputs(self):
+        body = self.process(usl_code=SOURCE, languages=['python', 'c', 'usl']).get_json()
+        response = self.client.get(body['download_url'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'application/zip')
+        self.assertIn('all_outputs.zip', response.headers['Content-Disposition'])
+        self.assertTrue(response.is_streamed)
+        with zipfile.ZipFile(io.BytesIO(response.get_data())) as archive:
+            self.assertIsNone(archive.testzip())
+            files = {name: archive.read(name).decode() for name in archive.namelist()}
+        syntax = app.syntax_registry.current()
+        self.assertEqual(files, {
+            syntax.language('python').filename: body['outputs']['python'],
+            syntax.language('c').filename: body['outputs']['c'],
+            'usl_input_original.usl': SOURCE,
+        })
+
+    def test_unknown_result(self):
+        self.assertEqual(self.client.get('/download/nothing').status_code, 404)
+
+class BatchTests(AppTestCase):
+    def batch(self, files, languages):
+        return self.client.post('/batch', data={'files': files, 'languages': languages})
+
+    def test_records(self):
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, 'w') as z:
+            z.writestr('src/b.usl', 'print(2);\n')
+            z.writestr('notes.txt', 'not USL')
+        archive.seek(0)
+        response = self.batch([(io.BytesIO(SOURCE.encode()), 'a.usl'),
+                               (archive, 'more.zip'),
+                               (io.BytesIO(b'\xff\n'), 'bad.usl')],
+                              ['usl', 'python'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        records = [json.loads(line) for line in response.get_data().splitlines()]
+        self.assertEqual([(r.get('file'), r.get('language')) for r in records], [
+            ('a.usl', 'usl'), ('a.usl', 'python'),
+            ('src/b.usl', 'usl'), ('src/b.usl', 'python'),
+            ('bad.usl', None), (None, None),
+        ])
+        self.assertEqual(records[0]['output'], SOURCE)
+        self.assertIn('print(x)', records[1]['output'])
+        self.assertEqual(records[3]['path'], 'src/b.pyt')
+        self.assertEqual(records[4], {'file': 'bad.usl', 'error': 'not UTF-8 text'})
+        self.assertEqual(records[5], {'done': True, 'files': 3, 'outputs': 4, 'errors': 1})
+        # The slot is held until the server closes the streamed response
+        response.close()
+        self.assertSlotsFree()
+
+    def test_nothing_to_do(self):
+        self.assertEqual(self.batch([], ['python']).status_code, 400)
+        response = self.batch([(io.BytesIO(b'not USL'), 'notes.zip')], ['python'])
+        self.assertEqual(response.status_code, 400)
+        self.assertSlotsFree()
+
+class CacheTests(AppTestCase):
+    def test_repeated_input_is_served_from_the_cache(self):
+        first = self.process(usl_code=SOURCE).get_json()['outputs']
+        self.assertEqual(self.cache.stats()['misses'], 2)
+        self.assertEqual(self.process(usl_code=SOURCE).get_json()['outputs'], first)
+        self.assertEqual(self.cache.stats()['hits'], 2)
+
+    def test_template_edit_moves_the_version(self):
+        self.process(usl_code=SOURCE)
+        before = self.client.get('/cache/stats').get_json()
+        self.assertEqual(before['version'], app.syntax_registry.current().version)
+
+        with open(self.syntax_file, encoding='utf-8') as f:
+            templates = json.load(f)
+        templates['python']['structure']['print'] = 'echo({})'
+        with open(self.syntax_file, 'w', encoding='utf-8') as f:
+            json.dump(templates, f)
+
+        outputs = self.process(usl_code=SOURCE).get_json()['outputs']
+        after = self.client.get('/cache/stats').get_json()
+        self.assertNotEqual(after['version'], before['version'])
+        self.assertEqual(after['version'], app.syntax_registry.current().version)
+        # Both languages are rendered again from the new templates
+        self.assertEqual(after['misses'], before['misses'] + 2)
+        self.assertEqual(after['hits'], 0)
+        self.assertIn('echo(x)', outputs['python'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+# test_asgi.py
+#
+#     python -m unittest test_asgi
+
+import asyncio
+import json
+import os
+import shutil
+import threading
+import unittest
+from unittest import mock
+
+os.environ.setdefault('USL_POOL', 'serial')
+UPLOAD_DIR_EXISTED = os.path.isdir('usl_web_uploads')
+
+import asgi
+import app as web
+
+BODY = b'usl_code=print(1)%3B&languages=python'
+
+def tearDownModule():
+    # Importing app makes its upload directory in the working directory
+    if not UPLOAD_DIR_EXISTED:
+        shutil.rmtree('usl_web_uploads', ignore_errors=True)
+
+def scope(length=len(BODY)):
+    return {'type': 'http', 'method': 'POST', 'path': '/process', 'query_string': b'',
+            'headers': [(b'content-type', b'application/x-www-form-urlencoded'),
+                        (b'content-length', str(length).encode())]}
+
+class Client:
+    """receive and send for one request, whose body arrives in chunks once released."""
+
+    def __init__(self, chunks):
+        self.chunks = list(chunks)
+        self.released = asyncio.Event()
+        self.waiting = asyncio.Event()  # set once the app has asked for the body
+        self.messages = []
+
+    async def receive(self):
+        self.waiting.set()
+        await self.released.wait()
+        chunk = self.chunks.pop(0)
+        return {'type': 'http.request', 'body': chunk, 'more_body': bool(self.chunks)}
+
+    async def send(self, message):
+        self.messages.append(message)
+
+    def response(self):
+        status = self.messages[0]['status']
+        return status, json.loads(b''.join(m.get('body', b'') for m in self.messages[1:]))
+
+class ProcessTests(unittest.TestCase):
+    def setUp(self):
+        self.slots = threading.BoundedSemaphore(1)
+        patcher = mock.patch.object(web, 'process_slots', self.slots)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_upload_holds_no_slot(self):
+        async def run():
+            client = Client([BODY[:10], BODY[10:]])
+            request = asyncio.create_task(asgi.app(scope(), client.receive, client.send))
+            await client.waiting.wait()
+            # While the body is on its way the slot is free for others
+            self.assertTrue(self.slots.acquire(blocking=False))
+            self.slots.release()
+            client.released.set()
+            await request
+            return client.response()
+        status, body = asyncio.run(run())
+        self.assertEqual(status, 200)
+        self.assertIn('print(1)', body['outputs']['python'])
+        self.assertTrue(self.slots.acquire(blocking=False))
+
+    def test_busy_once_the_body_is_read(self):
+        async def run():
+            client = Client([BODY])
+            client.released.set()
+            await asgi.app(scope(), client.receive, client.send)
+            return client.response()
+        self.slots.acquire()
+        self.assertEqual(asyncio.run(run()), (503, {'success': False, 'error': web.BUSY}))
+        self.slots.release()
+
+    def test_oversized_body_needs_no_slot(self):
+        async def run():
+            client = Client([b'x' * (web.MAX_UPLOAD + 1)])
+            client.released.set()
+            await asgi.app(scope(0), client.receive, client.send)
+            return client.response()
+        self.slots.acquire()
+        self.assertEqual(asyncio.run(run()), (413, {'success': False, 'error': web.TOO_LARGE}))
+        self.slots.release()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+# test_codegen.py
+#
+#     python -m unittest test_codegen
+
+import os
+import unittest
+
+import codegen
+from syntax_registry import TemplateRegistry
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SYNTAX = TemplateRegistry(os.path.join(BASE_DIR, 'syntax_templates_fully_extended.json')).current()
+
+def rendered(source, lang):
+    """The lines of source transpiled into lang, without template comments."""
+    text = codegen.build_program(source.split('\n')).render(SYNTAX.language(lang))
+    prefix = SYNTAX.language(lang).comment.split('\n')[-1].format('').strip()
+    return [line for line in text.split('\n')
+            if not line.strip().startswith(prefix) or 'Unsupported' in line]
+
+class CodegenTestCase(unittest.TestCase):
+    def assertRuns(self, lines, expected):
+        """expected appears in lines as a run of consecutive lines."""
+        for start in range(len(lines) - len(expected) + 1):
+            if lines[start:start + len(expected)] == expected:
+                return
+        self.fail('\n'.join(['Not found:', *expected, 'In:', *lines]))
+
+class ExampleTests(CodegenTestCase):
+    def setUp(self):
+        with open(os.path.join(BASE_DIR, 'example.usl'), encoding='utf-8') as f:
+            self.source = f.read()
+
+    def test_python(self):
+        lines = rendered(self.source, 'python')
+        self.assertRuns(lines, [
+            'def factorial(n):',
+            '    if n == 0:',
+            '        return 1',
+        ])
+        # __init__'s body is the constructor's; the other methods follow it
+        self.assertRuns(lines, [
+            'class Animal {',
+            '    constructor(name) {',
+            '        self.name = name',
+            '    }',
+            '    def speak(self):',
+            '        print(self.name + " makes a sound.")',
+            '}',
+        ])
+        self.assertRuns(lines, [
+            '# Unsupported base class: class Dog extends Animal',
+            'class Dog {',
+            '    constructor() {',
+            '    }',
+            '    def speak(self):',
+        ])
+        self.assertRuns(lines, ['dog = Dog("Buddy")', 'dog.speak()'])
+
+    def test_c(self):
+        lines = rendered(self.source, 'c')
+        self.assertRuns(lines, [
+            'void factorial(n) {',
+            '    if (n == 0) {',
+            '        return 1',
+            '    }',
+        ])
+        self.assertRuns(lines, [
+            'class Animal {',
+            '    constructor(name) {',
+            '        int self.name = name;',
+            '    }',
+            '    void speak(self) {',
+        ])
+        self.assertRuns(lines, ['// Unsupported base class: class Dog extends Animal', 'class Dog {'])
+
+class LoopTests(CodegenTestCase):
+    def test_range_loop_counts(self):
+        self.assertRuns(rendered('for (x in range(3)) { print(x); }', 'python'), [
+            'for x in range(3):',
+            '    print(x)',
+        ])
+        self.assertRuns(rendered('for (x in range(3)) { print(x); }', 'c'), [
+            'for (int x = 0; x < 3; x++) {',
+        ])
+
+    def test_other_iterables_are_not_counted(self):
+        for lang in ('python', 'c'):
+            with self.subTest(lang):
+                lines = rendered('for (x in items) { print(x); }', lang)
+                self.assertFalse(any('items' in line for line in lines
+                                     if 'Unsupported' not in line), lines)
+                self.assertTrue(any('Unsupported loop: for (x in items)' in line for line in lines))
+
+    def test_continue_runs_the_update(self):
+        source = '''for (i = 0; i < 3; step()) {
+    if (i == 1) { continue; }
+    for (x in range(2)) { continue; }
+    print(i);
+}'''
+        python = rendered(source, 'python')
+        self.assertRuns(python, ['    if i == 1:', '        step()', '        continue'])
+        # The inner loop's continue is its own
+        self.assertRuns(python, ['    for x in range(2):', '        continue'])
+        self.assertRuns(python, ['    print(i)', '    step()', '}'])
+        c = rendered(source, 'c')
+        self.assertRuns(c, ['    if (i == 1) {', '        step()', '        continue', '    }'])
+        self.assertRuns(c, ['    printf("i\\n", i);', '    step()', '}'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+# test_engines.py
+#
+#     python -m unittest test_engines
+
+import unittest
+
+from usl_programs import CONFORMANCE, PROGRAMS, run_capturing_errors
+
+ENGINES = ('tree', 'closure', 'vm')
+
+class EngineTestCase(unittest.TestCase):
+    def assertSameOutput(self, source, expected=None):
+        """Every engine prints what the tree walker prints, errors included."""
+        reference = run_capturing_errors('tree', source)
+        for engine in ENGINES[1:]:
+            self.assertEqual(run_capturing_errors(engine, source), reference, engine)
+        if expected is not None:
+            self.assertEqual(reference, expected)
+
+class EquivalenceTests(EngineTestCase):
+    def test_verify_programs(self):
+        for name, source in {**CONFORMANCE, **PROGRAMS}.items():
+            with self.subTest(name):
+                self.assertSameOutput(source)
+
+class MisplacedStatementTests(EngineTestCase):
+    # Each fails when it runs, after the earlier output, at its own line
+    CASES = {
+        'top-level return': ('print(1);\nreturn 5;\nprint(2);\n',
+                             '1\nUslError: "return" outside function at line 2\n'),
+        'return value is not evaluated': ('return print(1);\n',
+                                          'UslError: "return" outside function at line 1\n'),
+        'break in an if': ('print(1);\nif (True) {\n    break;\n}\n',
+                           '1\nUslError: "break" outside loop at line 3\n'),
+        'break in a function called in a loop': (
+            'def stop() {\n    print("stop");\n    break;\n}\n'
+            'while (True) {\n    stop();\n}\n',
+            'stop\nUslError: "break" outside loop at line 3\n'),
+        'continue in a class body in a loop': (
+            'for (i in range(3)) {\n    print(i);\n    class A {\n        continue;\n    }\n}\n',
+            '0\nUslError: "continue" outside loop at line 4\n'),
+        'return in a class body in a function': (
+            'def make() {\n    class A {\n        return 1;\n    }\n}\nprint("made");\nmake();\n',
+            'made\nUslError: "return" outside function at line 3\n'),
+    }
+
+    def test_cases(self):
+        for name, (source, expected) in self.CASES.items():
+            with self.subTest(name):
+                self.assertSameOutput(source, expected)
+
+    def test_in_place_statements_still_work(self):
+        self.assertSameOutput('''
+            def first_odd(items) {
+                for (item in items) {
+                    if (item % 2 == 0) { continue; }
+                    return item;
+                }
+            }
+            i = 0;
+            while (True) {
+                i = i + 1;
+                if (i == 3) { break; }
+            }
+            print(first_odd(range(5)), i);
+        ''', '1 3\n')
+
+class TailCallTests(EngineTestCase):
+    def test_deep_tail_calls_run_in_constant_stack(self):
+        # Far deeper than Python's recursion limit: plain, method and mutual
+        # tail calls, and a tail call from inside a loop
+        self.assertSameOutput(CONFORMANCE['tail_calls'], '5000050000 done False 4\n')
+
+    def test_deep_non_tail_recursion_is_reported(self):
+        source = ('def sum(n) {\n    if (n == 0) { return 0; }\n    return n + sum(n - 1);\n}\n'
+                  'print(sum(100000));\n')
+        for engine in ('tree', 'closure'):
+            with self.subTest(engine):
+                self.assertEqual(run_capturing_errors(engine, source),
+                                 'UslError: Maximum recursion depth exceeded at line 3\n')
+        # The VM keeps USL frames on a list, so it has no such limit
+        self.assertEqual(run_capturing_errors('vm', source), '5000050000\n')
+
+if __name__ == '__main__':
+    unittest.main()
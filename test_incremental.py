@@ -0,0 +1,123 @@
+# test_incremental.py
+#
+#     python -m unittest test_incremental
+
+import random
+import unittest
+
+from ast_nodes import dump
+from error import UslError
+from incremental import Document
+from lexer import tokenize
+from parser import Parser
+
+SOURCE = '''x = 1;
+def f(a, b) {
+    y = a * 2 + b;
+    if (y > 10) {
+        return y - 1;
+    } else {
+        print("small");
+    }
+    return y;
+}
+class Point {
+    def __init__(self, x) { self.x = x; }
+}
+for (i in range(3)) { print(f(i, x)); }
+# a comment
+s = "text";
+'''
+
+STATEMENTS = ['z = 2;', 'print(x);', 'def g() { return 1; }', 'while (x < 3) { x = x + 1; }',
+              'if (x) { y = 1; } else { y = 2; }', '# note']
+
+def random_edit(rng, text):
+    """(offset, deleted, inserted) for an edit that keeps text valid USL."""
+    starts = [0] + [i + 1 for i, c in enumerate(text) if c == '\n' and i + 1 < len(text)]
+    kind = rng.randrange(4)
+    if kind == 0:  # a new line with a statement
+        return rng.choice(starts + [len(text)]), 0, rng.choice(STATEMENTS) + '\n'
+    if kind == 1:  # delete a line holding a simple statement
+        simple = [i for i in starts if text[i:text.index('\n', i)].rstrip().endswith(';')
+                  and '{' not in text[i:text.index('\n', i)]]
+        if simple:
+            start = rng.choice(simple)
+            return start, text.index('\n', start) + 1 - start, ''
+    if kind == 2:  # type a letter at the end of a name
+        ends = [i for i in range(1, len(text)) if text[i - 1] in 'xyzab' and not text[i].isalnum()]
+        if ends:
+            return rng.choice(ends), 0, 'q'
+    # break a line after a semicolon or an opening brace
+    breaks = [i + 1 for i, c in enumerate(text) if c in ';{']
+    return rng.choice(breaks), 0, '\n' + ' ' * rng.randrange(4)
+
+def full_parse(text):
+    """dump() of text parsed from scratch, or None if it has a syntax error."""
+    try:
+        return dump(Parser(tokenize(text)).parse())
+    except UslError:
+        return None
+
+def incremental_parse(document):
+    try:
+        return dump(document.program)
+    except UslError:
+        return None
+
+class DocumentTests(unittest.TestCase):
+    def assertMatchesFullParse(self, document):
+        self.assertEqual(incremental_parse(document), full_parse(document.text), document.text)
+
+    def test_new_document(self):
+        self.assertMatchesFullParse(Document(SOURCE))
+        self.assertMatchesFullParse(Document(''))
+
+    def test_edits(self):
+        document = Document(SOURCE)
+        for offset, deleted, inserted in ((0, 0, 'w = 0;\n'), (SOURCE.index('print'), 0, '\n\n'),
+                                          (len(document.text), 0, 'print(s);\n')):
+            with self.subTest(inserted=inserted):
+                try:
+                    document.edit(offset, deleted, inserted)
+                except UslError:
+                    pass
+                self.assertMatchesFullParse(document)
+
+    def test_line_numbers_after_edits_above(self):
+        document = Document(SOURCE)
+        document.program  # read once, then shift every later statement
+        document.edit(0, 0, 'a = 1;\nb = 2;\n')
+        document.edit(len('a = 1;\n'), len('b = 2;\n'), '')
+        self.assertEqual([stmt.line for stmt in document.program.statements],
+                         [1, 2, 3, 12, 15, 17])
+        self.assertMatchesFullParse(document)
+
+    def test_broken_edit_is_reported_until_fixed(self):
+        document = Document(SOURCE)
+        at = SOURCE.index('s = ')
+        with self.assertRaises(UslError):
+            document.edit(at, 0, 'if (x) {')
+        with self.assertRaises(UslError):
+            document.program
+        document.edit(at, len('if (x) {'), '')
+        self.assertMatchesFullParse(document)
+
+    def test_random_edits(self):
+        rng = random.Random(12)
+        for run in range(20):
+            document = Document(SOURCE)
+            for step in range(30):
+                document.edit(*random_edit(rng, document.text))
+                with self.subTest(run=run, step=step):
+                    self.assertIsNotNone(full_parse(document.text))
+                    self.assertMatchesFullParse(document)
+            # Something that breaks the document, then its repair
+            at = rng.choice([i + 1 for i, c in enumerate(document.text) if c == '\n'])
+            with self.assertRaises(UslError):
+                document.edit(at, 0, 'if (x) {\n')
+            document.edit(at, len('if (x) {\n'), '')
+            self.assertMatchesFullParse(document)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+# test_lexer.py
+#
+#     python -m unittest test_lexer
+
+import io
+import time
+import unittest
+
+from error import UslError
+from lexer import iter_tokens, tokenize
+
+CASES = {
+    'statements': 'x = 1;\nif (x >= 1) {\n    print("one", x.y);  # comment\n}\n',
+    'no final newline': 'print(1);\nprint(2);',
+    'string spanning lines': 'a = "first\nsecond\n  third";\nprint(a, "b");\n',
+    'two strings spanning lines': 'print("a\nb", 1, "c\nd\ne");\nx = "f\n";\n',
+    'escaped quote across lines': 'a = "say \\"\nhi\\" there";\nprint(a);\n',
+    'string never closed': 'x = 1;\ny = "open\nstill open;\nprint(x);\n',
+    'string never closed on the last line': 'x = 1;\ny = "open',
+    'backslash ending a line in a string': 'x = 1;\ny = "a\\\nb";\nprint(y);\n',
+    'closed then never closed': 'x = "a\nb";\ny = "c\nd;\n',
+    'unexpected character': 'x = 1;\ny = 2 $ 3;\n',
+}
+
+def tokens_of(tokens):
+    """(type, value, line, column) of each token, then the error if any."""
+    result = []
+    try:
+        for token in tokens:
+            result.append((token.type, token.value, token.line, token.column))
+    except UslError as e:
+        result.append((str(e), e.line))
+    return result
+
+class StreamTests(unittest.TestCase):
+    def test_stream_matches_whole_source(self):
+        for name, source in CASES.items():
+            with self.subTest(name):
+                # A string is scanned whole, as tokenize() does
+                expected = tokens_of(iter_tokens(source))
+                self.assertEqual(tokens_of(iter_tokens(io.StringIO(source))), expected)
+
+    def test_string_spanning_lines_is_one_token(self):
+        tokens = tokenize(CASES['string spanning lines'])
+        self.assertEqual([(t.type, t.line, t.column) for t in tokens[:4]],
+                         [('IDENT', 1, 1), ('ASSIGN', 1, 3), ('STRING', 1, 5), ('SEMICOLON', 3, 9)])
+
+    def test_string_never_closed_is_reported_where_it_opens(self):
+        tokens = tokens_of(iter_tokens(io.StringIO(CASES['string never closed'])))
+        self.assertEqual(tokens[-1], ('Unexpected character \'"\' at line 2', 2))
+
+    def test_long_string_never_closed(self):
+        # Each line is read once: rescanning the open string for every new
+        # line took time quadratic in its length
+        source = 'x = 1;\ny = "' + 'more text in an open string\n' * 20000
+        start = time.perf_counter()
+        tokens = tokens_of(iter_tokens(io.StringIO(source)))
+        self.assertLess(time.perf_counter() - start, 2.0)
+        self.assertEqual(tokens, tokens_of(iter_tokens(source)))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+# test_modules.py
+#
+#     python -m unittest test_modules
+
+import os
+import tempfile
+import unittest
+
+import modules
+from error import UslError
+from usl_programs import run_capturing_errors
+
+ENGINES = ('tree', 'closure', 'vm')
+
+# Module files, by path under the search directory
+FILES = {
+    'pkg/shapes.usl': '''
+        print("loading shapes");
+        count = 0;
+        def area(w, h) { return w * h; }
+    ''',
+    'pkg/user.usl': '''
+        import pkg.shapes;
+        def count() { return shapes.count; }
+    ''',
+    # Each reads the other while it runs: a cycle
+    'first.usl': 'import second;\nx = second.y;\n',
+    'second.usl': 'import first;\ny = first.x;\n',
+    # Each reads the other only from a function, after both have loaded
+    'ping.usl': 'import pong;\ndef ping(n) { if (n == 0) { return "ping"; } return pong.pong(n - 1); }\n',
+    'pong.usl': 'import ping;\ndef pong(n) { if (n == 0) { return "pong"; } return ping.ping(n - 1); }\n',
+}
+
+class ModuleTestCase(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        for name, source in FILES.items():
+            path = os.path.join(directory.name, *name.split('/'))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(source)
+        saved = modules.search_path, modules.use_cache, dict(modules.registry)
+        def restore():
+            modules.search_path, modules.use_cache = saved[:2]
+            modules.registry.clear()
+            modules.registry.update(saved[2])
+        self.addCleanup(restore)
+        modules.search_path = [directory.name]
+        modules.use_cache = False
+
+    def assertOutput(self, source, expected):
+        """Every engine, each with a fresh registry, prints expected."""
+        for engine in ENGINES:
+            with self.subTest(engine):
+                modules.registry.clear()
+                self.assertEqual(run_capturing_errors(engine, source), expected)
+
+class ImportTests(ModuleTestCase):
+    def test_dotted_import_binds_the_last_name(self):
+        self.assertOutput('import pkg.shapes;\nprint(shapes.area(2, 3));\n',
+                          'loading shapes\n6\n')
+
+    def test_repeated_import_returns_the_same_module(self):
+        first = modules.import_module('pkg.shapes')
+        self.assertIs(modules.import_module('pkg.shapes'), first)
+        self.assertIs(modules.import_module('math'), modules.import_module('math'))
+        # Run once, and shared with the modules that import it too
+        self.assertOutput('import pkg.shapes;\nshapes.count = 5;\nimport pkg.shapes;\n'
+                          'import pkg.user;\nprint(shapes.count, user.count());\n',
+                          'loading shapes\n5 5\n')
+
+    def test_native_module(self):
+        self.assertOutput('import math;\nprint(math.sqrt(16.0));\n', '4.0\n')
+
+    def test_missing_module(self):
+        self.assertOutput('print(1);\nimport pkg.missing;\n',
+                          '1\nUslError: Module "pkg.missing" not found at line 2\n')
+
+    def test_missing_attribute(self):
+        self.assertOutput('import pkg.shapes;\nprint(shapes.volume);\n',
+                          'loading shapes\nUslError: Module "pkg.shapes" has no attribute "volume" at line 2\n')
+
+class CycleTests(ModuleTestCase):
+    def test_cycle_raises(self):
+        self.assertOutput('import first;\nprint(first.x);\n',
+                          'UslError: Import cycle: first -> second -> first at line 2\n')
+
+    def test_cycle_raises_usl_error(self):
+        module = modules.import_module('first')
+        with self.assertRaises(UslError):
+            module.x
+        # Nothing is left half loaded
+        self.assertEqual(modules.loading, [])
+
+    def test_references_from_functions_are_not_a_cycle(self):
+        self.assertOutput('import ping;\nprint(ping.ping(3));\n', 'pong\n')
+
+if __name__ == '__main__':
+    unittest.main()
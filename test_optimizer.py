@@ -0,0 +1,44 @@
+# test_optimizer.py
+#
+#     python -m unittest test_optimizer
+
+import tracemalloc
+import unittest
+
+from ast_nodes import BinaryOp, String
+from lexer import tokenize
+from optimizer import MAX_FOLDED_STRING, optimize
+from parser import Parser
+
+def returned(source, level=1):
+    """The optimised expression of the program's first function's return."""
+    program, report = optimize(Parser(tokenize(source)).parse(), level)
+    return program.statements[0].body.statements[0].expression, report
+
+class FoldStringTests(unittest.TestCase):
+    def test_short_strings_are_folded(self):
+        node, report = returned('def f() { return "ab" * 3 + "c"; }')
+        self.assertIsInstance(node, String)
+        self.assertEqual(node.value, 'abababc')
+        self.assertEqual(report.folded, 2)
+
+    def test_long_results_are_left_for_runtime(self):
+        for expression in (f'"ab" * {MAX_FOLDED_STRING}', f'{MAX_FOLDED_STRING} * "ab"',
+                           f'"{"a" * MAX_FOLDED_STRING}" + "b"'):
+            with self.subTest(expression=expression):
+                node, report = returned(f'def f() {{ return {expression}; }}')
+                self.assertIsInstance(node, BinaryOp)
+                self.assertEqual(report.folded, 0)
+
+    def test_huge_repeat_is_not_built(self):
+        tracemalloc.start()
+        try:
+            node, _ = returned('def never() { return "ab" * 300000000; }')
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        self.assertIsInstance(node, BinaryOp)
+        self.assertLess(peak, 10 * 2**20)
+
+if __name__ == '__main__':
+    unittest.main()
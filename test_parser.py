@@ -0,0 +1,84 @@
+# test_parser.py
+#
+#     python -m unittest test_parser
+
+import unittest
+
+from ast_nodes import dump
+from error import UslError
+from lexer import iter_tokens, tokenize
+from parser import Parser
+
+# Broken statements at lines 2, 5, 8 and 10 (its missing `;` is found at
+# the `}` on line 11), around ones that parse
+BROKEN = '''x = 1;
+y = (2 + ;
+print(x);
+def f(a) {
+    a = a + ;
+    return a;
+}
+z = * 3;
+if (x > 0) {
+    print("ok")
+}
+print(f(1));
+'''
+BROKEN_LINES = (2, 5, 8, 10)
+
+def recovered(source):
+    """(program, errors) of parsing source with recover=True."""
+    parser = Parser(iter_tokens(source), recover=True)
+    program = parser.parse()
+    return program, [(str(e), e.line) for e in parser.errors]
+
+def without_lines(source, numbers):
+    """source with the given lines blanked, so the others keep their numbers."""
+    lines = source.split('\n')
+    return '\n'.join('' if i in numbers else line for i, line in enumerate(lines, 1))
+
+class RecoveryTests(unittest.TestCase):
+    def test_strict_parser_stops_at_the_first_error(self):
+        with self.assertRaises(UslError) as raised:
+            Parser(tokenize(BROKEN)).parse()
+        self.assertEqual(raised.exception.line, 2)
+
+    def test_every_error_is_reported(self):
+        _, errors = recovered(BROKEN)
+        self.assertEqual(errors, [
+            ('Unexpected token SEMICOLON at line 2', 2),
+            ('Unexpected token SEMICOLON at line 5', 5),
+            ('Unexpected token MUL at line 8', 8),
+            ('Expected ASSIGN or SEMICOLON at line 11', 11),
+        ])
+
+    def test_statements_around_errors_still_parse(self):
+        # Top level and in blocks, each good statement parses as it would
+        # with the broken ones left out
+        program, _ = recovered(BROKEN)
+        expected = Parser(tokenize(without_lines(BROKEN, BROKEN_LINES))).parse()
+        self.assertEqual(dump(program), dump(expected))
+
+    def test_stray_closing_brace(self):
+        program, errors = recovered('x = 1;\n}\ny = 2;\n')
+        self.assertEqual(errors, [('Unexpected token RBRACE at line 2', 2)])
+        self.assertEqual(dump(program), dump(Parser(tokenize('x = 1;\n\ny = 2;\n')).parse()))
+
+    def test_error_at_end_of_input(self):
+        program, errors = recovered('x = 1;\ny = (1 +\n')
+        self.assertEqual([message for message, _ in errors], ['Unexpected token EOF'])
+        self.assertEqual(len(program.statements), 1)
+
+    def test_lexer_error_ends_the_input(self):
+        program, errors = recovered('x = 1;\ny = $;\nz = 2;\n')
+        self.assertEqual(errors, [("Unexpected character '$' at line 2", 2)])
+        self.assertEqual(len(program.statements), 1)
+
+    def test_valid_source_has_no_errors(self):
+        source = without_lines(BROKEN, BROKEN_LINES)
+        program, errors = recovered(source)
+        self.assertEqual(errors, [])
+        self.assertEqual(dump(program), dump(Parser(tokenize(source)).parse()))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+# test_startup.py
+#
+#     python -m unittest test_startup
+
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+USL_PY = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'usl.py')
+
+# Modules each usl command must not import; `run` is checked with a warm
+# .uslc cache, where nothing but the interpreter should be needed
+UNUSED = {
+    'run': ('lexer', 'parser', 'optimizer', 'resolver', 'native_modules',
+            'closure_compiler', 'bytecode', 'vm', 'subprocess', 'tempfile'),
+    'check': ('interpreter', 'ast_cache', 'optimizer', 'native_modules', 'pickle'),
+    'tokens': ('parser', 'interpreter', 'ast_cache', 'native_modules'),
+}
+
+# A function and a class, so the cached tree holds everything the resolver
+# annotates
+SCRIPT = '''def add(a, b) {
+    total = a + b;
+    return total;
+}
+class Point {
+    def __init__(self, x) { self.x = x; }
+    def moved(self, dx) { return Point(add(self.x, dx)); }
+}
+print(add(1, 2), Point(3).moved(4).x);
+'''
+
+class StartupImportTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.TemporaryDirectory()
+        cls.path = os.path.join(cls.directory.name, 'script.usl')
+        with open(cls.path, 'w') as f:
+            f.write(SCRIPT)
+        cls.env = dict(os.environ, USL_CACHE_DIR=os.path.join(cls.directory.name, 'cache'))
+        cls.run_usl('run')  # fill the cache
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.directory.cleanup()
+
+    @classmethod
+    def run_usl(cls, command, *flags):
+        return subprocess.run([sys.executable, *flags, USL_PY, command, cls.path], env=cls.env,
+                              check=True, capture_output=True, text=True)
+
+    def imported_modules(self, command):
+        result = self.run_usl(command, '-X', 'importtime')
+        return {line.rsplit('|', 1)[1].strip() for line in result.stderr.splitlines()
+                if line.startswith('import time:') and '|' in line}
+
+    def test_warm_run_output(self):
+        self.assertEqual(self.run_usl('run').stdout, '3 7\n')
+
+    def test_unused_modules_are_not_imported(self):
+        for command, unused in UNUSED.items():
+            with self.subTest(command):
+                self.assertEqual(sorted(self.imported_modules(command).intersection(unused)), [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,178 @@
+# transpile_cache.py
+#
+# Content-addressed cache of rendered /process outputs. An entry is keyed by
+# the hash of the request's input lines, the language, and the version (a
+# content hash) of the syntax template file, so the same snippet submitted
+# again is served without classifying or rendering anything.
+#
+# Entries live in an in-memory LRU capped at max_size characters of output,
+# and optionally in a directory as well, which survives restarts and is
+# shared by every worker process on the host. Editing the template file
+# changes its version. The memory tier holds one version's entries: it
+# moves to a new version only once current_version() (the registry's, in
+# app.py) says that version is current, and is emptied when it does. A
+# request that started before the reload and still asks for the old version
+# bypasses the memory tier, so it can neither empty it nor be served a newer
+# template's output. The directory's entries for other versions are deleted
+# by a background thread when the cache first takes a version (at startup)
+# and after each move, never on a request's path.
+
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+
+# Part of every key: changed whenever the same input and templates render
+# differently, so that no directory tier serves the old output
+OUTPUT_FORMAT = 2
+
+def input_digest(lines):
+    """Hash of a request's input lines, the content part of every key."""
+    digest = hashlib.sha256(f"{OUTPUT_FORMAT}\n".encode("ascii"))
+    for line in lines:
+        digest.update(line.encode("utf-8", "surrogatepass"))
+        digest.update(b"\n")
+    return digest.hexdigest()
+
+class TranspileCache:
+    def __init__(self, max_size=64 * 1024 * 1024, directory=None, current_version=None):
+        self.max_size = max_size
+        self.directory = directory  # None keeps the cache in memory only
+        # () -> the template version requests are being served from; None
+        # trusts the version of every lookup
+        self.current_version = current_version
+        self.entries = OrderedDict()  # (digest, lang) -> text, least recently used first
+        self.size = 0
+        self.version = None  # the template version self.entries belong to
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, digest, lang, version):
+        """The cached output for (digest, lang) under version, or None."""
+        key = (digest, lang)
+        self.check_version(version)
+        with self.lock:
+            text = self.entries.get(key) if version == self.version else None
+            if text is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return text
+        text = self.read(digest, lang, version)
+        with self.lock:
+            if text is None:
+                self.misses += 1
+            else:
+                self.disk_hits += 1
+                if version == self.version:
+                    self.remember(key, text)
+        return text
+
+    def put(self, digest, lang, version, text):
+        self.check_version(version)
+        with self.lock:
+            if version == self.version:
+                self.remember((digest, lang), text)
+        self.write(digest, lang, version, text)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "entries": len(self.entries),
+                "size": self.size,
+                "max_size": self.max_size,
+                "version": self.version,
+            }
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def check_version(self, version):
+        # Called without the lock: current_version() may reload the
+        # template file. The cache only ever moves to the current version,
+        # so a request still on an old one cannot undo the move.
+        if version == self.version:
+            return
+        if self.current_version is not None and version != self.current_version():
+            return
+        with self.lock:
+            if version == self.version:
+                return
+            self.entries.clear()
+            self.size = 0
+            self.version = version
+        if self.directory is not None:
+            threading.Thread(target=self.remove_old_versions, daemon=True).start()
+
+    def remember(self, key, text):
+        entries = self.entries
+        old = entries.pop(key, None)
+        if old is not None:
+            self.size -= len(old)
+        if len(text) > self.max_size:
+            return
+        entries[key] = text
+        self.size += len(text)
+        while self.size > self.max_size:
+            _, evicted = entries.popitem(last=False)
+            self.size -= len(evicted)
+
+    # The directory tier: <directory>/<version>/<key>.txt. It is best
+    # effort, like the .uslc cache: an unreadable or unwritable directory
+    # only means a miss.
+
+    def path(self, digest, lang, version):
+        name = hashlib.sha256(f"{digest}|{lang}".encode("utf-8", "surrogatepass")).hexdigest()
+        return os.path.join(self.directory, version, name + ".txt")
+
+    def read(self, digest, lang, version):
+        if self.directory is None:
+            return None
+        try:
+            with open(self.path(digest, lang, version), "r", encoding="utf-8", newline="") as f:
+                return f.read()
+        except (OSError, UnicodeDecodeError):
+            return None
+
+    def write(self, digest, lang, version, text):
+        if self.directory is None:
+            return
+        path = self.path(digest, lang, version)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, temp = tempfile.mkstemp(suffix=".tmp", dir=os.path.dirname(path))
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8", newline="") as f:
+                    f.write(text)
+                os.replace(temp, path)
+            except BaseException:
+                os.unlink(temp)
+                raise
+        except (OSError, UnicodeEncodeError):
+            pass
+
+    def remove_old_versions(self):
+        # Runs in a thread of its own. self.version is read again for each
+        # directory, in case the cache has moved on meanwhile
+        if self.directory is None:
+            return
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return
+        for name in names:
+            # Only version directories: the cache may share its parent
+            version = self.version
+            if name != version and len(name) == len(version) and is_hex(name):
+                shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+
+def is_hex(name):
+    return all(c in "0123456789abcdef" for c in name)
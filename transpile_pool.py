@@ -0,0 +1,126 @@
+# transpile_pool.py
+#
+# Renders the languages of a /process request in parallel. The request's
+# program (a symbolic_ir.SymbolicProgram or a codegen.CodeProgram: anything
+# with size() and render(language)) is split into one chunk of languages
+# per worker, so the program is sent to each worker once rather than once
+# per language.
+# Results are put back in the order the languages were asked for, whatever
+# order the workers finish in, and a language that fails to render is
+# reported on its own without affecting the rest.
+#
+# Backends:
+#   serial   render in the request thread
+#   thread   a thread pool; workers share the request's SyntaxTable. Rendering
+#            is pure Python, so this helps only on interpreters without a GIL
+#   process  a process pool; each worker keeps its own TemplateRegistry for
+#            the same file and renders only if its table has the version the
+#            request was given, otherwise the chunk is rendered locally
+#
+# Small requests are rendered serially whatever the backend: below
+# min_parallel_work statement renders, handing work to another process
+# costs more than it saves.
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from syntax_registry import TemplateRegistry
+
+BACKENDS = ("serial", "thread", "process")
+
+def render_languages(program, languages, syntax):
+    """Render each language; returns [(lang, text, error)] in the given order."""
+    results = []
+    for lang in languages:
+        try:
+            results.append((lang, program.render(syntax.language(lang)), None))
+        except Exception as e:
+            results.append((lang, None, f"{type(e).__name__}: {e}"))
+    return results
+
+# In a process worker: the worker's own registry, made by the initializer
+_worker_registry = None
+
+def _start_worker(syntax_file):
+    global _worker_registry
+    _worker_registry = TemplateRegistry(syntax_file)
+
+def _render_in_worker(program, languages, version):
+    syntax = _worker_registry.current()
+    if syntax.version != version:
+        return None  # the file changed under us; the request renders this chunk itself
+    return render_languages(program, languages, syntax)
+
+class TranspilePool:
+    def __init__(self, syntax_file, backend="process", workers=None, min_parallel_work=5000):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown pool backend {backend!r}; expected one of {', '.join(BACKENDS)}")
+        self.syntax_file = syntax_file
+        self.backend = backend
+        self.workers = max(workers or os.cpu_count() or 1, 1)
+        self.min_parallel_work = min_parallel_work
+        self.executor = None  # started on first use
+        self.lock = threading.Lock()
+
+    def render_all(self, program, languages, syntax):
+        """Render program in every language: ({lang: text}, {lang: error}), both in request order."""
+        languages = list(dict.fromkeys(languages))
+        work = len(languages) * program.size()
+        if self.backend == "serial" or self.workers == 1 or work < self.min_parallel_work:
+            results = render_languages(program, languages, syntax)
+        else:
+            results = self.render_parallel(program, languages, syntax)
+        outputs, errors = {}, {}
+        for lang, text, error in results:
+            if error is None:
+                outputs[lang] = text
+            else:
+                errors[lang] = error
+        return outputs, errors
+
+    def render_parallel(self, program, languages, syntax):
+        count = min(self.workers, len(languages))
+        chunks = [languages[i::count] for i in range(count)]
+        executor = self.start()
+        if self.backend == "thread":
+            futures = [executor.submit(render_languages, program, chunk, syntax) for chunk in chunks]
+        else:
+            futures = [executor.submit(_render_in_worker, program, chunk, syntax.version)
+                       for chunk in chunks]
+        by_language = {}
+        for chunk, future in zip(chunks, futures):
+            try:
+                results = future.result()
+            except Exception as e:
+                if isinstance(e, BrokenProcessPool):
+                    self.discard(executor)  # a worker died; the next request starts a fresh pool
+                results = None
+            if results is None:
+                results = render_languages(program, chunk, syntax)
+            for result in results:
+                by_language[result[0]] = result
+        return [by_language[lang] for lang in languages]
+
+    def start(self):
+        with self.lock:
+            if self.executor is None:
+                if self.backend == "thread":
+                    self.executor = ThreadPoolExecutor(self.workers, thread_name_prefix="transpile")
+                else:
+                    self.executor = ProcessPoolExecutor(self.workers, initializer=_start_worker,
+                                                        initargs=(self.syntax_file,))
+            return self.executor
+
+    def discard(self, executor):
+        with self.lock:
+            if self.executor is not executor:
+                return  # already replaced by another request
+            self.executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self):
+        with self.lock:
+            executor, self.executor = self.executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,184 @@
+# usl.py
+#
+# The usl command line:
+#
+#   python usl.py run script.usl        run a script
+#   python usl.py check a.usl b.usl     lex and parse only, listing every syntax error
+#   python usl.py tokens script.usl     print the token stream
+#   python usl.py ast script.usl        print the parsed tree
+#
+# --time prints how long each phase took to stderr. Most scripts are short,
+# so start-up is most of their run time: each command imports only what it
+# uses. check, tokens and ast never load the interpreter, and a run whose
+# tree is in the .uslc cache never loads the lexer, parser or optimizer.
+# main.py is `usl run`.
+
+import argparse
+import os
+import sys
+import time
+from modules import ENGINES
+
+LEVELS = (0, 1, 2)  # optimizer.LEVELS, which would load the interpreter
+
+def report_times(timings, total):
+    width = max(len(name) for name in timings)
+    for name, seconds in timings.items():
+        print(f'{name:<{width}} {seconds * 1000:9.2f} ms', file=sys.stderr)
+    print(f'{"total":<{width}} {total * 1000:9.2f} ms', file=sys.stderr)
+
+def read_source(path):
+    with open(path, 'r') as f:
+        return f.read()
+
+def command_run(args):
+    from ast_cache import load_program, compile_source, clear_cache
+    if args.clear_cache:
+        print(f'Removed {clear_cache()} cached file(s)', file=sys.stderr)
+    if args.script is None:
+        if not args.clear_cache:
+            args.arg_parser.error('the script argument is required')
+        return 0
+    import modules
+    from environment import Environment
+    from error import UslError
+    script_path = args.script
+    # Imported modules run like the script, and are found next to it first
+    modules.search_path.insert(0, os.path.dirname(os.path.abspath(script_path)))
+    modules.engine = args.engine
+    modules.opt_level = args.opt_level
+    modules.use_cache = not args.no_cache
+    timings = {} if args.time else None
+    start = time.perf_counter()
+    try:
+        if args.opt_report:
+            ast, report = compile_source(read_source(script_path), args.opt_level, timings)
+            print(report, file=sys.stderr)
+        else:
+            ast = load_program(script_path, args.opt_level, not args.no_cache, timings)
+        executed = time.perf_counter()
+        try:
+            modules.run(ast, Environment(), args.engine)
+        finally:
+            if timings is not None:
+                timings['execute'] = time.perf_counter() - executed
+                report_times(timings, time.perf_counter() - start)
+    except UslError as e:
+        print(f'Error: {e}', file=sys.stderr)
+        return 1
+    except FileNotFoundError:
+        print(f'File not found: {script_path}', file=sys.stderr)
+        return 1
+    except Exception as e:
+        print(f'An unexpected error occurred: {e}', file=sys.stderr)
+        return 1
+    return 0
+
+def command_check(args):
+    from lexer import iter_tokens
+    from parser import Parser
+    status = 0
+    start = time.perf_counter()
+    for path in args.scripts:
+        try:
+            source = read_source(path)
+        except OSError as e:
+            print(f'{path}: {e.strerror}', file=sys.stderr)
+            status = 1
+            continue
+        parser = Parser(iter_tokens(source), recover=True)
+        parser.parse()
+        for error in parser.errors:
+            where = f'{path}:{error.line}' if error.line else path
+            print(f'{where}: {error.args[0]}')
+        if parser.errors:
+            status = 1
+    if args.time:
+        report_times({'lex + parse': time.perf_counter() - start}, time.perf_counter() - start)
+    return status
+
+def command_tokens(args):
+    from lexer import tokenize
+    from error import UslError
+    start = time.perf_counter()
+    try:
+        tokens = tokenize(read_source(args.script))
+    except UslError as e:
+        print(f'Error: {e}', file=sys.stderr)
+        return 1
+    lexed = time.perf_counter() - start
+    for token in tokens:
+        print(f'{token.line}:{token.column}\t{token.type}\t{token.value!r}')
+    if args.time:
+        report_times({'lex': lexed}, lexed)
+    return 0
+
+def command_ast(args):
+    from lexer import tokenize
+    from parser import Parser
+    from ast_nodes import dump
+    from error import UslError
+    start = time.perf_counter()
+    try:
+        tokens = tokenize(read_source(args.script))
+        lexed = time.perf_counter()
+        program = Parser(tokens).parse()
+    except UslError as e:
+        print(f'Error: {e}', file=sys.stderr)
+        return 1
+    parsed = time.perf_counter()
+    print(dump(program))
+    if args.time:
+        report_times({'lex': lexed - start, 'parse': parsed - lexed}, parsed - start)
+    return 0
+
+def build_arg_parser():
+    arg_parser = argparse.ArgumentParser(prog='usl', description='The USL command line.')
+    commands = arg_parser.add_subparsers(dest='command', required=True, metavar='command')
+    timing = argparse.ArgumentParser(add_help=False)
+    timing.add_argument('--time', action='store_true',
+                        help='report how long each phase took on stderr')
+
+    run = commands.add_parser('run', parents=[timing], help='run a script',
+                              description='Run a USL script.')
+    run.add_argument('script', nargs='?', help='path to the .usl script')
+    run.add_argument('--engine', choices=ENGINES, default='tree',
+                     help='execution engine: tree-walking interpreter (default), '
+                          'closure compiler or bytecode VM. The VM keeps USL calls '
+                          'on a heap-allocated frame stack, so recursion depth is '
+                          'limited only by memory')
+    run.add_argument('-O', dest='opt_level', type=int, choices=LEVELS, default=1,
+                     help='optimisation level: 0 off, 1 safe rewrites (default), '
+                          '2 also numeric identities such as x + 0')
+    run.add_argument('--opt-report', action='store_true',
+                     help='print what the optimizer changed to stderr (bypasses the cache)')
+    run.add_argument('--no-cache', action='store_true',
+                     help='always parse the script; do not read or write the '
+                          '.uslc cache in $USL_CACHE_DIR (default ~/.cache/usl)')
+    run.add_argument('--clear-cache', action='store_true',
+                     help='delete every cached .uslc file before running')
+    run.set_defaults(handler=command_run, arg_parser=run)
+
+    check = commands.add_parser('check', parents=[timing], help='report syntax errors',
+                                description='Lex and parse scripts without running them, '
+                                            'listing every syntax error as path:line: message.')
+    check.add_argument('scripts', nargs='+', metavar='script', help='path to a .usl script')
+    check.set_defaults(handler=command_check)
+
+    tokens = commands.add_parser('tokens', parents=[timing], help='print the token stream',
+                                 description='Print each token as line:column, type and value.')
+    tokens.add_argument('script', help='path to the .usl script')
+    tokens.set_defaults(handler=command_tokens)
+
+    ast = commands.add_parser('ast', parents=[timing], help='print the parsed tree',
+                              description='Print the syntax tree of a script, before optimisation.')
+    ast.add_argument('script', help='path to the .usl script')
+    ast.set_defaults(handler=command_ast)
+    return arg_parser
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+    return args.handler(args)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,4 +1,7 @@
-# builtins.py
+# usl_builtins.py
+#
+# range, enumerate, map and filter return lazy Python iterators; for-in
+# loops consume them one item at a time.
 
 def built_in_print(*args):
     print(*args)
@@ -0,0 +1,396 @@
+# usl_programs.py
+#
+# USL programs shared by the benchmarks and the tests, and the helpers
+# that run them on each engine.
+
+import contextlib
+import io
+
+from lexer import tokenize
+from parser import Parser
+from resolver import resolve
+from interpreter import evaluate
+from environment import Environment
+
+PROGRAMS = {
+    'counting_loop': '''
+        total = 0;
+        i = 0;
+        while (i < 200000) {
+            total = total + i;
+            i = i + 1;
+        }
+        print(total);
+    ''',
+    'nested_loops': '''
+        count = 0;
+        i = 0;
+        while (i < 300) {
+            j = 0;
+            while (j < 300) {
+                if ((i + j) % 3 == 0) {
+                    count = count + 1;
+                }
+                j = j + 1;
+            }
+            i = i + 1;
+        }
+        print(count);
+    ''',
+    'continue_loop': '''
+        odd = 0;
+        i = 0;
+        while (i < 100000) {
+            i = i + 1;
+            if (i % 2 == 0) {
+                continue;
+            }
+            odd = odd + 1;
+        }
+        print(odd);
+    ''',
+    'small_calls': '''
+        def inc(x) {
+            return x + 1;
+        }
+        def is_even(x) {
+            if (x % 2 == 0) {
+                return True;
+            }
+            return False;
+        }
+        n = 0;
+        evens = 0;
+        while (n < 50000) {
+            n = inc(n);
+            if (is_even(n)) {
+                evens = evens + 1;
+            }
+        }
+        print(evens);
+    ''',
+    'constant_exprs': '''
+        total = 0;
+        i = 0;
+        while (i < 100000) {
+            if (1 > 2) {
+                print("never");
+            }
+            total = total + (60 * 60 * 24) % 7 + i * (2 - 1);
+            i = i + 1;
+        }
+        print(total);
+    ''',
+    'factorial': '''
+        def factorial(n) {
+            if (n == 0) {
+                return 1;
+            } else {
+                return n * factorial(n - 1);
+            }
+        }
+        k = 0;
+        result = 0;
+        while (k < 500) {
+            result = factorial(50);
+            k = k + 1;
+        }
+        print(result);
+    ''',
+    'nested_scopes': '''
+        def outer(n) {
+            total = 0;
+            def step(i) {
+                return abs(i - n) + len("abc");
+            }
+            i = 0;
+            while (i < n) {
+                total = total + step(i);
+                i = i + 1;
+            }
+            return total;
+        }
+        print(outer(30000));
+    ''',
+    'fib': '''
+        def fib(n) {
+            if (n < 2) {
+                return n;
+            }
+            return fib(n - 1) + fib(n - 2);
+        }
+        print(fib(20));
+    ''',
+    'primes': '''
+        count = 0;
+        n = 2;
+        while (n < 4000) {
+            d = 2;
+            prime = True;
+            while (d * d <= n) {
+                if (n % d == 0) {
+                    prime = False;
+                    break;
+                }
+                d = d + 1;
+            }
+            if (prime) {
+                count = count + 1;
+            }
+            n = n + 1;
+        }
+        print(count);
+    ''',
+    'method_calls': '''
+        class Shape {
+            def __init__(self, w, h) { self.w = w; self.h = h; }
+            def area(self) { return self.w * self.h; }
+            def scaled(self, k) { return self.area() * k; }
+        }
+        class Rect extends Shape {
+            def perimeter(self) { return 2 * (self.w + self.h); }
+        }
+        class Square extends Rect {
+            def __init__(self, s) { self.w = s; self.h = s; }
+            def area(self) { return self.w * self.w; }
+        }
+        r = Rect(2, 3);
+        s = Square(4);
+        total = 0;
+        i = 0;
+        while (i < 20000) {
+            if (i % 2 == 0) { shape = r; } else { shape = s; }
+            total = total + shape.area() + shape.perimeter() + shape.scaled(2);
+            i = i + 1;
+        }
+        print(total);
+    ''',
+}
+
+# Small programs covering language semantics rather than speed; `verify`
+# runs them (and PROGRAMS) on every engine and compares the output.
+CONFORMANCE = {
+    'control_flow': '''
+        def find(n) {
+            i = 0;
+            while (True) {
+                i = i + 1;
+                if (i % 2 == 0) { continue; }
+                if (i > n) { break; }
+            }
+            return i;
+        }
+        def early(limit) {
+            j = 0;
+            while (j < 10) {
+                if (j == limit) { return j * 100; }
+                j = j + 1;
+            }
+            return -1;
+        }
+        def nothing(x) { y = x; }
+        print(find(11), early(3), early(20), nothing(1));
+        if (False) { print("no"); } else { print("yes"); }
+    ''',
+    'operators': '''
+        print(not True, -3, +2, 1 and 0, 0 or 5, 7 % 3, 7 / 2, "a" + "b");
+        print(1 < 2, 2 <= 2, 3 > 4, 4 >= 5, 1 == 1, 1 != 1);
+        print(len("hello"), str(5), abs(-2), type("s"));
+    ''',
+    'scopes': '''
+        x = 1;
+        def f() {
+            print(x);
+            x = 2;
+            def g() { return x * 10; }
+            return g();
+        }
+        print(f(), x);
+        def counter() {
+            c = 0;
+            def inc() { return c + 1; }
+            c = inc();
+            c = inc();
+            return c;
+        }
+        def deep() {
+            def a() {
+                def b() { return len("four") + x; }
+                return b();
+            }
+            return a();
+        }
+        def dup(a, a) { return a; }
+        print(counter(), deep(), dup(1, 2));
+    ''',
+    'classes': '''
+        class Animal {
+            def __init__(self, name) { self.name = name; }
+            def speak(self) { return self.name + " makes a sound."; }
+            def twice(self) { return self.speak() + " " + self.speak(); }
+        }
+        class Dog extends Animal {
+            def speak(self) { return self.name + " barks."; }
+        }
+        class Counter {
+            start = 10;
+            def __init__(self) { self.n = 0; }
+            def bump(self) { self.n = self.n + 1; return self.n; }
+            def base(self) { return start; }
+        }
+        d = Dog("Rex");
+        print(d.speak(), d.twice());
+        c = Counter();
+        c.bump();
+        print(c.bump(), c.base());
+        def make() {
+            class Local { def v(self) { return 9; } }
+            return Local().v();
+        }
+        print(make());
+    ''',
+    'inheritance': '''
+        class A {
+            kind = "a";
+            def __init__(self, x) { self.x = x; }
+            def who(self) { return "A" + self.kind; }
+            def base(self) { return self.x * 2; }
+        }
+        class B extends A {
+            def who(self) { return "B"; }
+        }
+        class C extends B {
+            kind = "c";
+        }
+        c = C(5);
+        print(c.x, c.who(), c.base(), c.kind);
+        m = c.base;
+        print(m(), A(1).who());
+        c.who = 7;
+        print(c.who);
+        print(c.base(1));
+    ''',
+    'tail_calls': '''
+        def count(n, acc) {
+            if (n == 0) { return acc; }
+            return count(n - 1, acc + n);
+        }
+        class Walker {
+            def walk(self, n) {
+                if (n == 0) { return "done"; }
+                return self.walk(n - 1);
+            }
+        }
+        def is_even(n) {
+            if (n == 0) { return True; }
+            return is_odd(n - 1);
+        }
+        def is_odd(n) {
+            if (n == 0) { return False; }
+            return is_even(n - 1);
+        }
+        def clamp(n) {
+            while (True) {
+                if (n > 3) { return abs(0 - n); }
+                return clamp(n + 1);
+            }
+        }
+        print(count(100000, 0), Walker().walk(100000), is_even(100001), clamp(0));
+    ''',
+    'for_in': '''
+        total = 0;
+        for (i in range(10)) {
+            if (i == 2) { continue; }
+            if (i == 8) { break; }
+            total = total + i;
+        }
+        print(total, i);
+        def first_even(items) {
+            for (x in items) {
+                if (x % 2 == 0) { return x; }
+            }
+            return None;
+        }
+        print(first_even(range(3, 20)), first_even(range(1, 2)));
+        def positive(v) { return v > 0; }
+        for (v in filter(positive, map(abs, range(-2, 3)))) { print(v); }
+        for (pair in enumerate("ab")) { print(pair); }
+        for (a in range(2)) {
+            for (b in range(3)) {
+                if (b == 1) { break; }
+                print(a, b);
+            }
+        }
+        for (q in 5) { print(q); }
+    ''',
+    'runtime_error': '''
+        def f(a, b) { return a; }
+        print("before");
+        f(1);
+    ''',
+    'return_outside': '''
+        print("before");
+        if (True) {
+            return print("never");
+        }
+    ''',
+    'break_outside': '''
+        def stop(i) {
+            print("stop", i);
+            break;
+        }
+        for (i in range(3)) { stop(i); }
+    ''',
+    'continue_outside': '''
+        while (True) {
+            print("class");
+            class Skip {
+                continue;
+            }
+        }
+    ''',
+    'imports': '''
+        import math;
+        import string;
+        import collections;
+        def area(r) { import math; return math.floor(math.PI * r * r); }
+        print(area(10), math.sqrt(16), math.pow(2, 10));
+        print(string.toUpperCase("usl"), string.indexOf("module", "d"));
+        items = collections.List();
+        for (i in range(3)) { collections.add(items, i * i); }
+        print(items, collections.size(items), collections.contains(items, 4));
+        stack = collections.Stack();
+        stack.push("a");
+        stack.push("b");
+        print(stack.pop(), stack.isEmpty());
+        print(math.nothing);
+    ''',
+}
+
+def parse(source, resolved=True):
+    ast = Parser(tokenize(source)).parse()
+    return resolve(ast) if resolved else ast
+
+def execute(engine, ast):
+    env = Environment()
+    if engine == 'tree':
+        evaluate(ast, env)
+    elif engine == 'closure':
+        from closure_compiler import compile_program
+        compile_program(ast)(env)
+    elif engine == 'vm':
+        from bytecode import compile_program
+        from vm import execute
+        execute(compile_program(ast), env)
+    else:
+        raise ValueError(f'Unknown engine {engine!r}')
+
+def run_capturing_errors(engine, source):
+    # Parse per run: the bytecode compiler re-resolves the tree in place
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        try:
+            execute(engine, parse(source))
+        except Exception as e:
+            print(f'{type(e).__name__}: {e}')
+    return out.getvalue()
@@ -0,0 +1,273 @@
+# vm.py
+#
+# Stack-based virtual machine for code objects produced by bytecode.py.
+# Calls between USL functions push a frame onto a list instead of recursing
+# in Python; only calls made from Python (builtins, bound methods, class
+# constructors) re-enter the loop.
+
+from ast_nodes import ClassDef
+from bytecode import *
+from environment import Environment, UNSET
+from error import UslError, locate
+from modules import import_module
+from interpreter import (UslFunction, UslClass, UslInstance, get_attribute, find_method,
+                         call_method, iterate)
+
+class VMFunction(UslFunction):
+    def __init__(self, code, env):
+        self.name = code.name
+        self.params = code.params
+        self.func_def = None
+        self.scope = code.scope
+        self.code = code
+        self.env = env
+
+    def invoke(self, args):
+        return run(self.code, self.make_frame(args))
+
+def execute(code, env):
+    """Run a module code object in env."""
+    return run(code, env)
+
+def run(code, env):
+    frames = []
+    instructions = code.instructions
+    consts = code.consts
+    names = code.names
+    stack = []
+    push = stack.append
+    pop = stack.pop
+    pc = 0
+    try:
+        while True:
+            op, arg = instructions[pc]
+            pc += 1
+            if op == LOAD_FAST:
+                value = env.slots[arg]
+                if value is UNSET:
+                    value = env.get_variable(code.varnames[arg])
+                push(value)
+            elif op == LOAD_CONST:
+                push(consts[arg])
+            elif op == STORE_FAST:
+                env.slots[arg] = pop()
+            elif op == LOAD_NAME:
+                name = names[arg]
+                variables = env.variables
+                push(variables[name] if name in variables else env.get_variable(name))
+            elif op == STORE_NAME:
+                env.variables[names[arg]] = pop()
+            elif op == POP_JUMP_IF_FALSE:
+                if not pop():
+                    pc = arg
+            elif op == JUMP:
+                pc = arg
+            elif op == FOR_ITER:
+                for item in stack[-1]:
+                    push(item)
+                    break
+                else:
+                    pop()
+                    pc = arg
+            elif op == BINARY_ADD:
+                right = pop()
+                stack[-1] = stack[-1] + right
+            elif op == BINARY_SUB:
+                right = pop()
+                stack[-1] = stack[-1] - right
+            elif op == COMPARE_LT:
+                right = pop()
+                stack[-1] = stack[-1] < right
+            elif op == COMPARE_EQ:
+                right = pop()
+                stack[-1] = stack[-1] == right
+            elif op == BINARY_MUL:
+                right = pop()
+                stack[-1] = stack[-1] * right
+            elif op == BINARY_MOD:
+                right = pop()
+                stack[-1] = stack[-1] % right
+            elif op == LOAD_DEREF:
+                depth, slot, name = code.refs[arg]
+                push(env.lookup(depth, slot, name))
+            elif op == CALL_FUNCTION:
+                if arg:
+                    args = stack[-arg:]
+                    del stack[-arg:]
+                else:
+                    args = ()
+                func = pop()
+                if type(func) is VMFunction:
+                    if len(args) != len(func.params):
+                        raise UslError(f'Function "{func.name}" expected {len(func.params)} arguments, got {len(args)}')
+                    frames.append((code, pc, stack, env))
+                    code = func.code
+                    instructions = code.instructions
+                    consts = code.consts
+                    names = code.names
+                    env = func.make_frame(args)
+                    stack = []
+                    push = stack.append
+                    pop = stack.pop
+                    pc = 0
+                elif callable(func):
+                    push(func(*args))
+                else:
+                    raise UslError(f'"{func}" is not a function')
+            elif op == LOAD_METHOD:
+                receiver = stack[-1]
+                method = None
+                if type(receiver) is UslInstance and names[arg] not in receiver.attributes:
+                    cache = code.caches[pc]
+                    if cache is None or cache[0] is not receiver.cls:
+                        cache = code.caches[pc] = (receiver.cls, find_method(receiver.cls, names[arg]))
+                    method = cache[1]
+                if method is not None:
+                    stack[-1] = method
+                    push(receiver)
+                else:
+                    stack[-1] = get_attribute(receiver, names[arg])
+                    push(None)
+            elif op == CALL_METHOD:
+                if arg:
+                    args = stack[-arg:]
+                    del stack[-arg:]
+                else:
+                    args = []
+                receiver = pop()
+                func = pop()
+                if receiver is None:
+                    if not callable(func):
+                        raise UslError(f'"{func}" is not a function')
+                    push(func(*args))
+                elif type(func) is VMFunction:
+                    if len(args) != len(func.params) - 1:
+                        raise UslError(f'Method "{func.name}" expected {len(func.params) - 1} arguments, got {len(args)}')
+                    frames.append((code, pc, stack, env))
+                    code = func.code
+                    instructions = code.instructions
+                    consts = code.consts
+                    names = code.names
+                    env = func.make_frame((receiver, *args))
+                    stack = []
+                    push = stack.append
+                    pop = stack.pop
+                    pc = 0
+                else:
+                    push(call_method(receiver, func, args))
+            elif op == RETURN_VALUE:
+                value = pop()
+                if not frames:
+                    return value
+                code, pc, stack, env = frames.pop()
+                instructions = code.instructions
+                consts = code.consts
+                names = code.names
+                push = stack.append
+                pop = stack.pop
+                push(value)
+            elif op == POP_TOP:
+                pop()
+            elif op == GET_ITER:
+                stack[-1] = iterate(stack[-1])
+            elif op == LOAD_ATTR:
+                stack[-1] = get_attribute(stack[-1], names[arg])
+            elif op == COMPARE_GT:
+                right = pop()
+                stack[-1] = stack[-1] > right
+            elif op == COMPARE_LE:
+                right = pop()
+                stack[-1] = stack[-1] <= right
+            elif op == COMPARE_GE:
+                right = pop()
+                stack[-1] = stack[-1] >= right
+            elif op == COMPARE_NEQ:
+                right = pop()
+                stack[-1] = stack[-1] != right
+            elif op == BINARY_DIV:
+                right = pop()
+                stack[-1] = stack[-1] / right
+            elif op == BINARY_AND:
+                right = pop()
+                stack[-1] = stack[-1] and right
+            elif op == BINARY_OR:
+                right = pop()
+                stack[-1] = stack[-1] or right
+            elif op == UNARY_NOT:
+                stack[-1] = not stack[-1]
+            elif op == UNARY_NEG:
+                stack[-1] = -stack[-1]
+            elif op == UNARY_POS:
+                stack[-1] = +stack[-1]
+            elif op == STORE_ATTR:
+                obj = pop()
+                setattr(obj, names[arg], pop())
+            elif op == DUP_TOP:
+                push(stack[-1])
+            elif op == MAKE_FUNCTION:
+                push(VMFunction(consts[arg], env))
+            elif op == MAKE_CLASS:
+                body = consts[arg]
+                class_env = Environment(env)
+                run(body, class_env)
+                class_def = ClassDef(body.name, body.bases, None)
+                push(UslClass(body.name, class_def, env, class_env.variables))
+            elif op == IMPORT_NAME:
+                push(import_module(names[arg]))
+            elif op == RAISE_ERROR:
+                raise UslError(consts[arg])
+            elif op == TAIL_CALL:
+                if arg:
+                    args = stack[-arg:]
+                    del stack[-arg:]
+                else:
+                    args = ()
+                func = pop()
+                if type(func) is VMFunction:
+                    if len(args) != len(func.params):
+                        raise UslError(f'Function "{func.name}" expected {len(func.params)} arguments, got {len(args)}')
+                    # Replace the current frame instead of pushing a new one
+                    code = func.code
+                    instructions = code.instructions
+                    consts = code.consts
+                    names = code.names
+                    env = func.make_frame(args)
+                    stack = []
+                    push = stack.append
+                    pop = stack.pop
+                    pc = 0
+                elif callable(func):
+                    push(func(*args))
+                else:
+                    raise UslError(f'"{func}" is not a function')
+            elif op == TAIL_CALL_METHOD:
+                if arg:
+                    args = stack[-arg:]
+                    del stack[-arg:]
+                else:
+                    args = []
+                receiver = pop()
+                func = pop()
+                if receiver is None:
+                    if not callable(func):
+                        raise UslError(f'"{func}" is not a function')
+                    push(func(*args))
+                elif type(func) is VMFunction:
+                    if len(args) != len(func.params) - 1:
+                        raise UslError(f'Method "{func.name}" expected {len(func.params) - 1} arguments, got {len(args)}')
+                    code = func.code
+                    instructions = code.instructions
+                    consts = code.consts
+                    names = code.names
+                    env = func.make_frame((receiver, *args))
+                    stack = []
+                    push = stack.append
+                    pop = stack.pop
+                    pc = 0
+                else:
+                    push(call_method(receiver, func, args))
+            else:
+                raise UslError(f'Unknown opcode {op}')
+    except Exception as e:
+        # pc already points past the failing instruction
+        raise locate(e, code.line_of(pc - 1))